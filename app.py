@@ -1,156 +1,182 @@
+import io
 import os
-from dotenv import load_dotenv
-
-# Load environment variables FIRST
-load_dotenv()
-
-import re
-import random
+import csv
 import json
 import time
+import base64
+import hmac
+import atexit
 import logging
-from datetime import timedelta
-from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from flask_mail import Mail, Message
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import concurrent.futures
+from functools import wraps, partial
+from flask import Flask, current_app, render_template, send_file, request, redirect, url_for, flash, session, jsonify, make_response
+from flask_mail import Mail, Message, email_dispatched
 import smtplib
+from config import get_config
+from user_store import open_user_store
+from shared_state import create_shared_state
+from rate_limiter import SlidingWindowRateLimiter
+from mail_queue import MailQueue
+from smtp_pool import SMTPConnectionPool
+from asset_index import StaticAssetIndex
+from render_cache import RenderCache
+from asset_pipeline import DIST_DIR, build_assets, load_manifest, init_asset_pipeline
+from log_config import configure_logging
+from server_session import ServerSideSessionInterface
+from otp_store import create_otp_store, MSG_MISSING, MSG_EXPIRED, MSG_EXHAUSTED
+from metrics import init_metrics, span
+import tokengenerator
+from validation import validate_user_input, validate_password, canonical_identity
+import user_io
 
-app = Flask(__name__)
-
-# ------------------ LOGGING SETUP ------------------
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# ------------------ SECURE CONFIG ------------------
-app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-CHANGE-IN-PRODUCTION-' + str(random.randint(1000, 9999)))
-
-# Session Configuration
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-
-# Flask-Mail Config with detailed debugging
-MAIL_USERNAME = os.environ.get('MAIL_USERNAME', '')
-MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD', '')
-
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USE_SSL'] = False
-app.config['MAIL_USERNAME'] = MAIL_USERNAME
-app.config['MAIL_PASSWORD'] = MAIL_PASSWORD
-app.config['MAIL_DEFAULT_SENDER'] = MAIL_USERNAME
-app.config['MAIL_DEBUG'] = True
-app.config['MAIL_MAX_EMAILS'] = None
-app.config['MAIL_ASCII_ATTACHMENTS'] = False
-
-try:
-    mail = Mail(app)
-    logger.info("✓ Flask-Mail initialized successfully")
-except Exception as e:
-    logger.error(f"✗ Flask-Mail initialization failed: {e}")
+mail = Mail()
 
 # ------------------ CONSTANTS ------------------
-USERS_FILE = 'users.json'
 OTP_EXPIRY_SECONDS = 600
 OTP_LENGTH = 6
 MAX_OTP_ATTEMPTS = 3
-
-rate_limit_storage = {}
+LOCAL_MAIL_SERVERS = ('localhost', '127.0.0.1', '::1')
 
 
-# ------------------ VALIDATION HELPERS ------------------
-def validate_email(email):
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+# ------------------ RATE LIMITING ------------------
+@span('check_rate_limit')
+def check_rate_limit(key, max_attempts=5, window=3600):
+    allowed, retry_after = get_services().rate_limiter.hit(key, max_attempts, window)
+    if not allowed:
+        return False, "Too many attempts. Please try again later."
+    return True, "OK"
 
 
-def validate_phone(phone):
-    pattern = r'^\+?1?\d{10,15}$'
-    cleaned = re.sub(r'[\s\-\(\)]', '', phone)
-    return bool(re.match(pattern, cleaned))
+def rate_limit(scope, max_attempts=5, window=3600, json_response=False):
+    """Limit a view to ``max_attempts`` per ``window`` seconds per client IP"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            can_proceed, message = check_rate_limit(f"{scope}_{request.remote_addr}",
+                                                    max_attempts=max_attempts, window=window)
+            if not can_proceed:
+                if json_response or wants_json():
+                    return jsonify({'success': False, 'code': 'rate_limited', 'message': message}), 429
+                flash(message, "error")
+                return redirect(url_for("index"))
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+# ------------------ RESPONSES ------------------
+# HTTP status per auth error code; anything not listed is a 400
+AUTH_ERROR_STATUS = {
+    'invalid_credentials': 401,
+    'session_expired': 401,
+    'otp_invalid': 401,
+    'otp_expired': 401,
+    'otp_attempts_exceeded': 403,
+    'user_not_found': 404,
+    'user_exists': 409,
+    'rate_limited': 429,
+    'otp_delivery_failed': 503,
+    'busy': 503,
+}
+# Seconds a client is asked to wait when the password hashing pool is backed up
+BUSY_RETRY_AFTER = 5
+OTP_ERROR_CODES = {
+    MSG_MISSING: 'session_expired',
+    MSG_EXPIRED: 'otp_expired',
+    MSG_EXHAUSTED: 'otp_attempts_exceeded',
+}
+
+
+def wants_json():
+    """The /api/ routes always answer JSON; the form routes do when the client prefers it to HTML"""
+    if request.path.startswith('/api/'):
+        return True
+    return request.accept_mimetypes.best_match(('text/html', 'application/json')) == 'application/json'
+
+
+def form_value(name, default=''):
+    """A field from a JSON body (API clients) or the submitted form"""
+    data = request.get_json(silent=True) if request.is_json else None
+    value = (data if isinstance(data, dict) else request.form).get(name)
+    return default if value is None else str(value)
+
+
+def auth_success(code, message, category="success", **data):
+    """Flash and go back to the page, or answer JSON without the redirect round-trip"""
+    if wants_json():
+        return jsonify({'success': True, 'code': code, 'message': message, **data})
+    flash(message, category)
+    return redirect(url_for("index"))
 
 
-def validate_password(password):
-    if len(password) < 8:
-        return False, "Password must be at least 8 characters long"
-    if not re.search(r'[A-Z]', password):
-        return False, "Password must contain at least one uppercase letter"
-    if not re.search(r'[a-z]', password):
-        return False, "Password must contain at least one lowercase letter"
-    if not re.search(r'\d', password):
-        return False, "Password must contain at least one digit"
-    if not re.search(r'[\W_]', password):
-        return False, "Password must contain at least one special character"
-    return True, "Valid password"
+def auth_error(code, message, category="error", **data):
+    if wants_json():
+        return jsonify({'success': False, 'code': code, 'message': message, **data}), \
+            AUTH_ERROR_STATUS.get(code, 400)
+    flash(message, category)
+    return redirect(url_for("index"))
 
 
-def validate_user_input(email_mobile):
-    email_mobile = email_mobile.strip()
-    if '@' in email_mobile:
-        if validate_email(email_mobile):
-            return 'email', email_mobile
-        return None, "Invalid email format"
-    else:
-        if validate_phone(email_mobile):
-            return 'phone', email_mobile
-        return None, "Invalid phone number format"
+def busy_response():
+    """The password hash pool didn't answer in time; ask the client to come back instead of failing"""
+    response = make_response(auth_error('busy', "⏳ We're busy right now. Please try again in a few seconds.",
+                                        "warning"))
+    response.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return response
 
 
-# ------------------ RATE LIMITING ------------------
-def check_rate_limit(key, max_attempts=5, window=3600):
-    current_time = time.time()
-    if key not in rate_limit_storage:
-        rate_limit_storage[key] = []
+# ------------------ DATABASE FUNCTIONS ------------------
+@span('load_users')
+def load_users(config):
+    try:
+        return open_user_store(config['USER_STORE_BACKEND'], config['USERS_DB'], config['USERS_FILE'],
+                               write_behind=config['USER_WRITE_BEHIND'],
+                               flush_interval_ms=config['USER_FLUSH_INTERVAL_MS'],
+                               max_batch=config['USER_FLUSH_BATCH'],
+                               redis_url=config['REDIS_URL'],
+                               canonical=partial(canonical_identity, country_code=config['PHONE_COUNTRY_CODE']))
+    except Exception as e:
+        logger.error(f"Error opening user store: {e}")
+        raise
 
-    rate_limit_storage[key] = [
-        timestamp for timestamp in rate_limit_storage[key]
-        if current_time - timestamp < window
-    ]
 
-    if len(rate_limit_storage[key]) >= max_attempts:
-        return False, f"Too many attempts. Please try again later."
+@span('save_user')
+def save_user(identity, record):
+    try:
+        get_services().users.put(identity, record)
+    except Exception as e:
+        logger.error(f"Error saving user {identity}: {e}")
+        raise
 
-    rate_limit_storage[key].append(current_time)
-    return True, "OK"
 
+def touch_last_login(identity, user):
+    """last_login is not critical, so it goes through the write-behind journal when enabled.
 
-# ------------------ DATABASE FUNCTIONS ------------------
-def load_users():
-    try:
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
-    except json.JSONDecodeError:
-        logger.error("Corrupted users.json file")
-    except Exception as e:
-        logger.error(f"Error loading users: {e}")
-    return {}
+    Only that column is written, never the whole (possibly stale) record.
+    """
+    users = get_services().users
+    user['last_login'] = now = time.time()
+    if hasattr(users, 'touch_deferred'):
+        users.touch_deferred(identity, now)
+    else:
+        users.touch_many([(identity, now)])
 
 
+@span('save_users')
 def save_users(users_dict):
     try:
-        temp_file = f"{USERS_FILE}.tmp"
-        with open(temp_file, 'w') as f:
-            json.dump(users_dict, f, indent=2)
-        os.replace(temp_file, USERS_FILE)
+        get_services().users.put_many(users_dict.items())
         logger.info("Users data saved successfully")
     except Exception as e:
         logger.error(f"Error saving users: {e}")
         raise
 
 
-users = load_users()
-
-
 # ------------------ AUTHENTICATION DECORATOR ------------------
 def login_required(f):
     @wraps(f)
@@ -163,66 +189,101 @@ def login_required(f):
     return decorated_function
 
 
+def admin_required(f):
+    """Bearer ADMIN_TOKEN; the admin routes don't exist (404) until one is configured"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config['ADMIN_TOKEN']
+        if not token:
+            return jsonify({'error': 'Not found'}), 404
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
 # ------------------ HELPER FUNCTIONS ------------------
+@span('resolve_image_path')
 def resolve_image_path(rel_path):
-    static_root = app.static_folder
-    if not static_root:
-        return 'images/placeholder.jpg'
-
-    cand_paths = [rel_path]
-    dirname = os.path.dirname(rel_path)
-    filename = os.path.basename(rel_path)
-    name_no_ext, ext = os.path.splitext(filename)
-
-    tries = [
-        filename, filename.lower(),
-        filename.replace(" ", "_"),
-        filename.replace(" ", "_").lower(),
-        name_no_ext.replace(" ", "_") + ext,
-        name_no_ext.replace(" ", "_").lower() + ext,
-        name_no_ext.title() + ext,
-    ]
-
-    for t in tries:
-        cand_paths.append(os.path.join(dirname, t))
-    for t in tries:
-        cand_paths.append(t)
-
-    seen, final_cands = set(), []
-    for p in cand_paths:
-        if p not in seen:
-            final_cands.append(p)
-            seen.add(p)
-
-    for p in final_cands:
-        full = os.path.join(static_root, p)
-        if os.path.exists(full):
-            return p
-    return 'images/placeholder.jpg'
+    return get_services().asset_index.resolve(rel_path)
 
 
 # ------------------ OTP FUNCTIONS ------------------
 def generate_otp():
-    return ''.join([str(random.randint(0, 9)) for _ in range(OTP_LENGTH)])
-
-
+    return tokengenerator.generate_otp(OTP_LENGTH)
+
+
+def log_smtp_auth_failure(e):
+    mail_username = current_app.config['MAIL_USERNAME']
+    logger.error("=" * 60)
+    logger.error("✗ SMTP AUTHENTICATION FAILED!")
+    logger.error("=" * 60)
+    logger.error(f"Error details: {str(e)}")
+    logger.error("")
+    logger.error("TROUBLESHOOTING STEPS:")
+    logger.error("1. Make sure you're using a Gmail App Password, NOT your regular password")
+    logger.error("2. Enable 2-Step Verification: https://myaccount.google.com/security")
+    logger.error("3. Generate App Password: https://myaccount.google.com/apppasswords")
+    logger.error("4. Copy the 16-character password (remove spaces)")
+    logger.error("5. Add it to your .env file as MAIL_PASSWORD=yourapppassword")
+    logger.error("")
+    logger.error(f"Current MAIL_USERNAME: {mail_username}")
+    logger.error(f"Password configured: {'Yes' if current_app.config['MAIL_PASSWORD'] else 'No'}")
+    logger.error("=" * 60)
+
+
+def deliver_mail(app, msg):
+    """Runs on a mail worker thread; raising hands the message back to the queue for retry"""
+    with app.app_context():
+        try:
+            mail.send(msg)
+        except smtplib.SMTPAuthenticationError as e:
+            log_smtp_auth_failure(e)
+            raise
+        except smtplib.SMTPRecipientsRefused as e:
+            logger.error(f"✗ Invalid recipient email: {', '.join(msg.recipients)}")
+            logger.error(f"Error: {str(e)}")
+            raise
+
+
+def deliver_mail_batch(app, smtp_pool, messages):
+    """Send several queued messages over one pooled SMTP session"""
+    with app.app_context():
+        try:
+            errors = smtp_pool.send_many(messages)
+        except smtplib.SMTPAuthenticationError as e:
+            log_smtp_auth_failure(e)
+            raise
+
+    for msg, error in zip(messages, errors):
+        if error is None:
+            email_dispatched.send(app, message=msg)
+        elif isinstance(error, smtplib.SMTPRecipientsRefused):
+            logger.error(f"✗ Invalid recipient email: {', '.join(msg.recipients)}")
+            logger.error(f"Error: {str(error)}")
+    return errors
+
+
+@span('send_otp_email')
 def send_otp_email(recipient, otp, purpose="authentication"):
-    """Send OTP via email with comprehensive error handling"""
+    """Queue an OTP email; returns (success, message, mail_id) without waiting on SMTP"""
     try:
-        # Validate email config
-        if not MAIL_USERNAME or MAIL_USERNAME == 'youremail@gmail.com':
-            logger.error("✗ MAIL_USERNAME not configured in .env file")
-            logger.error("Please create a .env file with your Gmail address")
-            return False, "Email not configured. Using development OTP."
-
-        if not MAIL_PASSWORD or MAIL_PASSWORD == 'yourapppassword':
-            logger.error("✗ MAIL_PASSWORD not configured in .env file")
-            logger.error("Please create a Gmail App Password and add it to .env")
-            return False, "Email password not configured. Using development OTP."
+        # Validate email config (a local SMTP stand-in needs no credentials)
+        config = current_app.config
+        if config['MAIL_SERVER'] not in LOCAL_MAIL_SERVERS:
+            if not config['MAIL_USERNAME'] or config['MAIL_USERNAME'] == 'youremail@gmail.com':
+                logger.error("✗ MAIL_USERNAME not configured in .env file")
+                logger.error("Please create a .env file with your Gmail address")
+                return False, "Email not configured. Using development OTP.", None
+
+            if not config['MAIL_PASSWORD'] or config['MAIL_PASSWORD'] == 'yourapppassword':
+                logger.error("✗ MAIL_PASSWORD not configured in .env file")
+                logger.error("Please create a Gmail App Password and add it to .env")
+                return False, "Email password not configured. Using development OTP.", None
 
         logger.info(f"📧 Preparing to send OTP to: {recipient}")
-        logger.info(f"📤 Using sender: {MAIL_USERNAME}")
-        logger.info(f"🔑 Password length: {len(MAIL_PASSWORD)} characters")
 
         subject = "Cardwala - Your OTP Code"
         if purpose == "login":
@@ -230,6 +291,8 @@ def send_otp_email(recipient, otp, purpose="authentication"):
         elif purpose == "signup":
             subject = "Cardwala - Signup OTP"
 
+        # First use sets up Flask-Mail, which Message needs for its default sender
+        mail_queue = get_services().mail_queue
         msg = Message(
             subject=subject,
             recipients=[recipient],
@@ -246,128 +309,323 @@ Best regards,
 Cardwala Team"""
         )
 
-        logger.info("📨 Sending email via SMTP...")
-        mail.send(msg)
-        logger.info(f"✅ SUCCESS! OTP email sent to {recipient}")
-        return True, "OTP sent to your email"
-
-    except smtplib.SMTPAuthenticationError as e:
-        logger.error("=" * 60)
-        logger.error("✗ SMTP AUTHENTICATION FAILED!")
-        logger.error("=" * 60)
-        logger.error(f"Error details: {str(e)}")
-        logger.error("")
-        logger.error("TROUBLESHOOTING STEPS:")
-        logger.error("1. Make sure you're using a Gmail App Password, NOT your regular password")
-        logger.error("2. Enable 2-Step Verification: https://myaccount.google.com/security")
-        logger.error("3. Generate App Password: https://myaccount.google.com/apppasswords")
-        logger.error("4. Copy the 16-character password (remove spaces)")
-        logger.error("5. Add it to your .env file as MAIL_PASSWORD=yourapppassword")
-        logger.error("")
-        logger.error(f"Current MAIL_USERNAME: {MAIL_USERNAME}")
-        logger.error(f"Password configured: {'Yes' if MAIL_PASSWORD else 'No'}")
-        logger.error("=" * 60)
-        return False, "Email authentication failed"
-
-    except smtplib.SMTPRecipientsRefused as e:
-        logger.error(f"✗ Invalid recipient email: {recipient}")
-        logger.error(f"Error: {str(e)}")
-        return False, "Invalid email address"
-
-    except smtplib.SMTPException as e:
-        logger.error(f"✗ SMTP Error: {str(e)}")
-        return False, "Failed to send email"
+        mail_id = mail_queue.enqueue(msg)
+        logger.info(f"📨 OTP email {mail_id} queued for {recipient}")
+        return True, "OTP sent to your email", mail_id
 
     except Exception as e:
         logger.error(f"✗ Unexpected error: {str(e)}")
         logger.exception(e)
-        return False, "Email service error"
+        return False, "Email service error", None
 
 
-def verify_otp_attempt(entered_otp):
-    stored_otp = session.get('otp')
-    otp_expiry = session.get('otp_expiry')
-    attempts = session.get('otp_attempts', 0)
+def otp_purpose():
+    return "signup" if session.get('signup_mode') else "login"
 
-    if not stored_otp or not otp_expiry:
+
+def issue_otp(identity, purpose):
+    otp = generate_otp()
+    get_services().otp_store.issue(identity, purpose, otp, OTP_EXPIRY_SECONDS)
+    return otp
+
+
+def verify_otp_attempt(entered_otp):
+    email_mobile = session.get('email_mobile')
+    if not email_mobile:
         return False, "Session expired. Please try again."
 
-    if time.time() > otp_expiry:
-        session.pop('otp', None)
-        session.pop('otp_expiry', None)
-        return False, "OTP expired. Please request a new one."
-
-    if attempts >= MAX_OTP_ATTEMPTS:
-        session.pop('otp', None)
-        session.pop('otp_expiry', None)
-        return False, "Maximum OTP attempts exceeded. Please request a new one."
-
-    if entered_otp != stored_otp:
-        session['otp_attempts'] = attempts + 1
-        remaining = MAX_OTP_ATTEMPTS - session['otp_attempts']
-        return False, f"Invalid OTP. {remaining} attempt(s) remaining."
-
-    return True, "OTP verified successfully"
-
-
-# ------------------ DATA ------------------
-religions = [
-    {"name": "Hinduism", "image": "images/Religion/Hinduism.jpg"},
-    {"name": "Christianity", "image": "images/Religion/christianity.jpg"},
-    {"name": "Islam", "image": "images/Religion/Islam.jpg"},
-    {"name": "Buddhism", "image": "images/Religion/buddhism.jpg"},
-    {"name": "Judaism", "image": "images/Religion/Judaism.jpg"},
-    {"name": "Sikhism", "image": "images/Religion/Sikhism.png"},
-    {"name": "Taoism", "image": "images/Religion/Taoism_Chinese_Traditions.jpg"},
-    {"name": "Zoroastrianism", "image": "images/Religion/Zoroastrianism.jpg"},
-]
-
-ceremonies = [
-    {"name": "Vivah (Wedding)", "image": "images/Ceremony/Vivah_Wedding.jpg"},
-    {"name": "Christian Wedding", "image": "images/Ceremony/Wedding_Christian.jpg"},
-    {"name": "Engagement", "image": "images/Ceremony/Engagement.jpg"},
-    {"name": "Namkaran", "image": "images/Ceremony/Namkaran.jpg"},
-    {"name": "Baptism", "image": "images/Ceremony/Baptism.jpg"},
-    {"name": "Confirmation", "image": "images/Ceremony/Confirmation.jpg"},
-    {"name": "Annaprashan", "image": "images/Ceremony/annaprashan.jpg"},
-    {"name": "Mundan", "image": "images/Ceremony/Mundan.jpg"},
-    {"name": "Upanayana", "image": "images/Ceremony/Upanayana.jpg"},
-    {"name": "Grihapravesh", "image": "images/Ceremony/Grihapravesh.jpg"},
-    {"name": "Shraddha", "image": "images/Ceremony/Shraddha.jpg"},
-]
+    success, message, finished = get_services().otp_store.verify(email_mobile, otp_purpose(), entered_otp)
+    if finished:
+        session.pop('otp_sent', None)
+    return success, message
+
+
+def clear_otp_session():
+    email_mobile = session.get('email_mobile')
+    if email_mobile:
+        get_services().otp_store.discard(email_mobile, otp_purpose())
+    for key in ['signup_mode', 'email_mobile', 'otp_sent', 'mail_id']:
+        session.pop(key, None)
+
+
+# ------------------ CATALOG ------------------
+def resolved_catalog():
+    """Religion and ceremony dicts for templates, with image paths resolved, plus their version.
+
+    Rebuilt only when the catalog file or the static tree changes.
+    """
+    services = get_services()
+    catalog = services.catalog.current()
+    version = f"{catalog.version}-{services.asset_index.check()}"
+    view = services.catalog_view
+    if view is None or view[0] != version:
+        data = catalog.to_dict()
+        for item in data['religions'] + data['ceremonies']:
+            item['image'] = resolve_image_path(item['image'])
+        # One tuple, swapped in whole, so concurrent requests never see half a rebuild
+        view = services.catalog_view = (version, data['religions'], data['ceremonies'])
+    return view[1], view[2], version
+
+
+# ------------------ SERVICES ------------------
+class lazy:
+    """Like functools.cached_property, but built under a lock so concurrent first requests share one instance"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.name = fn.__name__
+        self.__doc__ = fn.__doc__
+        self.lock = threading.RLock()
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        with self.lock:
+            if self.name not in obj.__dict__:
+                obj.__dict__[self.name] = self.fn(obj)
+        return obj.__dict__[self.name]
+
+
+class Services:
+    """Everything a worker needs besides Flask itself, built once per app by create_app.
+
+    Only what every request touches (shared state, sessions, rate limits) is
+    opened here. The rest is built on first use, so importing the app and
+    spawning a worker stay fast, or ahead of time by ``preload``: under
+    gunicorn --preload that runs in the master, so the user store, asset
+    index, resolved catalog and decoded card images are shared
+    copy-on-write. Connections and background threads are opened lazily in
+    (or reopened for) each worker process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = config = app.config
+        self.closed = False
+
+        # Shared by every worker process, so limits hold no matter how many workers run
+        self.shared_state = create_shared_state(config['SHARED_STATE_URL'],
+                                                max_keys=config['SHARED_STATE_MAX_KEYS'])
+        self.rate_limiter = SlidingWindowRateLimiter(self.shared_state)
+
+        # Session data stays server-side; the cookie only carries a signed, opaque id
+        if config['SESSION_STORE_URL'] == config['SHARED_STATE_URL']:
+            self.session_state = self.shared_state
+        else:
+            self.session_state = create_shared_state(config['SESSION_STORE_URL'],
+                                                     max_keys=config['SHARED_STATE_MAX_KEYS'])
+        app.session_interface = ServerSideSessionInterface(self.session_state)
+
+        self.catalog_view = None
+        self.page_cache = RenderCache(max_entries=config['PAGE_CACHE_SIZE'])
+
+    def loaded(self, name):
+        return name in self.__dict__
+
+    @lazy
+    def otp_store(self):
+        # Outstanding OTPs are kept (hashed) in their own store, never in the session
+        store = create_otp_store(self.config['OTP_STORE_URL'], self.config['OTP_HASH_SECRET'],
+                                 max_attempts=MAX_OTP_ATTEMPTS)
+        store.start_sweeper()
+        return store
+
+    @lazy
+    def captcha(self):
+        # Rendered by a background thread in each worker; only the answer's HMAC is stored
+        import captcha
+        if captcha.Image is None:
+            logger.warning("Pillow not installed; captchas fall back to plain text")
+        return captcha.CaptchaPool(self.shared_state, self.config['OTP_HASH_SECRET'],
+                                   size=self.config['CAPTCHA_POOL_SIZE'],
+                                   ttl=self.config['CAPTCHA_TTL_SECONDS'],
+                                   length=self.config['CAPTCHA_LENGTH'])
+
+    @lazy
+    def users(self):
+        return load_users(self.config)
+
+    @lazy
+    def password_hasher(self):
+        # Calibrated once (shared through shared_state), hashed in a process pool
+        from password_hasher import PasswordHasher
+        hasher = PasswordHasher(
+            method=self.config['PASSWORD_HASH_METHOD'],
+            target_ms=self.config['PASSWORD_HASH_TARGET_MS'],
+            work_factor=self.config['PASSWORD_HASH_WORK_FACTOR'],
+            workers=self.config['PASSWORD_HASH_WORKERS'],
+            max_pending=self.config['PASSWORD_HASH_MAX_PENDING'],
+            state=self.shared_state,
+        )
+        hasher.calibrate()
+        return hasher
+
+    @lazy
+    def catalog(self):
+        from catalog import CatalogStore
+        return CatalogStore(self.config['CATALOG_FILE'], check_interval=self.config['CATALOG_CHECK_SECONDS'])
+
+    @lazy
+    def asset_index(self):
+        return StaticAssetIndex(self.app.static_folder, exclude_dirs=(DIST_DIR,))
+
+    @lazy
+    def card_renderer(self):
+        import card_renderer
+        if card_renderer.Image is None:
+            logger.warning("Pillow not installed; card rendering is disabled")
+            return None
+        return card_renderer.CardRenderer(
+            self.app.static_folder,
+            cache_dir=self.config['CARD_CACHE_DIR'],
+            memory_entries=self.config['CARD_MEMORY_CACHE_SIZE'],
+            disk_max_bytes=self.config['CARD_CACHE_MAX_MB'] * 1024 * 1024,
+        )
+
+    @lazy
+    def card_jobs(self):
+        # Bulk jobs render on their own process pool, started with the first job
+        if self.card_renderer is None:
+            return None
+        from card_jobs import BulkCardJobs
+        return BulkCardJobs(self.app.static_folder, self.shared_state,
+                            output_dir=self.config['CARD_JOB_DIR'],
+                            workers=self.config['CARD_JOB_WORKERS'] or None)
+
+    @lazy
+    def smtp_pool(self):
+        config = self.config
+        return SMTPConnectionPool(
+            config['MAIL_SERVER'],
+            config['MAIL_PORT'],
+            username=config['MAIL_USERNAME'],
+            password=config['MAIL_PASSWORD'],
+            use_tls=config['MAIL_USE_TLS'],
+            use_ssl=config['MAIL_USE_SSL'],
+            max_size=config['MAIL_POOL_SIZE'],
+            debug=config['MAIL_DEBUG'],
+        )
+
+    @lazy
+    def mail_queue(self):
+        # Flask-Mail is set up with the first message rather than at startup
+        app, config = self.app, self.config
+        try:
+            mail.init_app(app)
+            logger.info("✓ Flask-Mail initialized successfully")
+        except Exception as e:
+            logger.error(f"✗ Flask-Mail initialization failed: {e}")
+        use_mail_pool = config['MAIL_USE_POOL'] and not config.get('MAIL_SUPPRESS_SEND', app.testing)
+        return MailQueue(
+            partial(deliver_mail, app),
+            deliver_batch=partial(deliver_mail_batch, app, self.smtp_pool) if use_mail_pool else None,
+            batch_size=config['MAIL_BATCH_SIZE'],
+            workers=config['MAIL_WORKERS'],
+            max_retries=config['MAIL_MAX_RETRIES'],
+            backoff_base=config['MAIL_BACKOFF_SECONDS'],
+            permanent_errors=(smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused),
+            state=self.shared_state,
+        )
+
+    def preload(self):
+        """Build the lazy services now, e.g. in the gunicorn master before it forks workers"""
+        started = time.perf_counter()
+        self.users
+        self.password_hasher
+        self.otp_store
+        self.captcha
+        with self.app.app_context():
+            resolved_catalog()
+        if self.card_renderer is not None and self.config['CARD_PRELOAD_IMAGES']:
+            # Decoded here so forked workers share the pixels
+            catalog = self.catalog.current()
+            self.card_renderer.preload(self.asset_index.resolve(item.image)
+                                       for item in catalog.religions + catalog.ceremonies)
+        self.card_jobs
+        logger.info(f"Services preloaded in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def close(self):
+        """Drain the mail queue and write-behind journal, then release connections"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.loaded('mail_queue'):
+            self.mail_queue.stop()
+        if self.loaded('card_jobs') and self.card_jobs is not None:
+            self.card_jobs.close()
+        if self.loaded('users'):
+            self.users.close()
+        if self.loaded('password_hasher'):
+            self.password_hasher.close()
+        if self.loaded('smtp_pool'):
+            self.smtp_pool.close()
+        if self.loaded('otp_store'):
+            self.otp_store.close()
+        if self.session_state is not self.shared_state:
+            self.session_state.close()
+        self.shared_state.close()
+
+
+def get_services(app=None):
+    return (app or current_app).extensions['cardwala']
 
 
 # ------------------ ROUTES ------------------
 
-@app.route("/")
 def index():
-    rels = [{**r, "image": resolve_image_path(r["image"])} for r in religions]
-    cers = [{**c, "image": resolve_image_path(c["image"])} for c in ceremonies]
+    rels, cers, catalog_version = resolved_catalog()
 
     show_otp = session.get('otp_sent', False)
     signup_mode = session.get('signup_mode', False)
     email_mobile = session.get('email_mobile', '')
 
-    return render_template("index.html",
-                           religions=rels,
-                           ceremonies=cers,
-                           show_otp=show_otp,
-                           signup_mode=signup_mode,
-                           email_mobile=email_mobile)
-
-
-@app.route("/generate-captcha/<captcha_type>")
+    # Pending flash messages are shown once, so that render can't be reused
+    if '_flashes' in session:
+        return render_template("index.html",
+                               religions=rels,
+                               ceremonies=cers,
+                               show_otp=show_otp,
+                               signup_mode=signup_mode,
+                               email_mobile=email_mobile)
+
+    services = get_services()
+    cache_key = (show_otp, signup_mode, email_mobile,
+                 session.get('logged_in', False), session.get('user'),
+                 catalog_version)
+    cached = services.page_cache.get(cache_key)
+    if cached is None:
+        cached = services.page_cache.put(cache_key, render_template("index.html",
+                                                           religions=rels,
+                                                           ceremonies=cers,
+                                                           show_otp=show_otp,
+                                                           signup_mode=signup_mode,
+                                                           email_mobile=email_mobile))
+    body, etag = cached
+
+    response = make_response(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+@rate_limit("captcha", max_attempts=60, window=600, json_response=True)
 def generate_captcha_api(captcha_type):
     if captcha_type not in ['signup', 'login']:
         return jsonify({'error': 'Invalid captcha type'}), 400
 
-    captcha_code = str(random.randint(10000, 99999))
-    session[f"captcha_{captcha_type}"] = captcha_code
-    logger.info(f"Generated captcha for {captcha_type}: {captcha_code}")
-    return jsonify({'captcha': captcha_code})
+    # The session only learns the captcha id; the answer never leaves the server
+    captcha_id, image, text = get_services().captcha.issue(captcha_type)
+    session[f"captcha_{captcha_type}"] = captcha_id
+    logger.debug(f"Issued {captcha_type} captcha {captcha_id}")
+    if image is None:
+        return jsonify({'captcha_id': captcha_id, 'captcha': text})
+    image_url = 'data:image/png;base64,' + base64.b64encode(image).decode('ascii')
+    response = jsonify({'captcha_id': captcha_id, 'image': image_url})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
-@app.route("/create-card", methods=["POST"])
 def create_card():
     religion = request.form.get("religion")
     ceremony = request.form.get("ceremony")
@@ -376,288 +634,473 @@ def create_card():
         flash("Please select both religion and ceremony!", "error")
         return redirect(url_for("index"))
 
+    valid, message = get_services().catalog.current().check_selection(religion, ceremony)
+    if not valid:
+        flash(message, "error")
+        return redirect(url_for("index"))
+
     session['selected_religion'] = religion
     session['selected_ceremony'] = ceremony
     flash(f"Creating card for {religion} - {ceremony}", "success")
     return redirect(url_for("customize_card"))
 
 
-@app.route("/customize-card")
 @login_required
 def customize_card():
     religion = session.get('selected_religion', 'Not selected')
     ceremony = session.get('selected_ceremony', 'Not selected')
-    return render_template("customize_card.html", religion=religion, ceremony=ceremony)
+    preview_url = url_for("card_image", fmt="png") if get_services().card_renderer else None
+    return render_template("customize_card.html", religion=religion, ceremony=ceremony,
+                           preview_url=preview_url)
 
 
-@app.route("/signup", methods=["POST"])
-def signup():
-    email_mobile = request.form.get("email_mobile", "").strip()
-    captcha = request.form.get("captcha", "").strip()
-    stored_captcha = session.get("captcha_signup", "")
+def card_background(background):
+    """Catalog image for the selected ceremony (or religion) in the session"""
+    catalog = get_services().catalog.current()
+    if background == 'religion':
+        entry = catalog.religion(session.get('selected_religion'))
+    else:
+        entry = catalog.ceremony(session.get('selected_ceremony'))
+    return resolve_image_path(entry.image) if entry else None
 
-    rate_key = f"signup_{request.remote_addr}"
-    can_proceed, message = check_rate_limit(rate_key, max_attempts=5, window=3600)
-    if not can_proceed:
-        flash(message, "error")
-        return redirect(url_for("index"))
 
-    if captcha != stored_captcha:
-        logger.warning(f"Signup captcha failed for {email_mobile}")
-        flash("Captcha incorrect!", "error")
-        return redirect(url_for("index"))
+@login_required
+@rate_limit("card_image", max_attempts=300, window=600, json_response=True)
+def card_image(fmt):
+    # Imported here, not at the top, so Pillow stays out of worker startup
+    import card_renderer
+    renderer = get_services().card_renderer
+    if renderer is None:
+        return jsonify({'error': 'Card rendering is not available'}), 503
+    if fmt not in card_renderer.FORMATS:
+        return jsonify({'error': 'Unsupported format'}), 404
+
+    template = card_background(request.args.get('background', 'ceremony'))
+    if template is None:
+        return jsonify({'error': 'Select a religion and ceremony first'}), 400
+
+    fields = {name: request.args.get(name, '') for name in card_renderer.TEXT_FIELDS}
+    if not fields['title']:
+        fields['title'] = session.get('selected_ceremony', '')
+    try:
+        with span('render_card'):
+            data, key = renderer.render(template, fields, size=request.args.get('size', 'preview'), fmt=fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = make_response(data)
+    response.mimetype = card_renderer.FORMATS[fmt]
+    response.set_etag(key)
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    if request.args.get('download'):
+        response.headers['Content-Disposition'] = f'attachment; filename="cardwala-card.{fmt}"'
+    return response.make_conditional(request)
+
+
+@login_required
+@rate_limit("bulk_cards", max_attempts=20, window=3600, json_response=True)
+def bulk_cards():
+    """Queue one card per guest in an uploaded CSV/JSONL; returns a job id to poll"""
+    import card_renderer
+    from card_jobs import parse_guest_file
+    jobs = get_services().card_jobs
+    if jobs is None:
+        return jsonify({'success': False, 'message': 'Card rendering is not available'}), 503
+
+    template = card_background(request.form.get('background', 'ceremony'))
+    if template is None:
+        return jsonify({'success': False, 'message': 'Select a religion and ceremony first'}), 400
+
+    upload = request.files.get('guests')
+    if upload is None:
+        return jsonify({'success': False, 'message': 'Upload a CSV or JSONL file as "guests"'}), 400
+    size = request.form.get('size', 'print')
+    fmt = request.form.get('format', 'png')
+    if size not in card_renderer.SIZES or fmt not in card_renderer.FORMATS:
+        return jsonify({'success': False, 'message': 'Unsupported size or format'}), 400
+
+    try:
+        records = parse_guest_file(upload.read(), upload.filename or '',
+                                   max_records=current_app.config['CARD_JOB_MAX_RECORDS'])
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'message': f"Could not read guest file: {e}"}), 400
+
+    fields = {name: request.form.get(name, '') for name in card_renderer.TEXT_FIELDS}
+    if not fields['title']:
+        fields['title'] = session.get('selected_ceremony', '')
+    job_id = jobs.submit(template, fields, records, size=size, fmt=fmt, owner=session.get('user'))
+    return jsonify({'success': True, 'job_id': job_id, 'total': len(records),
+                    'status_url': url_for('bulk_card_status', job_id=job_id)}), 202
+
+
+def own_card_job(job_id):
+    jobs = get_services().card_jobs
+    status = jobs.status(job_id) if jobs else None
+    if status is None or status.get('owner') != session.get('user'):
+        return None
+    return status
 
-    session.pop("captcha_signup", None)
 
-    input_type, validated_input = validate_user_input(email_mobile)
+@login_required
+def bulk_card_status(job_id):
+    status = own_card_job(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if status['status'] == 'done':
+        status['download_url'] = url_for('bulk_card_download', job_id=job_id)
+    return jsonify(status)
+
+
+@login_required
+def bulk_card_download(job_id):
+    status = own_card_job(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    path = get_services().card_jobs.zip_path(job_id)
+    if status['status'] != 'done' or not os.path.exists(path):
+        return jsonify({'error': 'Job not finished', 'status': status['status']}), 409
+    return send_file(os.path.abspath(path), mimetype='application/zip', as_attachment=True,
+                     download_name=f"cardwala-cards-{job_id[:8]}.zip")
+
+
+@rate_limit("signup", max_attempts=5, window=3600)
+def signup():
+    email_mobile = form_value("email_mobile").strip()
+    answer = form_value("captcha")
+
+    # Checked (and used up) before any other work, so a missing or wrong answer costs nothing
+    if not get_services().captcha.verify(session.pop("captcha_signup", None), "signup", answer):
+        logger.warning(f"Signup captcha failed for {email_mobile}")
+        return auth_error('captcha_invalid', "Captcha incorrect!")
+
+    input_type, validated_input = validate_user_input(email_mobile, current_app.config['PHONE_COUNTRY_CODE'])
     if not input_type:
-        flash(validated_input, "error")
-        return redirect(url_for("index"))
+        return auth_error('invalid_identity', validated_input)
 
-    if validated_input in users:
-        flash("User already exists! Please login.", "error")
-        return redirect(url_for("index"))
+    if validated_input in get_services().users:
+        return auth_error('user_exists', "User already exists! Please login.")
 
-    otp = generate_otp()
-    session['otp'] = otp
-    session['otp_expiry'] = time.time() + OTP_EXPIRY_SECONDS
-    session['otp_attempts'] = 0
+    if input_type != 'email':
+        return auth_error('phone_not_supported', "Phone signup coming soon. Please use email.", "info")
+
+    otp = issue_otp(validated_input, "signup")
     session['email_mobile'] = validated_input
     session['signup_mode'] = True
     session['otp_sent'] = True
 
-    logger.info("=" * 60)
-    logger.info("📝 SIGNUP OTP GENERATED")
-    logger.info("=" * 60)
-    logger.info(f"📧 Email: {validated_input}")
-    logger.info(f"🔑 OTP: {otp}")
-    logger.info(f"⏰ Expires: {OTP_EXPIRY_SECONDS // 60} minutes")
-    logger.info("=" * 60)
+    logger.info(f"📝 SIGNUP OTP GENERATED for {validated_input}",
+                extra={'event': 'otp_generated', 'purpose': 'signup', 'identity': validated_input})
+    logger.debug(f"🔑 OTP: {otp} (expires in {OTP_EXPIRY_SECONDS // 60} minutes)")
+    return otp_sent_response(validated_input, otp, "signup")
 
-    if input_type == 'email':
-        success, msg = send_otp_email(validated_input, otp, purpose="signup")
-        if success:
-            flash(f"✅ OTP sent to {validated_input}. Please check your email.", "success")
-        else:
-            flash(f"⚠️ Could not send email. Your OTP is: {otp}", "warning")
-            logger.warning(f"🔓 DEVELOPMENT OTP: {otp}")
-    else:
-        flash("Phone signup coming soon. Please use email.", "info")
-        session.pop('otp_sent', None)
-        return redirect(url_for("index"))
 
-    return redirect(url_for("index"))
+def show_undelivered_otp():
+    # Development only: without a mail server the code could not be recovered any other way
+    return current_app.debug or current_app.testing
 
 
-@app.route("/login", methods=["POST"])
+def otp_sent_response(identity, otp, purpose):
+    success, msg, mail_id = send_otp_email(identity, otp, purpose=purpose)
+    if success:
+        session['mail_id'] = mail_id
+        return auth_success('otp_sent', f"✅ OTP sent to {identity}. Please check your email.",
+                            identity=identity, mail_id=mail_id, expires_in=OTP_EXPIRY_SECONDS)
+    if show_undelivered_otp():
+        logger.warning(f"🔓 DEVELOPMENT OTP: {otp}")
+        return auth_success('otp_not_delivered', f"⚠️ Could not send email. Your OTP is: {otp}", "warning",
+                            identity=identity, expires_in=OTP_EXPIRY_SECONDS)
+    return auth_error('otp_delivery_failed', "⚠️ Could not send the OTP email. Please try resending it.",
+                      "warning", identity=identity)
+
+
+@rate_limit("login", max_attempts=10, window=3600)
 def login():
-    login_type = request.form.get("login_type")
-    email_mobile = request.form.get("email_mobile", "").strip()
-    captcha = request.form.get("captcha", "").strip()
-    stored_captcha = session.get('captcha_login', "")
-
-    rate_key = f"login_{request.remote_addr}"
-    can_proceed, message = check_rate_limit(rate_key, max_attempts=10, window=3600)
-    if not can_proceed:
-        flash(message, "error")
-        return redirect(url_for("index"))
+    login_type = form_value("login_type")
+    email_mobile = form_value("email_mobile").strip()
+    answer = form_value("captcha")
 
-    if captcha != stored_captcha:
+    if not get_services().captcha.verify(session.pop('captcha_login', None), "login", answer):
         logger.warning(f"Login captcha failed for {email_mobile}")
-        flash("Captcha incorrect!", "error")
-        return redirect(url_for("index"))
-
-    session.pop('captcha_login', None)
+        return auth_error('captcha_invalid', "Captcha incorrect!")
 
-    input_type, validated_input = validate_user_input(email_mobile)
+    input_type, validated_input = validate_user_input(email_mobile, current_app.config['PHONE_COUNTRY_CODE'])
     if not input_type:
-        flash(validated_input, "error")
-        return redirect(url_for("index"))
+        return auth_error('invalid_identity', validated_input)
 
+    users = get_services().users
     if validated_input not in users:
-        flash("User not found! Please signup first.", "error")
-        return redirect(url_for("index"))
+        return auth_error('user_not_found', "User not found! Please signup first.")
 
     if login_type == "otp":
-        otp = generate_otp()
-        session['otp'] = otp
-        session['otp_expiry'] = time.time() + OTP_EXPIRY_SECONDS
-        session['otp_attempts'] = 0
+        if input_type != 'email':
+            return auth_error('phone_not_supported', "Phone login coming soon. Please use email.", "info")
+
+        otp = issue_otp(validated_input, "login")
         session['email_mobile'] = validated_input
         session['signup_mode'] = False
         session['otp_sent'] = True
 
-        logger.info("=" * 60)
-        logger.info("🔐 LOGIN OTP GENERATED")
-        logger.info("=" * 60)
-        logger.info(f"📧 Email: {validated_input}")
-        logger.info(f"🔑 OTP: {otp}")
-        logger.info(f"⏰ Expires: {OTP_EXPIRY_SECONDS // 60} minutes")
-        logger.info("=" * 60)
-
-        if input_type == 'email':
-            success, msg = send_otp_email(validated_input, otp, purpose="login")
-            if success:
-                flash(f"✅ OTP sent to {validated_input}. Please check your email.", "success")
-            else:
-                flash(f"⚠️ Could not send email. Your OTP is: {otp}", "warning")
-                logger.warning(f"🔓 DEVELOPMENT OTP: {otp}")
-        else:
-            flash("Phone login coming soon. Please use email.", "info")
-            session.pop('otp_sent', None)
-            return redirect(url_for("index"))
-
-        return redirect(url_for("index"))
+        logger.info(f"🔐 LOGIN OTP GENERATED for {validated_input}",
+                    extra={'event': 'otp_generated', 'purpose': 'login', 'identity': validated_input})
+        logger.debug(f"🔑 OTP: {otp} (expires in {OTP_EXPIRY_SECONDS // 60} minutes)")
+        return otp_sent_response(validated_input, otp, "login")
 
-    else:  # Password login
-        password = request.form.get("password", "")
+    # Password login
+    password = form_value("password")
+    if not password:
+        return auth_error('password_required', "Please enter your password")
 
-        if not password:
-            flash("Please enter your password", "error")
-            return redirect(url_for("index"))
+    user = users[validated_input]
+    if 'password' not in user:
+        return auth_error('password_not_set', "Password not set. Please use OTP login.")
 
-        if 'password' not in users[validated_input]:
-            flash("Password not set. Please use OTP login.", "error")
-            return redirect(url_for("index"))
-
-        if check_password_hash(users[validated_input]['password'], password):
-            session.permanent = True
-            session['logged_in'] = True
-            session['user'] = validated_input
+    hasher = get_services().password_hasher
+    try:
+        with span('check_password_hash'):
+            password_ok = hasher.verify(user['password'], password)
+    except concurrent.futures.TimeoutError:
+        logger.warning(f"⏳ Password check timed out for {validated_input}")
+        return busy_response()
+
+    if not password_ok:
+        logger.warning(f"❌ Failed login attempt for {validated_input}")
+        return auth_error('invalid_credentials', "Incorrect password!")
+
+    if hasher.needs_rehash(user['password']):
+        try:
+            with span('generate_password_hash'):
+                user['password'] = hasher.hash(password)
+            save_user(validated_input, user)
+            logger.info(f"🔐 Upgraded password hash for {validated_input}")
+        except concurrent.futures.TimeoutError:
+            # The old hash still works; the upgrade is retried on the next login
+            logger.warning(f"⏳ Password hash upgrade timed out for {validated_input}")
+
+    session.regenerate()
+    session.permanent = True
+    session['logged_in'] = True
+    session['user'] = validated_input
 
-            users[validated_input]['last_login'] = time.time()
-            save_users(users)
+    touch_last_login(validated_input, user)
 
-            logger.info(f"✅ User {validated_input} logged in successfully")
-            flash("Logged in successfully!", "success")
-            return redirect(url_for("index"))
-        else:
-            logger.warning(f"❌ Failed login attempt for {validated_input}")
-            flash("Incorrect password!", "error")
-            return redirect(url_for("index"))
+    logger.info(f"✅ User {validated_input} logged in successfully")
+    return auth_success('logged_in', "Logged in successfully!", user=validated_input)
 
 
-@app.route("/verify-otp", methods=["POST"])
 def verify_otp():
-    entered_otp = request.form.get("otp", "").strip()
+    entered_otp = form_value("otp").strip()
     email_mobile = session.get("email_mobile")
 
     if not email_mobile:
-        flash("Session expired. Please try again.", "error")
         session.pop('otp_sent', None)
-        return redirect(url_for("index"))
+        return auth_error('session_expired', "Session expired. Please try again.")
 
     success, message = verify_otp_attempt(entered_otp)
 
     if not success:
-        flash(message, "error")
-        if "expired" in message.lower() or "exceeded" in message.lower():
-            session.pop('otp_sent', None)
-        return redirect(url_for("index"))
+        return auth_error(OTP_ERROR_CODES.get(message, 'otp_invalid'), message)
 
     if session.get('signup_mode'):
-        password = request.form.get("password", "")
-        confirm_password = request.form.get("confirm_password", "")
+        password = form_value("password")
+        confirm_password = form_value("confirm_password")
 
         if not password or not confirm_password:
-            flash("Please enter both password fields", "error")
-            return redirect(url_for("index"))
+            return auth_error('password_required', "Please enter both password fields")
 
         if password != confirm_password:
-            flash("Passwords don't match!", "error")
-            return redirect(url_for("index"))
+            return auth_error('password_mismatch', "Passwords don't match!")
 
         is_valid, msg = validate_password(password)
         if not is_valid:
-            flash(msg, "error")
-            return redirect(url_for("index"))
-
-        users[email_mobile] = {
-            "password": generate_password_hash(password),
+            return auth_error('weak_password', msg)
+
+        try:
+            with span('generate_password_hash'):
+                password_hash = get_services().password_hasher.hash(password)
+        except concurrent.futures.TimeoutError:
+            # The OTP is only used up once the account exists, so the same code works on retry
+            logger.warning(f"⏳ Password hashing timed out for new user {email_mobile}")
+            return busy_response()
+        save_user(email_mobile, {
+            "password": password_hash,
             "created_at": time.time(),
             "last_login": time.time()
-        }
-        save_users(users)
+        })
         logger.info(f"✅ New user created: {email_mobile}")
-        flash("🎉 Account created successfully! Welcome to Cardwala!", "success")
+        code, message = 'account_created', "🎉 Account created successfully! Welcome to Cardwala!"
     else:
-        users[email_mobile]['last_login'] = time.time()
-        save_users(users)
+        touch_last_login(email_mobile, get_services().users[email_mobile])
         logger.info(f"✅ User logged in: {email_mobile}")
-        flash("✅ Logged in successfully!", "success")
+        code, message = 'logged_in', "✅ Logged in successfully!"
 
+    clear_otp_session()
+    session.regenerate()
     session.permanent = True
     session['logged_in'] = True
     session['user'] = email_mobile
 
-    for key in ['otp', 'otp_expiry', 'otp_attempts', 'signup_mode', 'email_mobile', 'otp_sent']:
-        session.pop(key, None)
-
-    return redirect(url_for("index"))
+    return auth_success(code, message, user=email_mobile)
 
 
-@app.route("/resend-otp", methods=["POST"])
+@rate_limit("resend", max_attempts=5, window=3600, json_response=True)
 def resend_otp():
     email_mobile = session.get('email_mobile')
     signup_mode = session.get('signup_mode', False)
 
     if not email_mobile:
-        return jsonify({'success': False, 'message': 'Session expired'}), 400
+        return jsonify({'success': False, 'code': 'session_expired', 'message': 'Session expired'}), \
+            AUTH_ERROR_STATUS['session_expired']
 
-    otp = generate_otp()
-    session['otp'] = otp
-    session['otp_expiry'] = time.time() + OTP_EXPIRY_SECONDS
-    session['otp_attempts'] = 0
+    purpose = "signup" if signup_mode else "login"
+    otp = issue_otp(email_mobile, purpose)
 
-    logger.info(f"🔄 RESEND OTP: {otp} to {email_mobile}")
+    logger.info(f"🔄 RESEND OTP to {email_mobile}",
+                extra={'event': 'otp_resent', 'identity': email_mobile})
+    logger.debug(f"🔑 OTP: {otp}")
 
-    purpose = "signup" if signup_mode else "login"
-    success, msg = send_otp_email(email_mobile, otp, purpose=purpose)
+    success, msg, mail_id = send_otp_email(email_mobile, otp, purpose=purpose)
 
     if success:
-        return jsonify({'success': True, 'message': 'OTP resent successfully'})
-    else:
-        return jsonify({'success': True, 'message': f'Development OTP: {otp}'})
+        session['mail_id'] = mail_id
+        return jsonify({'success': True, 'code': 'otp_sent', 'message': 'OTP resent successfully',
+                        'mail_id': mail_id, 'expires_in': OTP_EXPIRY_SECONDS})
+    if show_undelivered_otp():
+        logger.warning(f"🔓 DEVELOPMENT OTP: {otp}")
+        return jsonify({'success': True, 'code': 'otp_not_delivered', 'message': f'Development OTP: {otp}',
+                        'expires_in': OTP_EXPIRY_SECONDS})
+    return jsonify({'success': False, 'code': 'otp_delivery_failed',
+                    'message': 'Could not send the OTP email. Please try again.'}), \
+        AUTH_ERROR_STATUS['otp_delivery_failed']
 
 
-@app.route("/cancel-otp", methods=["POST"])
 def cancel_otp():
-    for key in ['otp', 'otp_expiry', 'otp_attempts', 'signup_mode', 'email_mobile', 'otp_sent']:
-        session.pop(key, None)
-    return jsonify({'success': True})
+    clear_otp_session()
+    return jsonify({'success': True, 'code': 'otp_cancelled'})
+
+
+def mail_status(mail_id):
+    status = get_services().mail_queue.status(mail_id)
+    if status is None:
+        return jsonify({'error': 'Unknown message'}), 404
+    return jsonify(status)
+
+
+@admin_required
+def mail_stats():
+    services = get_services()
+    return jsonify({
+        'pending': services.mail_queue.pending(),
+        'dead_letters': len(services.mail_queue.dead_letters),
+        'pool': services.smtp_pool.stats(),
+    })
+
+
+# ------------------ ADMIN: USERS ------------------
+def admin_user_filters():
+    """Query filters from the request args; raises ValueError on a bad date"""
+    domain = request.args.get('domain', '').strip().lower() or None
+    return {
+        'created_from': user_io.parse_time(request.args.get('created_from')),
+        'created_to': user_io.parse_time(request.args.get('created_to')),
+        'inactive_since': user_io.parse_time(request.args.get('inactive_since')),
+        'domain': domain,
+    }
+
+
+@admin_required
+def admin_users():
+    try:
+        filters = admin_user_filters()
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        after = request.args.get('after')
+        after = tuple(json.loads(base64.urlsafe_b64decode(after + '=' * (-len(after) % 4)))) if after else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid query parameters', 'code': 'invalid_query'}), 400
+
+    with span('admin_user_query'):
+        rows, cursor = user_io.query_page(get_services().users, limit=limit, after=after, **filters)
+    return jsonify({
+        'users': [user_io.export_row(identity, record) for identity, record in rows],
+        'next': base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii').rstrip('=')
+        if cursor else None,
+    })
+
+
+@admin_required
+def admin_import_users():
+    # Partner lists outgrow the app-wide upload cap; rows stream into the store, so a higher limit is safe
+    request.max_content_length = current_app.config['USER_IMPORT_MAX_MB'] * 1024 * 1024
+    upload = request.files.get('users')
+    try:
+        fmt = user_io.detect_format(upload.filename if upload else '', request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'code': 'invalid_format'}), 400
+    # Multipart uploads are spooled to disk by werkzeug; either way rows are read as a stream
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        stats = user_io.import_users(get_services().users, user_io.read_records(stream, fmt),
+                                     country_code=current_app.config['PHONE_COUNTRY_CODE'],
+                                     batch_size=current_app.config['USER_IMPORT_BATCH'],
+                                     update=request.args.get('update') == '1')
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Batches before the bad bytes are already committed; re-running the import skips them
+        code = 'invalid_encoding' if isinstance(e, UnicodeDecodeError) else 'invalid_csv'
+        return jsonify({'error': f"Could not read the file: {e}", 'code': code}), 400
+    return jsonify(stats)
+
+
+@admin_required
+def admin_export_users():
+    try:
+        fmt = user_io.detect_format(explicit=request.args.get('format', 'jsonl'))
+        filters = admin_user_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'code': 'invalid_query'}), 400
+    chunks = user_io.export_users(get_services().users, fmt, **filters)
+    response = current_app.response_class(chunks, mimetype=user_io.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="cardwala-users.{fmt}"'
+    return response
 
 
-@app.route("/logout")
 def logout():
     user = session.get('user')
     session.clear()
     logger.info(f"👋 User {user} logged out")
-    flash("Logged out successfully!", "success")
-    return redirect(url_for("index"))
+    return auth_success('logged_out', "Logged out successfully!")
+
+
+def auth_status():
+    """Who is logged in and whether an OTP is waiting, for clients that keep their own UI state"""
+    return jsonify({
+        'logged_in': bool(session.get('logged_in')),
+        'user': session.get('user'),
+        'otp_pending': bool(session.get('otp_sent')),
+        'signup_mode': bool(session.get('signup_mode')),
+    })
 
 
-@app.route("/test-mail")
 def test_mail():
+    config = current_app.config
+    mail_username = config['MAIL_USERNAME']
+    mail_password = config['MAIL_PASSWORD']
     try:
-        test_recipient = MAIL_USERNAME if MAIL_USERNAME and '@' in MAIL_USERNAME else "test@example.com"
+        test_recipient = mail_username if mail_username and '@' in mail_username else "test@example.com"
         otp = generate_otp()
 
-        logger.info("=" * 60)
-        logger.info("📧 TESTING EMAIL CONFIGURATION")
-        logger.info("=" * 60)
-        logger.info(f"From: {MAIL_USERNAME}")
-        logger.info(f"To: {test_recipient}")
-        logger.info(f"Test OTP: {otp}")
-        logger.info(f"Mail Server: {app.config['MAIL_SERVER']}:{app.config['MAIL_PORT']}")
-        logger.info("=" * 60)
+        logger.info(f"📧 TESTING EMAIL CONFIGURATION: {mail_username} -> {test_recipient} "
+                    f"via {config['MAIL_SERVER']}:{config['MAIL_PORT']}")
+        logger.debug(f"Test OTP: {otp}")
 
-        success, message = send_otp_email(test_recipient, otp, purpose="test")
+        success, message, mail_id = send_otp_email(test_recipient, otp, purpose="test")
 
         if success:
             return f"""
-            <h1 style='color: green;'>✅ Success!</h1>
-            <p>Test email sent to: <strong>{test_recipient}</strong></p>
+            <h1 style='color: green;'>✅ Queued!</h1>
+            <p>Test email queued for: <strong>{test_recipient}</strong></p>
             <p>OTP: <strong>{otp}</strong></p>
+            <p>Delivery status: <a href='/mail-status/{mail_id}'>/mail-status/{mail_id}</a></p>
             <p>Check your email inbox!</p>
             <hr>
             <a href='/'>Go Back</a>
@@ -670,8 +1113,8 @@ def test_mail():
             <hr>
             <h3>Check Configuration:</h3>
             <ul>
-                <li>MAIL_USERNAME: {MAIL_USERNAME or 'NOT SET'}</li>
-                <li>MAIL_PASSWORD: {'SET (' + str(len(MAIL_PASSWORD)) + ' chars)' if MAIL_PASSWORD else 'NOT SET'}</li>
+                <li>MAIL_USERNAME: {mail_username or 'NOT SET'}</li>
+                <li>MAIL_PASSWORD: {'SET (' + str(len(mail_password)) + ' chars)' if mail_password else 'NOT SET'}</li>
             </ul>
             <p>Check app.log for detailed errors</p>
             <hr>
@@ -690,37 +1133,149 @@ def test_mail():
         """, 500
 
 
-@app.errorhandler(404)
 def not_found(e):
+    if wants_json():
+        return jsonify({'success': False, 'code': 'not_found', 'message': "Not found"}), 404
     flash("Page not found", "error")
     return redirect(url_for("index"))
 
 
-@app.errorhandler(500)
+def too_large(e):
+    # Only the upload endpoints take bodies this big, and they all answer JSON
+    return jsonify({'success': False, 'code': 'too_large', 'message': "Upload is too large"}), 413
+
+
 def server_error(e):
     logger.error(f"Server error: {e}")
+    if wants_json():
+        return jsonify({'success': False, 'code': 'server_error', 'message': "An internal error occurred"}), 500
     flash("An internal error occurred", "error")
     return redirect(url_for("index"))
 
 
+def register_routes(app):
+    app.add_url_rule("/", view_func=index)
+    app.add_url_rule("/generate-captcha/<captcha_type>", view_func=generate_captcha_api)
+    app.add_url_rule("/create-card", view_func=create_card, methods=["POST"])
+    app.add_url_rule("/customize-card", view_func=customize_card)
+    app.add_url_rule("/card.<fmt>", view_func=card_image)
+    app.add_url_rule("/bulk-cards", view_func=bulk_cards, methods=["POST"])
+    app.add_url_rule("/bulk-cards/<job_id>", view_func=bulk_card_status)
+    app.add_url_rule("/bulk-cards/<job_id>/download", view_func=bulk_card_download)
+    app.add_url_rule("/signup", view_func=signup, methods=["POST"])
+    app.add_url_rule("/login", view_func=login, methods=["POST"])
+    app.add_url_rule("/verify-otp", view_func=verify_otp, methods=["POST"])
+    app.add_url_rule("/resend-otp", view_func=resend_otp, methods=["POST"])
+    app.add_url_rule("/cancel-otp", view_func=cancel_otp, methods=["POST"])
+    app.add_url_rule("/mail-status/<mail_id>", view_func=mail_status)
+    app.add_url_rule("/mail-stats", view_func=mail_stats)
+    app.add_url_rule("/admin/users", view_func=admin_users)
+    app.add_url_rule("/admin/users/import", view_func=admin_import_users, methods=["POST"])
+    app.add_url_rule("/admin/users/export", view_func=admin_export_users)
+    app.add_url_rule("/logout", view_func=logout)
+
+    # JSON API for the same flows: no redirects, errors carry a machine-readable code
+    app.add_url_rule("/api/v1/auth/captcha/<captcha_type>", endpoint="api_captcha", view_func=generate_captcha_api)
+    app.add_url_rule("/api/v1/auth/signup", endpoint="api_signup", view_func=signup, methods=["POST"])
+    app.add_url_rule("/api/v1/auth/login", endpoint="api_login", view_func=login, methods=["POST"])
+    app.add_url_rule("/api/v1/auth/verify-otp", endpoint="api_verify_otp", view_func=verify_otp, methods=["POST"])
+    app.add_url_rule("/api/v1/auth/resend-otp", endpoint="api_resend_otp", view_func=resend_otp, methods=["POST"])
+    app.add_url_rule("/api/v1/auth/cancel-otp", endpoint="api_cancel_otp", view_func=cancel_otp, methods=["POST"])
+    app.add_url_rule("/api/v1/auth/logout", endpoint="api_logout", view_func=logout, methods=["POST"])
+    app.add_url_rule("/api/v1/auth/session", endpoint="api_session", view_func=auth_status)
+    app.add_url_rule("/test-mail", view_func=test_mail)
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(413, too_large)
+    app.register_error_handler(500, server_error)
+
+
+# ------------------ APP FACTORY ------------------
+def create_app(config=None):
+    """Build the app. ``config`` is an APP_ENV name, a Config instance or a dict of overrides."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    overrides = config if isinstance(config, dict) else {}
+    if config is None or isinstance(config, (str, dict)):
+        config = get_config(overrides.get('APP_ENV') if overrides else config)
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config.update(overrides)
+
+    if app.config['PROXY_FIX_X_FOR']:
+        # remote_addr (and so every rate-limit key) becomes the client address the proxy saw
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    configure_logging(
+        env=app.config['APP_ENV'],
+        log_file=app.config['LOG_FILE'],
+        level=app.config['LOG_LEVEL'],
+        json_logs=app.config['LOG_JSON'],
+        max_bytes=app.config['LOG_MAX_BYTES'],
+        backup_count=app.config['LOG_BACKUP_COUNT'],
+        rotate_when=app.config['LOG_ROTATE_WHEN'],
+    )
+
+    services = Services(app)
+    app.extensions['cardwala'] = services
+    atexit.register(services.close)
+    register_routes(app)
+
+    if app.config['BUILD_ASSETS_ON_STARTUP'] and os.path.isdir(app.static_folder):
+        asset_manifest = build_assets(app.static_folder)
+    else:
+        asset_manifest = load_manifest(app.static_folder)
+    init_asset_pipeline(app, asset_manifest)
+
+    if app.config['METRICS_ENABLED']:
+        registry = init_metrics(app,
+                                profile_every=app.config['PROFILE_EVERY'],
+                                profile_slow_ms=app.config['PROFILE_SLOW_MS'],
+                                profile_dir=app.config['PROFILE_DIR'],
+                                slow_request_ms=app.config['SLOW_REQUEST_MS'],
+                                # Latencies and queue sizes are for the operator, not the public
+                                view_decorator=admin_required)
+        # Scrapes must not build services nobody has used yet
+        registry.gauge('cardwala_mail_queue_pending', 'Messages waiting in the mail queue.',
+                       lambda: services.mail_queue.pending() if services.loaded('mail_queue') else 0)
+        registry.gauge('cardwala_mail_dead_letters', 'Messages that could not be delivered.',
+                       lambda: len(services.mail_queue.dead_letters) if services.loaded('mail_queue') else 0)
+        registry.gauge('cardwala_page_cache_hits', 'Rendered page cache hits.',
+                       lambda: services.page_cache.hits)
+        registry.gauge('cardwala_page_cache_misses', 'Rendered page cache misses.',
+                       lambda: services.page_cache.misses)
+        registry.gauge('cardwala_card_cache_hits', 'Rendered card cache hits.',
+                       lambda: services.card_renderer.hits if services.loaded('card_renderer') else 0)
+        registry.gauge('cardwala_card_cache_misses', 'Cards rendered from scratch.',
+                       lambda: services.card_renderer.misses if services.loaded('card_renderer') else 0)
+        registry.gauge('cardwala_captcha_pool_ready', 'Pre-rendered captchas waiting to be served.',
+                       lambda: services.captcha.ready() if services.loaded('captcha') else 0)
+        registry.gauge('cardwala_captcha_inline_renders', 'Captchas rendered on the request path (pool empty).',
+                       lambda: services.captcha.inline_renders if services.loaded('captcha') else 0)
+
+    return app
+
+
 if __name__ == "__main__":
-    if not os.path.exists(USERS_FILE):
-        save_users({})
-        logger.info("Created users.json file")
+    app = create_app()
+    mail_username = app.config['MAIL_USERNAME']
+    mail_password = app.config['MAIL_PASSWORD']
 
     logger.info("=" * 60)
     logger.info("🚀 CARDWALA SERVER STARTING")
     logger.info("=" * 60)
-    logger.info(f"📧 MAIL_USERNAME: {MAIL_USERNAME or '❌ NOT SET'}")
-    logger.info(f"🔑 MAIL_PASSWORD: {'✅ SET (' + str(len(MAIL_PASSWORD)) + ' chars)' if MAIL_PASSWORD else '❌ NOT SET'}")
+    logger.info(f"📧 MAIL_USERNAME: {mail_username or '❌ NOT SET'}")
+    logger.info(f"🔑 MAIL_PASSWORD: {'✅ SET (' + str(len(mail_password)) + ' chars)' if mail_password else '❌ NOT SET'}")
     logger.info(f"📬 MAIL_SERVER: {app.config['MAIL_SERVER']}:{app.config['MAIL_PORT']}")
     logger.info("=" * 60)
 
-    if not MAIL_USERNAME or not MAIL_PASSWORD:
+    if not mail_username or not mail_password:
         logger.warning("⚠️  EMAIL NOT CONFIGURED!")
         logger.warning("⚠️  Create a .env file with:")
         logger.warning("⚠️  MAIL_USERNAME=your-email@gmail.com")
         logger.warning("⚠️  MAIL_PASSWORD=your-app-password")
         logger.warning("⚠️  OTP will be shown in console/logs")
 
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production runs wsgi:app under gunicorn (see gunicorn.conf.py)
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5000)
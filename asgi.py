@@ -0,0 +1,17 @@
+"""Optional ASGI entry point: uvicorn asgi:app (needs pip install asgiref uvicorn).
+
+The Flask views stay synchronous and run in asgiref's thread pool; mail
+delivery already happens off the request path on the mail queue workers.
+"""
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    raise RuntimeError("The asgiref package is required for the ASGI entry point (pip install asgiref)")
+
+import os
+
+from app import create_app
+
+# Production unless APP_ENV says otherwise, as in wsgi.py
+flask_app = create_app(os.environ.get('APP_ENV', 'production'))
+app = application = WsgiToAsgi(flask_app)
@@ -0,0 +1,85 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+
+from list_tree import iter_static_files
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_name(filename):
+    """Fold case and spaces/underscores so 'Vivah Wedding.JPG' and 'vivah_wedding.jpg' match."""
+    name, ext = os.path.splitext(filename)
+    return name.replace(' ', '_').lower() + ext.lower()
+
+
+class StaticAssetIndex:
+    """In-memory index of the files under a static folder.
+
+    Built with one directory walk; resolving a path is then a couple of dict
+    lookups instead of a stat per candidate name. Directory mtimes are
+    re-checked at most every ``check_interval`` seconds and the index is
+    rebuilt when files are added, removed or renamed.
+    """
+
+    def __init__(self, static_root, check_interval=5.0, exclude_dirs=()):
+        self.static_root = static_root
+        self.exclude_dirs = set(exclude_dirs)
+        self.check_interval = check_interval
+        self.version = None
+        self._files = frozenset()
+        self._by_name = {}
+        self._dir_mtimes = {}
+        self._next_check = 0
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        files, by_name, dir_mtimes = set(), {}, {}
+        if self.static_root and os.path.isdir(self.static_root):
+            for rel in iter_static_files(self.static_root, self.exclude_dirs, dir_mtimes=dir_mtimes):
+                rel_dir, _, filename = rel.rpartition('/')
+                files.add(rel)
+                by_name.setdefault((rel_dir, normalize_name(filename)), rel)
+
+        digest = hashlib.sha1('\n'.join(sorted(files)).encode('utf-8')).hexdigest()[:12]
+        with self._lock:
+            self._files = frozenset(files)
+            self._by_name = by_name
+            self._dir_mtimes = dir_mtimes
+            self._next_check = time.time() + self.check_interval
+            self.version = digest
+        logger.debug(f"Indexed {len(files)} static files (version {digest})")
+
+    def _stale(self):
+        for path, mtime in self._dir_mtimes.items():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return not self._dir_mtimes and bool(self.static_root) and os.path.isdir(self.static_root)
+
+    def check(self):
+        """Rebuild if the static tree changed since the last check. Returns the current version."""
+        now = time.time()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            if self._stale():
+                self.rebuild()
+        return self.version
+
+    def exists(self, rel_path):
+        return rel_path in self._files
+
+    def resolve(self, rel_path, default='images/placeholder.jpg'):
+        self.check()
+        rel_path = rel_path.replace(os.sep, '/')
+        if rel_path in self._files:
+            return rel_path
+
+        dirname, filename = os.path.split(rel_path)
+        key = normalize_name(filename)
+        return self._by_name.get((dirname, key)) or self._by_name.get(('', key)) or default
@@ -0,0 +1,185 @@
+import os
+import io
+import sys
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+
+from flask import request, send_from_directory, url_for
+
+from list_tree import iter_static_files
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+TEXT_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.xml', '.map'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+THUMBNAIL_WIDTH = 480
+WEBP_QUALITY = 80
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE_MAX_AGE = 31536000
+
+
+# ------------------ BUILD ------------------
+def _fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _pillow():
+    # Only builds need Pillow; importing it up front would add ~20ms to every worker's startup
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _webp_variants(Image, data, name_hashed):
+    """Full-size and thumbnail WebP encodings of a catalog image"""
+    variants = {}
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        buf = io.BytesIO()
+        img.save(buf, 'WEBP', quality=WEBP_QUALITY, method=6)
+        variants['webp'] = (f"{name_hashed}.webp", buf.getvalue())
+
+        if img.width > THUMBNAIL_WIDTH:
+            img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4))
+        buf = io.BytesIO()
+        img.save(buf, 'WEBP', quality=WEBP_QUALITY, method=6)
+        variants['thumb'] = (f"{name_hashed}.thumb.webp", buf.getvalue())
+    return variants
+
+
+def build_assets(static_root):
+    """Fingerprint every static file into static/dist and write the manifest.
+
+    Text assets also get .gz (and .br when brotli is installed) siblings;
+    JPEG/PNG images get WebP and thumbnail variants when Pillow is installed.
+    Files whose fingerprinted copy already exists are skipped.
+    """
+    dist_root = os.path.join(static_root, DIST_DIR)
+    Image = _pillow()
+    previous = load_manifest(static_root)
+    manifest = {}
+
+    for rel in iter_static_files(static_root, exclude_dirs=(DIST_DIR,)):
+        with open(os.path.join(static_root, rel), 'rb') as f:
+            data = f.read()
+        digest = _fingerprint(data)
+        base, ext = os.path.splitext(rel)
+        name_hashed = f"{base}.{digest}"
+        entry = {'file': f"{name_hashed}{ext}", 'hash': digest, 'encodings': [], 'variants': {}}
+
+        old = previous.get(rel)
+        if old and old.get('hash') == digest and os.path.exists(os.path.join(dist_root, old['file'])):
+            manifest[rel] = old
+            continue
+
+        _write(os.path.join(dist_root, entry['file']), data)
+
+        if ext.lower() in TEXT_EXTENSIONS and len(data) >= MIN_COMPRESS_BYTES:
+            _write(os.path.join(dist_root, entry['file'] + '.gz'), gzip.compress(data, 9, mtime=0))
+            entry['encodings'].append('gzip')
+            if brotli is not None:
+                _write(os.path.join(dist_root, entry['file'] + '.br'), brotli.compress(data, quality=11))
+                entry['encodings'].append('br')
+
+        if ext.lower() in IMAGE_EXTENSIONS and Image is not None:
+            try:
+                for variant, (name, payload) in _webp_variants(Image, data, name_hashed).items():
+                    _write(os.path.join(dist_root, name), payload)
+                    entry['variants'][variant] = name
+            except Exception as e:
+                logger.warning(f"Could not build image variants for {rel}: {e}")
+
+        manifest[rel] = entry
+
+    _write(os.path.join(dist_root, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    logger.info(f"Asset pipeline built {len(manifest)} asset(s) into {dist_root}")
+    return manifest
+
+
+def load_manifest(static_root):
+    path = os.path.join(static_root, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        logger.error(f"Corrupted asset manifest {path}")
+        return {}
+
+
+# ------------------ SERVING ------------------
+def init_asset_pipeline(app, manifest):
+    """Serve fingerprinted assets from /assets and make templates' url_for emit them."""
+    dist_root = os.path.join(app.static_folder, DIST_DIR)
+    by_file = {entry['file']: entry for entry in manifest.values()}
+
+    def serve_asset(filename):
+        entry = by_file.get(filename)
+        path, encoding, mimetype = filename, None, mimetypes.guess_type(filename)[0]
+
+        if entry:
+            accept = request.headers.get('Accept', '')
+            if 'webp' in entry['variants'] and 'image/webp' in accept:
+                path, mimetype = entry['variants']['webp'], 'image/webp'
+            else:
+                for enc, suffix in (('br', '.br'), ('gzip', '.gz')):
+                    if enc in entry['encodings'] and enc in request.accept_encodings:
+                        path, encoding = filename + suffix, enc
+                        break
+
+        response = send_from_directory(dist_root, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        response.headers.pop('Content-Disposition', None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.vary.add('Accept')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.add_url_rule('/assets/<path:filename>', 'fingerprinted_asset', serve_asset)
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]['file']
+            return url_for('fingerprinted_asset', **values)
+        return url_for(endpoint, **values)
+
+    def asset_variant(filename, variant):
+        entry = manifest.get(filename)
+        if entry and variant in entry['variants']:
+            return url_for('fingerprinted_asset', filename=entry['variants'][variant])
+        return asset_url_for('static', filename=filename)
+
+    app.jinja_env.globals['url_for'] = asset_url_for
+    app.jinja_env.globals['asset_variant'] = asset_variant
+
+
+if __name__ == "__main__":
+    from list_tree import base_dir
+
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "static")
+    logging.basicConfig(level=logging.INFO)
+    result = build_assets(root)
+    print(f"Built {len(result)} asset(s) into {os.path.join(root, DIST_DIR)}")
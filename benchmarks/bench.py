@@ -0,0 +1,532 @@
+"""Benchmark harness for the auth and catalog routes.
+
+Drives the real routes through the Flask test client and, with --http,
+over real HTTP against a local server. Mail goes to a local aiosmtpd sink
+when aiosmtpd is installed. The user store is seeded with each of --users
+before the run. Every scenario checks the status (and result ``code``) it
+expects, and anything else counts as an error. Reports p50/p95/p99 latency
+and requests per second, and with --compare fails (exit 1) when a metric
+regresses past the baseline or a scenario has more errors than it did.
+
+    python benchmarks/bench.py --users 10000,100000 --compare
+    python benchmarks/bench.py --users 10000 --http --update-baseline
+
+--startup adds cold-start timings from fresh interpreters (import, create_app,
+first request) and the time a worker forked from a preloaded master takes
+to answer its first request, checked against --startup-budget-ms.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import argparse
+import threading
+import http.client
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+from werkzeug.middleware.proxy_fix import ProxyFix  # noqa: E402
+
+import app as cardwala  # noqa: E402
+from user_store import SqliteUserStore  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+BENCH_OTP = '123456'
+BENCH_PASSWORD = 'Bench-pass1!'
+SEED_BATCH = 10000
+# Sub-millisecond timings jitter by more than any ratio; ignore slowdowns smaller than this
+MIN_REGRESSION_MS = 0.05
+# A route that answers 200 without templates or a logged-in session
+STARTUP_PATH = '/api/v1/auth/session'
+
+
+# ------------------ SEEDING ------------------
+def seed_identity(i):
+    return f"user{i}@bench.example"
+
+
+def seeded_db(count):
+    """Path to a user DB holding ``count`` seeded users; built once and reused across runs"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"users-{count}.db")
+    store = SqliteUserStore(path)
+    try:
+        if store.get_meta('bench_seeded') == str(count):
+            return path
+        started = time.perf_counter()
+        # One hash for every seeded user; hashing a million passwords would take hours
+        record = {'password': generate_password_hash(BENCH_PASSWORD), 'created_at': time.time()}
+        for start in range(0, count, SEED_BATCH):
+            store.put_many((seed_identity(i), record) for i in range(start, min(start + SEED_BATCH, count)))
+        store.set_meta('bench_seeded', str(count))
+        print(f"Seeded {count} users in {time.perf_counter() - started:.1f}s")
+    finally:
+        store.close()
+    return path
+
+
+def start_smtp_sink():
+    """Local SMTP stand-in; returns (controller, port) or (None, None) without aiosmtpd"""
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.handlers import Sink
+    except ImportError:
+        return None, None
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    controller = Controller(Sink(), hostname='127.0.0.1', port=port)
+    controller.start()
+    return controller, port
+
+
+def build_app(users_db, smtp_port):
+    overrides = {
+        'APP_ENV': 'testing',
+        'LOG_LEVEL': 'WARNING',
+        'USER_STORE_BACKEND': 'sqlite',
+        'USERS_DB': users_db,
+        'USERS_FILE': os.path.join(DATA_DIR, 'no-legacy-users.json'),
+        'USER_WRITE_BEHIND': True,
+        # Measure the error handlers like production would instead of raising into the harness
+        'PROPAGATE_EXCEPTIONS': False,
+        'CAPTCHA_POOL_SIZE': 600,
+    }
+    if smtp_port:
+        overrides.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_port, MAIL_USE_TLS=False,
+                         MAIL_USE_SSL=False, MAIL_SUPPRESS_SEND=False)
+    # OTPs are random and only ever emailed; a fixed code lets the flows verify
+    cardwala.generate_otp = lambda: BENCH_OTP
+    app = cardwala.create_app(overrides)
+    # Same for captchas: still issued (and consumed) per flow, but any answer to a live id passes
+    pool = cardwala.get_services(app).captcha
+    pool.verify = lambda captcha_id, scope, answer: bool(captcha_id)
+    pool.start()
+    deadline = time.time() + 60
+    while pool.ready() < pool.size and time.time() < deadline:
+        time.sleep(0.05)
+    return app
+
+
+# ------------------ CLIENTS ------------------
+# The form routes redirect to the index whether they worked or not; asking for JSON gets the result code
+HEADERS = {'Accept': 'application/json'}
+
+
+def client_ip(n):
+    # Every virtual user gets its own address so per-IP rate limits don't cut the run short
+    return f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+
+
+class TestClientDriver:
+    def __init__(self, app, n):
+        self.client = app.test_client()
+        self.ip = client_ip(n)
+
+    def get(self, path):
+        response = self.client.get(path, headers=HEADERS, environ_base={'REMOTE_ADDR': self.ip})
+        return response.status_code, response.get_data()
+
+    def post(self, path, data):
+        response = self.client.post(path, data=data, headers=HEADERS, environ_base={'REMOTE_ADDR': self.ip})
+        return response.status_code, response.get_data()
+
+
+class HttpDriver:
+    """Keep-alive HTTP client with its own cookie jar; redirects are not followed"""
+
+    def __init__(self, port, n):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.ip = client_ip(n)
+        self.cookies = {}
+
+    def _request(self, method, path, body=None):
+        headers = {'X-Forwarded-For': self.ip, **HEADERS}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response.status, data
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, data):
+        return self._request('POST', path, urlencode(data))
+
+
+class HttpServer:
+    def __init__(self, app):
+        # The benchmark's virtual users arrive via X-Forwarded-For
+        self.server = make_server('127.0.0.1', 0, ProxyFix(app.wsgi_app, x_for=1), threaded=True)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+# ------------------ SCENARIOS ------------------
+def timed(call, status=200, code=None):
+    """(seconds, error) for one request; error is None when it answered ``status`` (and ``code``)"""
+    started = time.perf_counter()
+    got, body = call()
+    elapsed = time.perf_counter() - started
+    if got != status:
+        return elapsed, f"status {got}"
+    if code is not None:
+        try:
+            got_code = json.loads(body).get('code')
+        except ValueError:
+            got_code = None
+        if got_code != code:
+            return elapsed, f"code {got_code}"
+    return elapsed, None
+
+
+def captcha(client, kind):
+    # Image captchas can't be read back, so build_app makes the service accept any answer
+    client.get(f"/generate-captcha/{kind}")
+    return 'BENCH'
+
+
+def scenario_index(client, n, seeded):
+    return timed(lambda: client.get("/"))
+
+
+def scenario_captcha(client, n, seeded):
+    return timed(lambda: client.get("/generate-captcha/login"))
+
+
+def scenario_signup(client, n, seeded):
+    code = captcha(client, 'signup')
+    return timed(lambda: client.post("/signup", {'email_mobile': f"new{n}-{time.time_ns()}@bench.example",
+                                                 'captcha': code}), code='otp_sent')
+
+
+def scenario_login(client, n, seeded):
+    code = captcha(client, 'login')
+    return timed(lambda: client.post("/login", {'email_mobile': seed_identity(n % seeded), 'captcha': code,
+                                                'login_type': 'password', 'password': BENCH_PASSWORD}),
+                 code='logged_in')
+
+
+def scenario_verify_otp(client, n, seeded):
+    code = captcha(client, 'login')
+    client.post("/login", {'email_mobile': seed_identity(n % seeded), 'captcha': code, 'login_type': 'otp'})
+    return timed(lambda: client.post("/verify-otp", {'otp': BENCH_OTP}), code='logged_in')
+
+
+def scenario_resend_otp(client, n, seeded):
+    code = captcha(client, 'login')
+    client.post("/login", {'email_mobile': seed_identity(n % seeded), 'captcha': code, 'login_type': 'otp'})
+    return timed(lambda: client.post("/resend-otp", {}), code='otp_sent')
+
+
+def scenario_api_verify_otp(client, n, seeded):
+    # The same flow over /api/v1
+    code = captcha(client, 'login')
+    client.post("/api/v1/auth/login", {'email_mobile': seed_identity(n % seeded), 'captcha': code, 'login_type': 'otp'})
+    return timed(lambda: client.post("/api/v1/auth/verify-otp", {'otp': BENCH_OTP}), code='logged_in')
+
+
+# name -> (scenario, share of --requests); password hashing makes login an order of magnitude slower
+SCENARIOS = {
+    'index': (scenario_index, 1.0),
+    'captcha': (scenario_captcha, 1.0),
+    'signup': (scenario_signup, 0.5),
+    'login': (scenario_login, 0.1),
+    'verify_otp': (scenario_verify_otp, 0.5),
+    'resend_otp': (scenario_resend_otp, 0.5),
+    'api_verify_otp': (scenario_api_verify_otp, 0.5),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+def run_scenario(make_client, scenario, requests, seeded, concurrency):
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            elapsed, error = scenario(make_client(n), n, seeded)
+            with lock:
+                latencies.append(elapsed)
+                if error is not None:
+                    errors[error] = errors.get(error, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - started)
+    result['errors'] = sum(errors.values())
+    if errors:
+        result['error_kinds'] = errors
+    return result
+
+
+# ------------------ MICRO BENCHMARKS ------------------
+def micro(fn, repeat):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run_micro(app, repeat):
+    record = {'password': 'x', 'created_at': time.time()}
+    images = [item.image for item in cardwala.get_services(app).catalog.current().religions]
+    with app.test_request_context('/'):
+        return {
+            'save_users': micro(lambda i: cardwala.save_users(
+                {f"micro{i}-{j}@bench.example": record for j in range(100)}), max(repeat // 10, 10)),
+            'resolve_image_path': micro(lambda i: cardwala.resolve_image_path(images[i % len(images)]), repeat),
+            'check_rate_limit': micro(lambda i: cardwala.check_rate_limit(f"bench_{i}"), repeat),
+        }
+
+
+# ------------------ STARTUP ------------------
+# Runs in a fresh interpreter so nothing is imported yet; prints one JSON line of timings in seconds
+STARTUP_PROBE = r"""
+import os, sys, json, time
+t0 = time.perf_counter()
+import app as cardwala
+t1 = time.perf_counter()
+app = cardwala.create_app({'APP_ENV': 'testing', 'LOG_LEVEL': 'WARNING', 'PROPAGATE_EXCEPTIONS': False,
+                           'USER_STORE_BACKEND': 'sqlite', 'USERS_DB': sys.argv[1], 'USERS_FILE': sys.argv[2]})
+t2 = time.perf_counter()
+status = app.test_client().get(sys.argv[3]).status_code
+t3 = time.perf_counter()
+if status != 200:
+    sys.exit(f"{sys.argv[3]} answered {status}")
+
+# What gunicorn does when it scales up under --preload: fork the warm master, serve
+services = cardwala.get_services(app)
+services.preload()
+workers = []
+for _ in range(int(sys.argv[4])):
+    read_end, write_end = os.pipe()
+    started = time.perf_counter()
+    if os.fork() == 0:
+        app.test_client().get(sys.argv[3])
+        os.write(write_end, str(time.perf_counter() - started).encode())
+        os._exit(0)
+    os.close(write_end)
+    workers.append(float(os.read(read_end, 64)))
+    os.close(read_end)
+    os.wait()
+services.close()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2,
+                  'total': t3 - t0, 'worker': workers}))
+"""
+
+
+def run_startup(runs, users_db):
+    """Cold-start timings over ``runs`` fresh interpreters, as ``startup:*`` results"""
+    samples = {'import': [], 'create_app': [], 'first_request': [], 'total': [], 'worker': []}
+    args = [users_db, os.path.join(DATA_DIR, 'no-legacy-users.json'), STARTUP_PATH, '3']
+    started = time.perf_counter()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE, *args], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        for name, values in samples.items():
+            value = timings[name]
+            values.extend(value if isinstance(value, list) else [value])
+    wall = time.perf_counter() - started
+    return {f"startup:{name}": summarize(values, wall) for name, values in samples.items()}
+
+
+def import_report(top=10):
+    """Slowest direct imports of app.py, from ``python -X importtime``"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stderr
+    direct = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # app.py itself is at depth 0; what it imports is indented one level
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) == 3:
+            direct.append((int(cumulative), name.strip()))
+    print(f"{'import (direct from app.py)':<48} {'ms':>9}")
+    for micros, name in sorted(direct, reverse=True)[:top]:
+        print(f"{name:<48} {micros / 1000:>9.1f}")
+
+
+# ------------------ RUN / COMPARE ------------------
+def run(user_counts, requests, http, concurrency, scenarios, micro_repeat):
+    results = {}
+    controller, smtp_port = start_smtp_sink()
+    if controller is None:
+        print("aiosmtpd not installed; mail sends are suppressed")
+    try:
+        for count in user_counts:
+            app = build_app(seeded_db(count), smtp_port)
+            prefix = f"users={count}"
+            for name in scenarios:
+                scenario, share = SCENARIOS[name]
+                n = max(int(requests * share), 5)
+                results[f"{prefix}:testclient:{name}"] = run_scenario(
+                    lambda i: TestClientDriver(app, i), scenario, n, count, 1)
+                if http:
+                    with HttpServer(app) as server:
+                        results[f"{prefix}:http:{name}"] = run_scenario(
+                            lambda i: HttpDriver(server.port, i), scenario, n, count, concurrency)
+            for name, result in run_micro(app, micro_repeat).items():
+                results[f"{prefix}:micro:{name}"] = result
+            cardwala.get_services(app).close()
+    finally:
+        if controller is not None:
+            controller.stop()
+    return results
+
+
+def print_report(results):
+    print(f"{'benchmark':<48} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<48} {r['requests']:>6} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['rps']:>9} "
+              f"{r.get('errors', ''):>7}")
+        if r.get('error_kinds'):
+            print(f"{'':<48} {r['error_kinds']}")
+
+
+def compare(results, baseline, tolerance):
+    """Names of benchmarks whose p95 is more than ``tolerance`` (a ratio) above the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('p95_ms'):
+            continue
+        if result.get('errors', 0) > base.get('errors', 0):
+            regressions.append(f"{name}: {result['errors']} errors (baseline {base.get('errors', 0)})")
+        limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + MIN_REGRESSION_MS)
+        if result['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms > {limit:.3f}ms (baseline {base['p95_ms']}ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', default='10000', help="comma-separated seed sizes, e.g. 10000,100000,1000000")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario (scaled per scenario)")
+    parser.add_argument('--micro-repeat', type=int, default=2000, help="calls per micro benchmark")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--http', action='store_true', help="also drive a real HTTP server")
+    parser.add_argument('--concurrency', type=int, default=4, help="HTTP client threads")
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--compare', action='store_true', help="exit 1 on regressions against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed p95 slowdown ratio (0.5 = +50%%)")
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--startup', action='store_true', help="also measure cold start in fresh interpreters")
+    parser.add_argument('--startup-runs', type=int, default=10)
+    parser.add_argument('--startup-budget-ms', type=float, default=200.0,
+                        help="p95 limit for a worker forked from a preloaded master to serve its first request")
+    args = parser.parse_args(argv)
+
+    user_counts = [int(c) for c in args.users.split(',') if c]
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = run(user_counts, args.requests, args.http, args.concurrency, scenarios, args.micro_repeat)
+    over_budget = []
+    if args.startup:
+        results.update(run_startup(args.startup_runs, seeded_db(user_counts[0] if user_counts else 0)))
+        worker_p95 = results['startup:worker']['p95_ms']
+        if worker_p95 > args.startup_budget_ms:
+            over_budget.append(f"startup:worker: p95 {worker_p95}ms > budget {args.startup_budget_ms}ms")
+    print_report(results)
+    if args.startup:
+        import_report()
+        for line in over_budget:
+            print(f"OVER BUDGET: {line}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        for name, result in results.items():
+            # A latency taken on an error path is no baseline for the real one
+            if result.get('errors'):
+                print(f"Not recording {name}: {result['errors']} errors {result['error_kinds']}")
+                baseline.pop(name, None)
+            else:
+                baseline[name] = result
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --update-baseline first")
+            return 1
+        with open(args.baseline) as f:
+            regressions = over_budget + compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
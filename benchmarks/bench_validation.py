@@ -0,0 +1,106 @@
+"""Throughput of identity and password validation.
+
+Runs the old per-call ``re.match`` helpers and validation.py over the same
+synthetic customer list (emails, formatted phone numbers and junk), then
+times ``bulk_validate`` on it and compares the two password checks.
+
+    python benchmarks/bench_validation.py --records 2000000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import validation  # noqa: E402
+
+
+# ------------------ OLD HELPERS ------------------
+def legacy_validate_email(email):
+    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    return bool(re.match(pattern, email))
+
+
+def legacy_validate_phone(phone):
+    pattern = r'^\+?1?\d{10,15}$'
+    cleaned = re.sub(r'[\s\-\(\)]', '', phone)
+    return bool(re.match(pattern, cleaned))
+
+
+def legacy_validate_user_input(email_mobile):
+    email_mobile = email_mobile.strip()
+    if '@' in email_mobile:
+        if legacy_validate_email(email_mobile):
+            return 'email', email_mobile
+        return None, "Invalid email format"
+    if legacy_validate_phone(email_mobile):
+        return 'phone', email_mobile
+    return None, "Invalid phone number format"
+
+
+def legacy_validate_password(password):
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters long"
+    if not re.search(r'[A-Z]', password):
+        return False, "Password must contain at least one uppercase letter"
+    if not re.search(r'[a-z]', password):
+        return False, "Password must contain at least one lowercase letter"
+    if not re.search(r'\d', password):
+        return False, "Password must contain at least one digit"
+    if not re.search(r'[\W_]', password):
+        return False, "Password must contain at least one special character"
+    return True, "Valid password"
+
+
+# ------------------ DATA ------------------
+def synthetic_records(n, seed=7):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.6:
+            records.append(f"  Guest.{i}@Example{i % 97}.com ")
+        elif roll < 0.9:
+            number = f"{rng.randrange(6, 10)}{rng.randrange(10 ** 8, 10 ** 9):09d}"
+            records.append(rng.choice((number, f"+91 {number[:5]}-{number[5:]}", f"0{number}",
+                                       f"({number[:3]}) {number[3:6]}-{number[6:]}")))
+        else:
+            records.append(rng.choice(("n/a", "guest@", "12345", "call me", "")))
+    return records
+
+
+def throughput(label, fn, records):
+    started = time.perf_counter()
+    fn(records)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40}{elapsed:>9.2f}s{len(records) / elapsed:>14,.0f} records/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--passwords', type=int, default=200000)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.records)
+    print(f"{len(records):,} identities")
+    throughput("old validate_user_input", lambda rs: [legacy_validate_user_input(r) for r in rs], records)
+    throughput("validation.validate_user_input", lambda rs: [validation.validate_user_input(r) for r in rs], records)
+    throughput("validation.bulk_validate (+ dedupe)", validation.bulk_validate, records)
+    valid, rejected, duplicates = validation.bulk_validate(records)
+    print(f"  {len(valid):,} valid, {len(rejected):,} rejected, {duplicates:,} duplicates")
+
+    rng = random.Random(11)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%_'
+    passwords = [''.join(rng.choice(alphabet) for _ in range(rng.randint(6, 20))) for _ in range(args.passwords)]
+    print(f"{len(passwords):,} passwords")
+    throughput("old validate_password", lambda ps: [legacy_validate_password(p) for p in ps], passwords)
+    throughput("validation.validate_password", lambda ps: [validation.validate_password(p) for p in ps], passwords)
+
+
+if __name__ == '__main__':
+    main()
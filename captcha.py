@@ -0,0 +1,168 @@
+import io
+import os
+import hmac
+import math
+import random
+import secrets
+import hashlib
+import logging
+import threading
+from collections import deque
+
+import tokengenerator
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# No 0/O, 1/I/L: they are too easy to misread once distorted
+ALPHABET = '23456789ABCDEFGHJKMNPQRSTUVWXYZ'
+WIDTH = 180
+HEIGHT = 64
+WARP_STRIP = 6
+
+
+# ------------------ RENDERING ------------------
+def random_code(length=5):
+    return tokengenerator.random_code(length, ALPHABET)
+
+
+def render_captcha(code, width=WIDTH, height=HEIGHT, rng=None):
+    """PNG of ``code`` with rotated, jittered glyphs, a wave warp and noise."""
+    rng = rng or random.Random(secrets.randbits(64))
+    image = Image.new('RGB', (width, height), (rng.randint(230, 255), rng.randint(230, 255), rng.randint(230, 255)))
+    font = ImageFont.load_default(size=int(height * 0.62))
+
+    step = (width - 20) / len(code)
+    for i, char in enumerate(code):
+        glyph = Image.new('RGBA', (height, height), (0, 0, 0, 0))
+        color = (rng.randint(0, 120), rng.randint(0, 120), rng.randint(0, 120), 255)
+        ImageDraw.Draw(glyph).text((height // 5, height // 10), char, font=font, fill=color)
+        glyph = glyph.rotate(rng.uniform(-30, 30), resample=Image.BICUBIC, expand=False)
+        x = int(10 + i * step + rng.uniform(-4, 4))
+        y = int(rng.uniform(-6, 6))
+        image.paste(glyph, (x - height // 5, y), glyph)
+
+    # Sine-wave warp: each vertical strip is shifted by the wave, done in one C-level mesh transform
+    amplitude, period, phase = rng.uniform(3, 6), rng.uniform(40, 80), rng.uniform(0, math.tau)
+    mesh = []
+    for x in range(0, width, WARP_STRIP):
+        dy0 = amplitude * math.sin(phase + x * math.tau / period)
+        dy1 = amplitude * math.sin(phase + (x + WARP_STRIP) * math.tau / period)
+        mesh.append(((x, 0, x + WARP_STRIP, height),
+                     (x, dy0, x, height + dy0, x + WARP_STRIP, height + dy1, x + WARP_STRIP, dy1)))
+    image = image.transform((width, height), Image.MESH, mesh, Image.BILINEAR, fillcolor=image.getpixel((0, 0)))
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(4):
+        points = [(rng.randint(0, width), rng.randint(0, height)) for _ in range(2)]
+        draw.line(points, fill=(rng.randint(60, 160),) * 3, width=rng.randint(1, 2))
+    noise = Image.effect_noise((width, height), 60).convert('RGB')
+    image = Image.blend(image, noise, 0.18).filter(ImageFilter.SMOOTH)
+
+    buf = io.BytesIO()
+    image.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+# ------------------ POOL ------------------
+class CaptchaPool:
+    """Pre-rendered image captchas with answers checked server-side.
+
+    A background thread keeps up to ``size`` rendered captchas ready, so
+    ``issue`` is a deque pop; when the pool runs dry it renders inline.
+    Only an HMAC of each answer is stored in ``state`` (a SharedState),
+    under a random id and with a ``ttl``, and ``verify`` consumes it, so
+    every captcha is good for exactly one attempt.
+
+    Without Pillow the challenge falls back to plain text, which only
+    stops the laziest bots; install Pillow in production.
+    """
+
+    def __init__(self, state, secret, size=200, low_water=None, ttl=300, length=5, prefix='captcha:'):
+        self.state = state
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.size = size
+        self.low_water = low_water if low_water is not None else size // 2
+        self.ttl = ttl
+        self.length = length
+        self.prefix = prefix
+        self.inline_renders = 0
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def _digest(self, captcha_id, scope, answer):
+        return hmac.new(self.secret, f"{scope}:{captcha_id}:{answer}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _render(self):
+        code = random_code(self.length)
+        return code, render_captcha(code) if Image is not None else None
+
+    # ------------------ REFILL ------------------
+    def start(self):
+        self._ensure_started()
+
+    def _ensure_started(self):
+        # Started on first use, and again in a forked worker so workers never share puzzles
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._ready = deque()
+            self._cond = threading.Condition()
+            self._pid = os.getpid()
+        if self.size and Image is not None:
+            threading.Thread(target=self._refill, name="captcha-refill", daemon=True).start()
+
+    def _refill(self):
+        while True:
+            with self._cond:
+                while len(self._ready) > self.low_water:
+                    self._cond.wait()
+                missing = self.size - len(self._ready)
+            for _ in range(missing):
+                try:
+                    item = self._render()
+                except Exception as e:
+                    logger.error(f"Captcha render failed: {e}")
+                    break
+                self._ready.append(item)
+
+    # ------------------ PUBLIC API ------------------
+    def issue(self, scope):
+        """Returns ``(captcha_id, png_bytes, text)``.
+
+        ``text`` is None unless Pillow is missing, in which case ``png_bytes``
+        is None and the answer itself is the challenge.
+        """
+        self._ensure_started()
+        try:
+            answer, image = self._ready.popleft()
+        except IndexError:
+            self.inline_renders += 1
+            answer, image = self._render()
+        if len(self._ready) <= self.low_water:
+            with self._cond:
+                self._cond.notify()
+
+        captcha_id = tokengenerator.token_urlsafe(16)
+        self.state.set(f"{self.prefix}{captcha_id}", self._digest(captcha_id, scope, answer), ttl=self.ttl)
+        return captcha_id, image, answer if image is None else None
+
+    def verify(self, captcha_id, scope, answer):
+        """One attempt per captcha: the stored hash is deleted whatever the outcome."""
+        if not captcha_id or not answer:
+            return False
+        # Consumed in one step, so two requests racing with the same id can't both be checked
+        expected = self.state.pop(f"{self.prefix}{captcha_id}")
+        if expected is None:
+            return False
+        return hmac.compare_digest(expected, self._digest(captcha_id, scope, answer.strip().upper()))
+
+    def ready(self):
+        return len(self._ready)
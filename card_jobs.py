@@ -0,0 +1,249 @@
+import os
+import io
+import csv
+import json
+import time
+import uuid
+import queue
+import logging
+import zipfile
+import threading
+import multiprocessing
+
+from card_renderer import CardRenderer, TEXT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+PROGRESS_EVERY = 25
+SWEEP_INTERVAL = 600
+
+
+# ------------------ GUEST FILES ------------------
+def parse_guest_file(data, filename='', max_records=5000):
+    """Records from a CSV (with a header row) or JSONL upload.
+
+    Known text fields are kept; a ``guest`` column fills ``names`` and an
+    optional ``filename`` column names the card inside the zip. Raises
+    ValueError on an unreadable or oversized file.
+    """
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if filename.lower().endswith(('.jsonl', '.ndjson')) or text.lstrip().startswith('{'):
+        rows = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    raise ValueError(f"Line {number} is not valid JSON")
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    records = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError("Every record must be an object")
+        row = {str(k).strip().lower(): v for k, v in row.items() if k}
+        if row.get('guest') and not row.get('names'):
+            row['names'] = row['guest']
+        record = {k: str(row[k]) for k in TEXT_FIELDS if row.get(k)}
+        if row.get('filename'):
+            record['filename'] = str(row['filename'])
+        records.append(record)
+        if len(records) > max_records:
+            raise ValueError(f"At most {max_records} guests per batch")
+    if not records:
+        raise ValueError("No guest records found")
+    return records
+
+
+def _safe_name(name):
+    cleaned = ''.join(c if c.isalnum() or c in '-_ ' else '_' for c in name).strip().replace(' ', '_')
+    return cleaned[:80] or 'card'
+
+
+# ------------------ POOL WORKERS ------------------
+_worker_renderer = None
+
+
+def _init_worker(static_root):
+    global _worker_renderer
+    # Bulk cards are all different, so skip the per-card caches
+    _worker_renderer = CardRenderer(static_root, cache_dir=None, memory_entries=0)
+
+
+def _render_one(task):
+    index, template, fields, size, fmt = task
+    try:
+        data, _ = _worker_renderer.render(template, fields, size=size, fmt=fmt)
+        return index, data, None
+    except Exception as e:
+        return index, None, f"{type(e).__name__}: {e}"
+
+
+# ------------------ JOBS ------------------
+class BulkCardJobs:
+    """Renders batches of personalised cards on a process pool and zips them.
+
+    Jobs run one at a time on a dispatcher thread; each fans its cards out
+    over ``workers`` processes and writes every card into the job's zip as
+    soon as it comes back. Progress lives in ``state`` (a SharedState) so
+    any web worker can report it, and the zip is written to ``output_dir``.
+    Zips are deleted once they are older than ``status_ttl``, when their
+    status expires; the dispatcher sweeps for them every ``SWEEP_INTERVAL``
+    seconds.
+    """
+
+    def __init__(self, static_root, state, output_dir='card_jobs', workers=None,
+                 status_ttl=86400, chunksize=4):
+        self.static_root = static_root
+        self.state = state
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.status_ttl = status_ttl
+        self.chunksize = chunksize
+        self._queue = None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ------------------ PUBLIC API ------------------
+    def submit(self, template, base_fields, records, size='print', fmt='png', owner=None):
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'template': template, 'fields': dict(base_fields), 'records': records,
+               'size': size, 'format': fmt}
+        self._set_status(job_id, status=QUEUED, total=len(records), done=0, failed=0,
+                         owner=owner, created_at=time.time())
+        self._queue.put(job)
+        logger.info(f"🗂️ Bulk card job {job_id} queued with {len(records)} card(s)")
+        return job_id
+
+    def status(self, job_id):
+        raw = self.state.get(f"cardjob:{job_id}")
+        return json.loads(raw) if raw else None
+
+    def zip_path(self, job_id):
+        return os.path.join(self.output_dir, f"{job_id}.zip")
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    # ------------------ DISPATCH ------------------
+    def _ensure_started(self):
+        # Started on first use, and again in a forked worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pool = None
+            thread = threading.Thread(target=self._run, name="card-jobs", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _get_pool(self):
+        if self._pool is None:
+            # Spawned, not forked: the web worker has threads and open connections
+            context = multiprocessing.get_context('spawn')
+            self._pool = context.Pool(self.workers, initializer=_init_worker, initargs=(self.static_root,))
+        return self._pool
+
+    def _run(self):
+        next_sweep = 0
+        while True:
+            if time.time() >= next_sweep:
+                self.sweep()
+                next_sweep = time.time() + SWEEP_INTERVAL
+            try:
+                job = self._queue.get(timeout=SWEEP_INTERVAL)
+            except queue.Empty:
+                continue
+            if job is None:
+                return
+            try:
+                self._process(job)
+            except Exception as e:
+                logger.exception(f"Bulk card job {job['id']} failed")
+                self._update(job['id'], status=FAILED, error=f"{type(e).__name__}: {e}")
+
+    def _process(self, job):
+        job_id, records = job['id'], job['records']
+        started = time.time()
+        self._update(job_id, status=RUNNING, started_at=started)
+
+        tasks = ((i, job['template'], {**job['fields'], **record}, job['size'], job['format'])
+                 for i, record in enumerate(records))
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = self.zip_path(job_id)
+        partial = f"{path}.part"
+        done = failed = 0
+        errors = []
+        used_names = set()
+
+        # Cards are already compressed (PNG/PDF), so store them as-is
+        with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for index, data, error in self._get_pool().imap_unordered(_render_one, tasks, self.chunksize):
+                if error is not None:
+                    failed += 1
+                    errors.append({'index': index, 'error': error})
+                else:
+                    record = records[index]
+                    name = _safe_name(record.get('filename') or record.get('names') or f"card-{index + 1}")
+                    if name in used_names:
+                        name = f"{name}-{index + 1}"
+                    used_names.add(name)
+                    archive.writestr(f"{name}.{job['format']}", data)
+                    done += 1
+                if (done + failed) % PROGRESS_EVERY == 0:
+                    self._update(job_id, done=done, failed=failed)
+        os.replace(partial, path)
+
+        elapsed = time.time() - started
+        self._update(job_id, status=DONE, done=done, failed=failed, errors=errors[:20],
+                     finished_at=time.time(), seconds=round(elapsed, 2))
+        logger.info(f"✅ Bulk card job {job_id}: {done} card(s), {failed} failed in {elapsed:.1f}s")
+
+    def sweep(self):
+        """Delete zips (and abandoned partial zips) whose job status has expired; returns how many went"""
+        cutoff = time.time() - self.status_ttl
+        removed = 0
+        try:
+            names = os.listdir(self.output_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith(('.zip', '.zip.part')):
+                continue
+            path = os.path.join(self.output_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"🧹 Removed {removed} expired bulk card zip(s)")
+        return removed
+
+    # ------------------ STATUS ------------------
+    def _set_status(self, job_id, **record):
+        record['id'] = job_id
+        record['updated_at'] = time.time()
+        self.state.set(f"cardjob:{job_id}", json.dumps(record), ttl=self.status_ttl)
+
+    def _update(self, job_id, **changes):
+        record = self.status(job_id) or {}
+        record.update(changes)
+        self._set_status(job_id, **record)
@@ -0,0 +1,331 @@
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes so cached cards from the old layout are not served
+RENDERER_VERSION = 1
+
+SIZES = {
+    'preview': (600, 840),
+    'print': (1500, 2100),
+}
+FORMATS = {'png': 'image/png', 'pdf': 'application/pdf'}
+TEXT_FIELDS = ('title', 'names', 'date', 'venue', 'message')
+MAX_FIELD_LENGTH = 120
+PDF_DPI = 300
+# A full disk cache is pruned down to this share of its cap, so pruning doesn't run on every write
+DISK_PRUNE_RATIO = 0.8
+DISK_RESCAN_WRITES = 256
+FONT_PATHS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSerif.ttf',
+    '/Library/Fonts/Georgia.ttf',
+    'C:\\Windows\\Fonts\\georgia.ttf',
+)
+
+
+def clean_text(fields):
+    """Keep the known text fields, stripped and capped in length."""
+    return {name: ' '.join(str(fields.get(name) or '').split())[:MAX_FIELD_LENGTH] for name in TEXT_FIELDS}
+
+
+def card_key(template, text, size, fmt):
+    """Content address of a card: the same inputs always map to the same key."""
+    payload = json.dumps({'v': RENDERER_VERSION, 'template': template, 'text': text,
+                          'size': list(size), 'format': fmt}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CardRenderer:
+    """Composes invitation cards (PNG or PDF) from a catalog image plus the user's text.
+
+    Background images are decoded once and kept in memory (``preload`` them
+    before forking workers to share them). Every rendered card is stored
+    under the hash of its inputs, in an in-memory LRU and in ``cache_dir``
+    on disk so other workers and restarts reuse it.
+
+    The disk cache holds at most ``disk_max_bytes`` (0 = unbounded). Files
+    are evicted least recently used first, by mtime, which a disk hit
+    refreshes. Each worker counts its own writes and rescans the directory
+    every ``DISK_RESCAN_WRITES`` writes, so the writes of other workers
+    are counted too.
+    """
+
+    def __init__(self, static_root, cache_dir='card_cache', memory_entries=128, max_base_images=64,
+                 max_backdrops=8, disk_max_bytes=512 * 1024 * 1024):
+        if Image is None:
+            raise RuntimeError("Pillow is required for card rendering (pip install Pillow)")
+        self.static_root = static_root
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.max_base_images = max_base_images
+        self.max_backdrops = max_backdrops
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None
+        self._disk_writes = 0
+        self._prune_lock = threading.Lock()
+        self._bases = OrderedDict()
+        self._backdrops = OrderedDict()
+        self._rendered = OrderedDict()
+        self._fonts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------ BASE IMAGES ------------------
+    def base_image(self, rel_path):
+        """Decoded RGB background, or None when the file is missing or unreadable."""
+        with self._lock:
+            image = self._bases.get(rel_path)
+            if image is not None:
+                self._bases.move_to_end(rel_path)
+                return image
+
+        path = os.path.join(self.static_root, rel_path)
+        try:
+            with Image.open(path) as img:
+                image = img.convert('RGB')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not decode card background {rel_path}: {e}")
+            return None
+
+        with self._lock:
+            self._bases[rel_path] = image
+            while len(self._bases) > self.max_base_images:
+                self._bases.popitem(last=False)
+        return image
+
+    def _stamp(self, rel_path):
+        # A replaced background gets a new address even though its name is unchanged
+        try:
+            stat = os.stat(os.path.join(self.static_root, rel_path))
+        except OSError:
+            return 'missing'
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def preload(self, rel_paths):
+        existing = {rel for rel in rel_paths if os.path.isfile(os.path.join(self.static_root, rel))}
+        loaded = sum(1 for rel in sorted(existing) if self.base_image(rel) is not None)
+        logger.debug(f"Pre-decoded {loaded} card background(s)")
+        return loaded
+
+    def _font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            for path in FONT_PATHS:
+                if os.path.exists(path):
+                    font = ImageFont.truetype(path, size)
+                    break
+            else:
+                font = ImageFont.load_default(size=size)
+            self._fonts[size] = font
+        return font
+
+    # ------------------ COMPOSITION ------------------
+    def _backdrop(self, template, size):
+        """Background cropped to ``size`` with the text panel drawn on, shared by every card that uses it"""
+        key = (template, size)
+        with self._lock:
+            backdrop = self._backdrops.get(key)
+            if backdrop is not None:
+                self._backdrops.move_to_end(key)
+                return backdrop
+
+        width, height = size
+        base = self.base_image(template)
+        if base is None:
+            card = Image.new('RGB', size, (122, 31, 52))
+        else:
+            card = ImageOps.fit(base, size, Image.LANCZOS)
+
+        # Soft panel behind the text so it stays readable on any photo
+        overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        margin = width // 12
+        draw.rounded_rectangle((margin, height // 3, width - margin, height - margin),
+                               radius=width // 30, fill=(255, 250, 240, 215))
+        backdrop = Image.alpha_composite(card.convert('RGBA'), overlay).convert('RGB')
+
+        with self._lock:
+            self._backdrops[key] = backdrop
+            while len(self._backdrops) > self.max_backdrops:
+                self._backdrops.popitem(last=False)
+        return backdrop
+
+    def _compose(self, template, text, size):
+        width, height = size
+        card = self._backdrop(template, size).copy()
+        margin = width // 12
+
+        draw = ImageDraw.Draw(card)
+        lines = [
+            (text['title'], width // 13, (122, 31, 52)),
+            (text['names'], width // 16, (40, 40, 40)),
+            (text['date'], width // 24, (70, 70, 70)),
+            (text['venue'], width // 24, (70, 70, 70)),
+            (text['message'], width // 28, (90, 90, 90)),
+        ]
+        y = height // 3 + width // 15
+        max_width = width - 3 * margin
+        for value, font_size, color in lines:
+            if not value:
+                continue
+            font = self._font(font_size)
+            for line in self._wrap(draw, value, font, max_width):
+                line_width = draw.textlength(line, font=font)
+                draw.text(((width - line_width) / 2, y), line, font=font, fill=color)
+                y += int(font_size * 1.35)
+            y += font_size // 2
+        return card
+
+    @staticmethod
+    def _wrap(draw, value, font, max_width):
+        lines, current = [], ''
+        for word in value.split():
+            candidate = f"{current} {word}".strip()
+            if current and draw.textlength(candidate, font=font) > max_width:
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        if current:
+            lines.append(current)
+        return lines
+
+    @staticmethod
+    def _encode(card, fmt):
+        buf = io.BytesIO()
+        if fmt == 'pdf':
+            card.save(buf, 'PDF', resolution=PDF_DPI)
+        else:
+            card.save(buf, 'PNG', optimize=False, compress_level=6)
+        return buf.getvalue()
+
+    # ------------------ CACHE ------------------
+    def _disk_path(self, key, fmt):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._rendered[key] = data
+            self._rendered.move_to_end(key)
+            while len(self._rendered) > self.memory_entries:
+                self._rendered.popitem(last=False)
+
+    def _cached(self, key, fmt):
+        with self._lock:
+            data = self._rendered.get(key)
+            if data is not None:
+                self._rendered.move_to_end(key)
+                return data
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key, fmt)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def _disk_files(self):
+        files = []
+        for root, _dirs, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def prune_disk(self):
+        """Delete the least recently used cards until the cache is under its cap; returns how many went"""
+        if not self.cache_dir or not self.disk_max_bytes:
+            return 0
+        # One pruner per process; other writers carry on instead of queueing behind the scan
+        if not self._prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            files = self._disk_files()
+            total = sum(size for _mtime, size, _path in files)
+            removed = 0
+            if total > self.disk_max_bytes:
+                target = self.disk_max_bytes * DISK_PRUNE_RATIO
+                stale_tmp = time.time() - 3600
+                for mtime, size, path in sorted(files):
+                    if total <= target:
+                        break
+                    if path.endswith('.tmp') and mtime > stale_tmp:
+                        continue
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed += 1
+                logger.info(f"🧹 Card cache pruned: {removed} file(s) removed, {total // 1024} KiB left")
+            with self._lock:
+                self._disk_bytes = total
+                self._disk_writes = 0
+            return removed
+        finally:
+            self._prune_lock.release()
+
+    def _store_disk(self, key, fmt, data):
+        path = self._disk_path(key, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write card cache {path}: {e}")
+            return
+        if not self.disk_max_bytes:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            self._disk_writes += 1
+            due = (self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+                   or self._disk_writes >= DISK_RESCAN_WRITES)
+        if due:
+            self.prune_disk()
+
+    def render(self, template, fields, size='preview', fmt='png'):
+        """Returns ``(data, key)``; ``key`` doubles as a strong ETag."""
+        if size not in SIZES:
+            raise ValueError(f"Unknown card size: {size}")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown card format: {fmt}")
+        text = clean_text(fields)
+        key = card_key(f"{template}@{self._stamp(template)}", text, SIZES[size], fmt)
+
+        data = self._cached(key, fmt)
+        if data is not None:
+            self.hits += 1
+            return data, key
+
+        self.misses += 1
+        data = self._encode(self._compose(template, text, SIZES[size]), fmt)
+        self._remember(key, data)
+        if self.cache_dir:
+            self._store_disk(key, fmt, data)
+        return data, key
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ RECORDS ------------------
+class Religion:
+    __slots__ = ('name', 'image', 'ceremonies')
+
+    def __init__(self, name, image, ceremonies=()):
+        self.name = name
+        self.image = image
+        self.ceremonies = tuple(ceremonies)
+
+    def __repr__(self):
+        return f"Religion({self.name!r})"
+
+
+class Ceremony:
+    __slots__ = ('name', 'image', 'religions')
+
+    def __init__(self, name, image, religions=()):
+        self.name = name
+        self.image = image
+        self.religions = tuple(religions)
+
+    def __repr__(self):
+        return f"Ceremony({self.name!r})"
+
+
+# ------------------ CATALOG ------------------
+class Catalog:
+    """One immutable snapshot of the catalog.
+
+    Lookups by name and the religion → allowed ceremonies check are dict and
+    frozenset hits. ``version`` is a hash of the data file, so it is the same
+    in every worker and changes only when the catalog does; use it in cache
+    keys.
+    """
+
+    __slots__ = ('version', 'religions', 'ceremonies', '_religions', '_ceremonies', '_allowed')
+
+    def __init__(self, religions, ceremonies, version):
+        self.version = version
+        self.religions = tuple(religions)
+        self.ceremonies = tuple(ceremonies)
+        self._religions = {r.name: r for r in self.religions}
+        self._ceremonies = {c.name: c for c in self.ceremonies}
+        self._allowed = {r.name: frozenset(r.ceremonies) for r in self.religions}
+
+    def religion(self, name):
+        return self._religions.get(name)
+
+    def ceremony(self, name):
+        return self._ceremonies.get(name)
+
+    def allows(self, religion, ceremony):
+        return ceremony in self._allowed.get(religion, ())
+
+    def ceremonies_for(self, religion):
+        entry = self._religions.get(religion)
+        return tuple(self._ceremonies[name] for name in entry.ceremonies) if entry else ()
+
+    def check_selection(self, religion, ceremony):
+        if religion not in self._religions:
+            return False, "Please choose a religion from the list"
+        if ceremony not in self._ceremonies:
+            return False, "Please choose a ceremony from the list"
+        if not self.allows(religion, ceremony):
+            return False, f"{ceremony} is not offered for {religion}"
+        return True, "OK"
+
+    def to_dict(self):
+        """Plain dicts for templates and JSON; each religion lists its ceremonies so pages can filter client-side"""
+        return {
+            'version': self.version,
+            'religions': [{'name': r.name, 'image': r.image, 'ceremonies': list(r.ceremonies)}
+                          for r in self.religions],
+            'ceremonies': [{'name': c.name, 'image': c.image, 'religions': list(c.religions)}
+                           for c in self.ceremonies],
+        }
+
+
+def _entries(data, key):
+    entries = data.get(key)
+    if not isinstance(entries, list):
+        raise ValueError(f"'{key}' must be a list")
+    seen = set()
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get('name') or not entry.get('image'):
+            raise ValueError(f"Every entry in '{key}' needs a name and an image")
+        if entry['name'] in seen:
+            raise ValueError(f"Duplicate name in '{key}': {entry['name']}")
+        seen.add(entry['name'])
+    return entries
+
+
+def parse_catalog(data, version):
+    """Build a Catalog from the decoded data file; raises ValueError when it is inconsistent"""
+    if not isinstance(data, dict):
+        raise ValueError("Catalog must be a JSON object")
+    religion_entries = _entries(data, 'religions')
+    ceremony_entries = _entries(data, 'ceremonies')
+
+    # The file lists religions per ceremony; the reverse index is derived here
+    allowed = {r['name']: [] for r in religion_entries}
+    ceremonies = []
+    for entry in ceremony_entries:
+        religions = entry.get('religions', [])
+        if not isinstance(religions, list):
+            raise ValueError(f"Ceremony {entry['name']}: 'religions' must be a list")
+        unknown = [name for name in religions if name not in allowed]
+        if unknown:
+            raise ValueError(f"Ceremony {entry['name']} refers to unknown religions: {', '.join(unknown)}")
+        for name in religions:
+            allowed[name].append(entry['name'])
+        ceremonies.append(Ceremony(entry['name'], entry['image'], religions))
+
+    religions = [Religion(r['name'], r['image'], allowed[r['name']]) for r in religion_entries]
+    return Catalog(religions, ceremonies, version)
+
+
+def load_catalog(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    version = hashlib.sha1(raw).hexdigest()[:12]
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"{path} is not valid JSON: {e}")
+    return parse_catalog(data, version)
+
+
+# ------------------ HOT RELOAD ------------------
+class CatalogStore:
+    """The current Catalog, reloaded when the data file changes.
+
+    The file's mtime and size are checked at most every ``check_interval``
+    seconds (0 disables the check; ``reload`` still works). A file that fails
+    to load is logged and the previous catalog stays in service.
+    """
+
+    def __init__(self, path, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._catalog = load_catalog(path)
+        self._stat = self._file_stat()
+        self._next_check = time.time() + check_interval
+        logger.info(f"📚 Catalog loaded: {len(self._catalog.religions)} religions, "
+                    f"{len(self._catalog.ceremonies)} ceremonies (version {self._catalog.version})")
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self):
+        """Load the file again; returns True when a new version went live"""
+        with self._lock:
+            stat = self._file_stat()
+            try:
+                catalog = load_catalog(self.path)
+            except (OSError, ValueError) as e:
+                logger.error(f"✗ Catalog reload failed, keeping version {self._catalog.version}: {e}")
+                self._stat = stat
+                return False
+            self._stat = stat
+            if catalog.version == self._catalog.version:
+                return False
+            self._catalog = catalog
+        logger.info(f"📚 Catalog reloaded (version {catalog.version})")
+        return True
+
+    def current(self):
+        if self.check_interval:
+            now = time.time()
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                if self._file_stat() != self._stat:
+                    self.reload()
+        return self._catalog
@@ -0,0 +1,175 @@
+import os
+import random
+from datetime import timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, '1' if default else '0') == '1'
+
+
+class Config:
+    """Settings shared by every environment, read from the process environment.
+
+    Values are read when the config is instantiated (inside create_app, after
+    .env has been loaded), not at import time.
+    """
+
+    DEBUG = False
+    TESTING = False
+
+    def __init__(self):
+        self.APP_ENV = _env('APP_ENV', 'development')
+        self.SECRET_KEY = _env('SECRET_KEY') or 'dev-secret-key-CHANGE-IN-PRODUCTION-' + str(random.randint(1000, 9999))
+
+        # Session Configuration
+        self.PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
+        self.SESSION_COOKIE_HTTPONLY = True
+        self.SESSION_COOKIE_SAMESITE = 'Lax'
+        self.SESSION_COOKIE_SECURE = _env_flag('SESSION_COOKIE_SECURE', False)
+
+        # Number of reverse proxies in front of the app whose X-Forwarded-For is trusted.
+        # 0 keeps request.remote_addr as the socket peer, so clients can't pick their rate-limit key
+        self.PROXY_FIX_X_FOR = int(_env('PROXY_FIX_X_FOR', '0'))
+
+        # Logging
+        self.LOG_FILE = _env('LOG_FILE', 'app.log')
+        self.LOG_LEVEL = _env('LOG_LEVEL')
+        self.LOG_JSON = _env_flag('LOG_JSON', True)
+        self.LOG_MAX_BYTES = int(_env('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+        self.LOG_BACKUP_COUNT = int(_env('LOG_BACKUP_COUNT', '5'))
+        self.LOG_ROTATE_WHEN = _env('LOG_ROTATE_WHEN') or None
+
+        # Flask-Mail. MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0 points at a
+        # local stand-in such as `python -m aiosmtpd -n -l localhost:1025`
+        self.MAIL_SERVER = _env('MAIL_SERVER', 'smtp.gmail.com')
+        self.MAIL_PORT = int(_env('MAIL_PORT', '587'))
+        self.MAIL_USE_TLS = _env_flag('MAIL_USE_TLS', True)
+        self.MAIL_USE_SSL = _env_flag('MAIL_USE_SSL', False)
+        self.MAIL_USERNAME = _env('MAIL_USERNAME', '')
+        self.MAIL_PASSWORD = _env('MAIL_PASSWORD', '')
+        self.MAIL_DEFAULT_SENDER = self.MAIL_USERNAME or 'cardwala@localhost'
+        self.MAIL_DEBUG = _env_flag('MAIL_DEBUG', False)
+        self.MAIL_MAX_EMAILS = None
+        self.MAIL_ASCII_ATTACHMENTS = False
+
+        # Outbound mail queue and SMTP pool
+        self.MAIL_WORKERS = int(_env('MAIL_WORKERS', '2'))
+        self.MAIL_MAX_RETRIES = int(_env('MAIL_MAX_RETRIES', '3'))
+        self.MAIL_BACKOFF_SECONDS = float(_env('MAIL_BACKOFF_SECONDS', '2'))
+        self.MAIL_BATCH_SIZE = int(_env('MAIL_BATCH_SIZE', '10'))
+        self.MAIL_USE_POOL = _env_flag('MAIL_USE_POOL', True)
+        self.MAIL_POOL_SIZE = int(_env('MAIL_POOL_SIZE', '2'))
+
+        # User store
+        self.USERS_FILE = _env('USERS_FILE', 'users.json')
+        self.USERS_DB = _env('USERS_DB', 'users.db')
+        self.USER_STORE_BACKEND = _env('USER_STORE_BACKEND', 'sqlite')
+        self.USER_WRITE_BEHIND = _env_flag('USER_WRITE_BEHIND', True)
+        self.USER_FLUSH_INTERVAL_MS = int(_env('USER_FLUSH_INTERVAL_MS', '500'))
+        self.USER_FLUSH_BATCH = int(_env('USER_FLUSH_BATCH', '100'))
+        # Country code given to bare 10-digit phone numbers when they are normalized to E.164
+        self.PHONE_COUNTRY_CODE = _env('PHONE_COUNTRY_CODE', '91').lstrip('+')
+        self.USER_IMPORT_BATCH = int(_env('USER_IMPORT_BATCH', '1000'))
+        # Body limit for the admin import route only, which streams; MAX_UPLOAD_MB covers everything else
+        self.USER_IMPORT_MAX_MB = int(_env('USER_IMPORT_MAX_MB', '1024'))
+
+        # Bearer token for the /admin/users routes; unset disables them
+        self.ADMIN_TOKEN = _env('ADMIN_TOKEN', '')
+
+        # Password hashing: work factor calibrated to PASSWORD_HASH_TARGET_MS unless set.
+        # scrypt calibration only picks N=2^15 or 2^16 (64 MiB per hash), so a target slower than
+        # 2^16 takes on this machine stops there; pin a higher PASSWORD_HASH_WORK_FACTOR for more
+        self.PASSWORD_HASH_METHOD = _env('PASSWORD_HASH_METHOD', 'scrypt')
+        self.PASSWORD_HASH_TARGET_MS = int(_env('PASSWORD_HASH_TARGET_MS', '250'))
+        self.PASSWORD_HASH_WORK_FACTOR = int(_env('PASSWORD_HASH_WORK_FACTOR', '0')) or None
+        self.PASSWORD_HASH_WORKERS = int(_env('PASSWORD_HASH_WORKERS', '2'))
+        self.PASSWORD_HASH_MAX_PENDING = int(_env('PASSWORD_HASH_MAX_PENDING', '0')) or None
+
+        # Cross-worker state: rate limits, sessions, OTPs, mail status
+        self.SHARED_STATE_URL = _env('SHARED_STATE_URL', 'sqlite:///cardwala_state.db')
+        # Cap on rate-limit counters; sessions, OTPs and captchas are only dropped when they expire
+        self.SHARED_STATE_MAX_KEYS = int(_env('SHARED_STATE_MAX_KEYS', '100000'))
+        self.REDIS_URL = _env('REDIS_URL', self.SHARED_STATE_URL)
+        self.SESSION_STORE_URL = _env('SESSION_STORE_URL', self.SHARED_STATE_URL)
+        self.OTP_STORE_URL = _env('OTP_STORE_URL', self.SHARED_STATE_URL)
+        self.OTP_HASH_SECRET = _env('OTP_HASH_SECRET') or self.SECRET_KEY
+
+        # Image captchas: rendered ahead of time, answers kept hashed in shared state
+        self.CAPTCHA_POOL_SIZE = int(_env('CAPTCHA_POOL_SIZE', '100'))
+        self.CAPTCHA_TTL_SECONDS = int(_env('CAPTCHA_TTL_SECONDS', '300'))
+        self.CAPTCHA_LENGTH = int(_env('CAPTCHA_LENGTH', '5'))
+
+        # Instrumentation: /metrics, slow-request logging and the opt-in sampling profiler
+        self.METRICS_ENABLED = _env_flag('METRICS_ENABLED', True)
+        self.SLOW_REQUEST_MS = int(_env('SLOW_REQUEST_MS', '1000'))
+        self.PROFILE_EVERY = int(_env('PROFILE_EVERY', '0'))
+        self.PROFILE_SLOW_MS = int(_env('PROFILE_SLOW_MS', '250'))
+        self.PROFILE_DIR = _env('PROFILE_DIR', 'profiles')
+
+        # Pages and static assets
+        self.PAGE_CACHE_SIZE = int(_env('PAGE_CACHE_SIZE', '256'))
+        self.BUILD_ASSETS_ON_STARTUP = _env_flag('BUILD_ASSETS_ON_STARTUP', False)
+
+        # Religions, ceremonies and which ceremonies each religion offers; edits go live without a restart
+        self.CATALOG_FILE = _env('CATALOG_FILE', os.path.join(BASE_DIR, 'catalog.json'))
+        self.CATALOG_CHECK_SECONDS = float(_env('CATALOG_CHECK_SECONDS', '2'))
+
+        # Rendered invitation cards
+        self.CARD_CACHE_DIR = _env('CARD_CACHE_DIR', 'card_cache')
+        self.CARD_MEMORY_CACHE_SIZE = int(_env('CARD_MEMORY_CACHE_SIZE', '128'))
+        self.CARD_CACHE_MAX_MB = int(_env('CARD_CACHE_MAX_MB', '512'))
+        self.CARD_PRELOAD_IMAGES = _env_flag('CARD_PRELOAD_IMAGES', True)
+        self.CARD_JOB_DIR = _env('CARD_JOB_DIR', 'card_jobs')
+        self.CARD_JOB_WORKERS = int(_env('CARD_JOB_WORKERS', '0'))
+        self.CARD_JOB_MAX_RECORDS = int(_env('CARD_JOB_MAX_RECORDS', '5000'))
+        # Larger request bodies (e.g. guest lists) are refused with 413 before they are read
+        self.MAX_CONTENT_LENGTH = int(_env('MAX_UPLOAD_MB', '16')) * 1024 * 1024
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+
+    def __init__(self):
+        super().__init__()
+        if not _env('SECRET_KEY'):
+            raise RuntimeError("SECRET_KEY must be set in production; every worker needs the same key")
+        self.SESSION_COOKIE_SECURE = _env_flag('SESSION_COOKIE_SECURE', True)
+
+
+class TestingConfig(Config):
+    TESTING = True
+
+    def __init__(self):
+        super().__init__()
+        self.LOG_FILE = None
+        self.SHARED_STATE_URL = self.SESSION_STORE_URL = self.OTP_STORE_URL = 'memory://'
+        self.USER_WRITE_BEHIND = False
+        self.MAIL_SUPPRESS_SEND = True
+        self.PASSWORD_HASH_WORKERS = 0
+        self.CAPTCHA_POOL_SIZE = 0
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(name=None):
+    name = name or _env('APP_ENV', 'development')
+    try:
+        config = CONFIGS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown APP_ENV: {name}")
+    config.APP_ENV = name
+    return config
@@ -0,0 +1,77 @@
+"""gunicorn settings for Cardwala: gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment (GUNICORN_*).
+
+Worker classes:
+  sync     one request per process; simplest, good behind a buffering proxy
+  gthread  GUNICORN_THREADS requests per process; the default, since requests
+           mostly wait on SQLite/Redis and the mail queue
+  gevent   many cooperative requests per process (pip install gevent)
+
+Reloads: with preload_app on (the default) the app is imported once in the
+master, so `kill -HUP <master pid>` re-forks workers from that already
+loaded code; it rereads this file but does not pick up new code. To
+deploy new code, `kill -USR2 <master pid>` starts a new master that
+imports it, then `kill -TERM` the old master once the new workers are up
+(or restart the service). With GUNICORN_PRELOAD=0 each worker imports the
+app itself and HUP does load new code, at the cost of slower,
+unshared worker startup.
+"""
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Import the app once in the master; when_ready then builds the services so workers share them copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers now and then so slow leaks can't build up; jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+if worker_class == 'gevent':
+    # gevent patches threading itself; extra threads per worker mean nothing there
+    threads = 1
+
+
+def when_ready(server):
+    # Runs in the master before the first worker is forked; without preload each worker builds lazily
+    if not server.cfg.preload_app:
+        return
+    # Workers append to the same app.log, so nobody in this process tree rotates it
+    from log_config import stop_rotation
+    stop_rotation()
+    services = getattr(server.app.wsgi(), 'extensions', {}).get('cardwala')
+    if services is not None:
+        services.preload()
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker spawned (pid: {worker.pid}, class: {worker_class})")
+
+
+def post_worker_init(worker):
+    # Start filling this worker's captcha pool before the first request asks for one
+    services = getattr(worker.wsgi, 'extensions', {}).get('cardwala')
+    if services is not None:
+        services.captcha.start()
+
+
+def worker_exit(server, worker):
+    # Flush the write-behind journal and drain queued mail before the worker goes away
+    app = getattr(worker, 'wsgi', None)
+    services = getattr(app, 'extensions', {}).get('cardwala') if app is not None else None
+    if services is not None:
+        services.close()
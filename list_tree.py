@@ -3,12 +3,33 @@ import os
 base_dir = os.path.dirname(os.path.abspath(__file__))
 static_dir = os.path.join(base_dir, "static", "images")
 
-print("Looking in:", static_dir)
-
-for root, dirs, files in os.walk(static_dir):
-    level = root.replace(static_dir, "").count(os.sep)
-    indent = " " * 4 * (level)
-    print(f"{indent}{os.path.basename(root)}/")
-    subindent = " " * 4 * (level + 1)
-    for f in files:
-        print(f"{subindent}{f}")
+
+def iter_static_files(root_dir, exclude_dirs=(), dir_mtimes=None):
+    """Yield every file under root_dir as a '/'-separated path relative to it.
+
+    Pass a dict as ``dir_mtimes`` to also collect each walked directory's mtime.
+    """
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = sorted(d for d in dirs if d not in exclude_dirs)
+        if dir_mtimes is not None:
+            dir_mtimes[root] = os.stat(root).st_mtime
+        rel_dir = os.path.relpath(root, root_dir)
+        rel_dir = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/')
+        for f in sorted(files):
+            yield f"{rel_dir}/{f}" if rel_dir else f
+
+
+def print_tree(root_dir):
+    print("Looking in:", root_dir)
+
+    for root, dirs, files in os.walk(root_dir):
+        level = root.replace(root_dir, "").count(os.sep)
+        indent = " " * 4 * (level)
+        print(f"{indent}{os.path.basename(root)}/")
+        subindent = " " * 4 * (level + 1)
+        for f in files:
+            print(f"{subindent}{f}")
+
+
+if __name__ == "__main__":
+    print_tree(static_dir)
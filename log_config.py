@@ -0,0 +1,144 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+DEFAULT_LEVELS = {
+    'development': 'DEBUG',
+    'testing': 'WARNING',
+    'production': 'INFO',
+}
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_active = {'listener': None, 'queue_handler': None}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra=`` fields as top-level keys."""
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+def _file_handler(log_file, max_bytes, backup_count, rotate_when):
+    if rotate_when == 'external':
+        # logrotate (or similar) moves the file; reopen it when that happens
+        return logging.handlers.WatchedFileHandler(log_file, encoding='utf-8', delay=True)
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(
+            log_file, when=rotate_when, backupCount=backup_count, encoding='utf-8', delay=True)
+    return logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+
+
+def configure_logging(env=None, log_file='app.log', level=None, json_logs=None,
+                      max_bytes=10 * 1024 * 1024, backup_count=5, rotate_when=None):
+    """Route all logging through a queue so request threads never wait on log I/O.
+
+    Records go onto an in-memory queue; a QueueListener thread writes them to
+    the console and to a rotating ``log_file`` (JSON lines unless
+    ``json_logs`` is False). ``rotate_when='external'`` leaves rotation to
+    logrotate. The level defaults per environment. Returns the listener,
+    which is stopped (and drained) at exit and restarted in forked worker
+    processes. Calling it again replaces the previous setup.
+    """
+    env = env or os.environ.get('APP_ENV', 'development')
+    level = (level or os.environ.get('LOG_LEVEL') or DEFAULT_LEVELS.get(env, 'INFO')).upper()
+    if json_logs is None:
+        json_logs = os.environ.get('LOG_JSON', '1') == '1'
+
+    handlers = []
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if env == 'production' and json_logs else logging.Formatter(TEXT_FORMAT))
+    handlers.append(console)
+
+    if log_file:
+        file_handler = _file_handler(log_file, max_bytes, backup_count, rotate_when)
+        file_handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    if _active['listener'] is not None:
+        _active['listener'].stop()
+    else:
+        atexit.register(_stop_listener)
+        os.register_at_fork(after_in_child=_restart_listener)
+    queue_handler = root.handlers[0]
+    _active.update(listener=listener, queue_handler=queue_handler)
+    listener.start()
+    return listener
+
+
+def _stop_listener():
+    if _active['listener'] is not None:
+        _active['listener'].stop()
+        _active['listener'] = None
+
+
+def _watched_handlers(handlers):
+    # Swap in-process rotation for a handler that only reopens the file once it has been moved
+    swapped = []
+    for handler in handlers:
+        if isinstance(handler, (logging.handlers.RotatingFileHandler,
+                                logging.handlers.TimedRotatingFileHandler)):
+            watched = logging.handlers.WatchedFileHandler(handler.baseFilename, encoding='utf-8', delay=True)
+            watched.setFormatter(handler.formatter)
+            watched.setLevel(handler.level)
+            handler.close()
+            handler = watched
+        swapped.append(handler)
+    return tuple(swapped)
+
+
+def stop_rotation():
+    """Stop rotating the log file in this process (e.g. the gunicorn master).
+
+    Several processes rotating one file each on their own rename it out from
+    under each other, so once workers are forked the file is only reopened
+    after it moves; rotate it with logrotate or log to stderr instead.
+    """
+    listener = _active['listener']
+    if listener is None:
+        return
+    listener.stop()
+    listener.handlers = _watched_handlers(listener.handlers)
+    listener._thread = None
+    listener.start()
+
+
+def _restart_listener():
+    # A forked worker inherits the queue handler but not the listener thread,
+    # and must not rotate a file its siblings are writing to as well
+    listener = _active['listener']
+    if listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _active['queue_handler'].queue = log_queue
+    listener.queue = log_queue
+    listener.handlers = _watched_handlers(listener.handlers)
+    listener._thread = None
+    listener.start()
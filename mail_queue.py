@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+
+from shared_state import MemorySharedState
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+SENDING = 'sending'
+RETRYING = 'retrying'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class MailQueue:
+    """Outbound mail queue delivered by a pool of background worker threads.
+
+    ``deliver(message)`` does the actual send and raises on failure. When
+    ``deliver_batch(messages)`` is given, a worker hands it up to
+    ``batch_size`` due messages at once (one SMTP session) and it returns
+    one exception or None per message. Failed sends are retried with
+    exponential backoff; errors listed in ``permanent_errors`` or running
+    out of retries move the message to the dead-letter list. Per-message status lives in ``state`` (a SharedState),
+    so any worker process can answer a status poll.
+    """
+
+    def __init__(self, deliver, workers=2, max_retries=3, backoff_base=2.0, backoff_max=60.0,
+                 permanent_errors=(), state=None, status_ttl=3600, dead_letter_size=1000,
+                 deliver_batch=None, batch_size=10):
+        self.deliver = deliver
+        self.deliver_batch = deliver_batch
+        self.batch_size = batch_size if deliver_batch else 1
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.permanent_errors = tuple(permanent_errors)
+        self.state = state or MemorySharedState()
+        self.status_ttl = status_ttl
+        self.dead_letters = deque(maxlen=dead_letter_size)
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._stopping = False
+
+    # ------------------ PUBLIC API ------------------
+    def enqueue(self, message, recipients=None):
+        """Queue ``message`` for delivery and return its id without blocking."""
+        self._ensure_started()
+        message_id = uuid.uuid4().hex
+        job = {'id': message_id, 'message': message, 'attempts': 0,
+               'recipients': list(recipients or getattr(message, 'recipients', []) or [])}
+        self._set_status(job, QUEUED)
+        with self._cond:
+            heapq.heappush(self._heap, (time.time(), next(self._seq), job))
+            self._cond.notify()
+        return message_id
+
+    def status(self, message_id):
+        raw = self.state.get(f"mail:{message_id}")
+        return json.loads(raw) if raw else None
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self, timeout=10.0):
+        """Deliver what is already due, then stop the workers."""
+        with self._cond:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        deadline = time.time() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(deadline - time.time(), 0))
+        with self._cond:
+            if self._heap:
+                logger.warning(f"Mail queue stopped with {len(self._heap)} undelivered message(s)")
+
+    # ------------------ WORKERS ------------------
+    def _ensure_started(self):
+        # Workers start on first use, and again in a forked worker process
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._heap = []
+                self._threads = []
+                self._cond = threading.Condition()
+            self._pid = os.getpid()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"mail-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_jobs(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    jobs = []
+                    while self._heap and self._heap[0][0] <= now and len(jobs) < self.batch_size:
+                        jobs.append(heapq.heappop(self._heap)[2])
+                    return jobs
+                if self._stopping:
+                    return None
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            jobs = self._next_jobs()
+            if jobs is None:
+                return
+            self._attempt(jobs)
+
+    def _attempt(self, jobs):
+        for job in jobs:
+            job['attempts'] += 1
+            self._set_status(job, SENDING)
+
+        if self.deliver_batch is None:
+            errors = []
+            for job in jobs:
+                try:
+                    self.deliver(job['message'])
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(e)
+        else:
+            try:
+                errors = self.deliver_batch([job['message'] for job in jobs])
+            except Exception as e:
+                # deliver_batch reports failures per message once anything may have been sent;
+                # raising means the whole batch failed before that (no connection, bad login)
+                errors = [e] * len(jobs)
+
+        for job, error in zip(jobs, errors):
+            if error is not None:
+                self._handle_failure(job, error)
+                continue
+            self._set_status(job, SENT)
+            logger.info(f"✅ Mail {job['id']} delivered to {', '.join(job['recipients'])}")
+
+    def _handle_failure(self, job, error):
+        job['error'] = f"{type(error).__name__}: {error}"
+        permanent = isinstance(error, self.permanent_errors)
+        if permanent or job['attempts'] > self.max_retries:
+            self._set_status(job, FAILED)
+            self.dead_letters.append({'id': job['id'], 'recipients': job['recipients'],
+                                      'attempts': job['attempts'], 'error': job['error'],
+                                      'failed_at': time.time()})
+            logger.error(f"✗ Mail {job['id']} dead-lettered after {job['attempts']} attempt(s): {job['error']}")
+            return
+
+        delay = min(self.backoff_base * (2 ** (job['attempts'] - 1)), self.backoff_max)
+        self._set_status(job, RETRYING, retry_in=delay)
+        logger.warning(f"Mail {job['id']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {job['error']}")
+        with self._cond:
+            heapq.heappush(self._heap, (time.time() + delay, next(self._seq), job))
+            self._cond.notify()
+
+    def _set_status(self, job, status, **extra):
+        record = {'id': job['id'], 'status': status, 'attempts': job['attempts'],
+                  'error': job.get('error'), 'updated_at': time.time(), **extra}
+        try:
+            self.state.set(f"mail:{job['id']}", json.dumps(record), ttl=self.status_ttl)
+        except Exception as e:
+            logger.error(f"Could not record status for mail {job['id']}: {e}")
@@ -0,0 +1,318 @@
+import os
+import time
+import cProfile
+import logging
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+from flask import g, request, Response, template_rendered, before_render_template
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # [per-bucket counts..., +Inf count, sum]
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        lines = []
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            snapshot = dict(self._values)
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+                for labels, value in sorted(snapshot.items())]
+
+
+class Gauge:
+    """Value read from ``fn`` at scrape time."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, fn):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def samples(self):
+        try:
+            return [f"{self.name} {_number(self.fn())}"]
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            return []
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering (a second create_app) replaces the old collector
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.get(name) or self.register(Histogram(name, documentation, label_names, buckets))
+
+    def counter(self, name, documentation, label_names=()):
+        return self._metrics.get(name) or self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, fn):
+        return self.register(Gauge(name, documentation, fn))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'cardwala_request_duration_seconds', 'Time spent handling a request.',
+    ('method', 'endpoint', 'status'))
+SPAN_SECONDS = REGISTRY.histogram(
+    'cardwala_span_duration_seconds', 'Time spent in named hot-path sections.', ('span',))
+PROFILED_REQUESTS = REGISTRY.counter(
+    'cardwala_profiled_requests_total', 'Sampled requests, and how many were slow enough to dump.', ('dumped',))
+
+
+# ------------------ SPANS ------------------
+class span:
+    """Time a block or a function into ``cardwala_span_duration_seconds{span=name}``.
+
+    Usable as ``with span('name'):`` or as a decorator. Inside a request the
+    span is also added to the per-request breakdown logged for slow requests.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._started = []
+
+    def __enter__(self):
+        self._started.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        record_span(self.name, time.perf_counter() - self._started.pop())
+
+    def __call__(self, fn):
+        name = self.name
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_span(name, time.perf_counter() - started)
+
+        return wrapper
+
+
+def record_span(name, elapsed):
+    SPAN_SECONDS.observe(elapsed, name)
+    try:
+        spans = g.get('_spans')
+    except RuntimeError:
+        return
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + elapsed
+
+
+# ------------------ PROFILER ------------------
+class SamplingProfiler:
+    """Profile every ``every``-th request; keep the profile only when it took ``slow_ms`` or more.
+
+    Uses pyinstrument when installed (speedscope JSON, loads straight into
+    https://www.speedscope.app) and cProfile otherwise (.prof, viewable with
+    snakeviz or flameprof).
+    """
+
+    def __init__(self, every, slow_ms=250, output_dir='profiles'):
+        self.every = every
+        self.slow_ms = slow_ms
+        self.output_dir = output_dir
+        self._count = 0
+        self._lock = threading.Lock()
+        self.backend = 'pyinstrument' if pyinstrument is not None else 'cprofile'
+
+    def should_sample(self):
+        with self._lock:
+            self._count += 1
+            return self._count % self.every == 0
+
+    def start(self):
+        """Returns the running profiler, or None when another request is already being profiled."""
+        try:
+            if self.backend == 'pyinstrument':
+                profiler = pyinstrument.Profiler(async_mode='disabled')
+                profiler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+        except (RuntimeError, ValueError) as e:
+            logger.debug(f"Skipping profile sample: {e}")
+            return None
+        return profiler
+
+    def finish(self, profiler, elapsed, label):
+        if self.backend == 'pyinstrument':
+            profiler.stop()
+        else:
+            profiler.disable()
+
+        slow = elapsed * 1000 >= self.slow_ms
+        PROFILED_REQUESTS.inc('yes' if slow else 'no')
+        if not slow:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}")
+        if self.backend == 'pyinstrument':
+            from pyinstrument.renderers import SpeedscopeRenderer
+            path = f"{stem}.speedscope.json"
+            with open(path, 'w') as f:
+                f.write(profiler.output(SpeedscopeRenderer()))
+        else:
+            path = f"{stem}.prof"
+            profiler.dump_stats(path)
+        return path
+
+
+# ------------------ FLASK WIRING ------------------
+def init_metrics(app, profile_every=0, profile_slow_ms=250, profile_dir='profiles', slow_request_ms=1000,
+                 view_decorator=None):
+    """Time every request, expose /metrics and optionally sample-profile requests.
+
+    ``view_decorator`` wraps the /metrics view, e.g. with an auth check.
+    Metrics are per process: with several gunicorn workers each scrape sees
+    one worker, so scrape them individually or aggregate with ``sum``.
+    """
+    profiler = SamplingProfiler(profile_every, profile_slow_ms, profile_dir) if profile_every else None
+
+    @app.before_request
+    def start_request_timer():
+        g._spans = {}
+        g._request_started = time.perf_counter()
+        if profiler is not None and profiler.should_sample():
+            active = profiler.start()
+            if active is not None:
+                g._profiler = active
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, request.method, endpoint, response.status_code)
+
+        active = g.pop('_profiler', None)
+        if active is not None:
+            path = profiler.finish(active, elapsed, endpoint)
+            if path:
+                logger.info(f"🔥 Profiled slow {request.method} {request.path} ({elapsed * 1000:.0f}ms): {path}")
+
+        if elapsed * 1000 >= slow_request_ms:
+            spans = ', '.join(f"{k}={v * 1000:.1f}ms" for k, v in g.get('_spans', {}).items())
+            logger.warning(f"🐢 Slow request {request.method} {request.path} took {elapsed * 1000:.0f}ms [{spans}]",
+                           extra={'event': 'slow_request', 'endpoint': endpoint,
+                                  'duration_ms': round(elapsed * 1000, 1)})
+        return response
+
+    def template_started(sender, template, context, **extra):
+        g._template_started = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        started = g.pop('_template_started', None)
+        if started is not None:
+            record_span(f"render:{template.name}", time.perf_counter() - started)
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    if view_decorator is not None:
+        metrics = view_decorator(metrics)
+    app.add_url_rule("/metrics", view_func=metrics)
+    return REGISTRY
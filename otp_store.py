@@ -0,0 +1,281 @@
+import os
+import hmac
+import time
+import heapq
+import hashlib
+import logging
+import threading
+
+from sqlite_util import SqliteConnections
+
+logger = logging.getLogger(__name__)
+
+MSG_MISSING = "Session expired. Please try again."
+MSG_EXPIRED = "OTP expired. Please request a new one."
+MSG_EXHAUSTED = "Maximum OTP attempts exceeded. Please request a new one."
+MSG_VERIFIED = "OTP verified successfully"
+
+
+class OtpStore:
+    """Outstanding OTPs keyed by (identity, purpose).
+
+    Only an HMAC of each code is kept, verification is constant-time and
+    the attempt counter is updated atomically. ``verify`` returns
+    ``(ok, message, finished)`` where ``finished`` means the OTP is gone
+    (expired or out of attempts) and a new one must be requested.
+    """
+
+    def __init__(self, secret, max_attempts=3):
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.max_attempts = max_attempts
+        self._sweeper = None
+        self._sweep_interval = None
+
+    def _digest(self, identity, purpose, otp):
+        return hmac.new(self.secret, f"{purpose}:{identity}:{otp}".encode('utf-8'),
+                        hashlib.sha256).hexdigest()
+
+    def _check(self, identity, purpose, otp, otp_hash):
+        return hmac.compare_digest(self._digest(identity, purpose, otp), otp_hash)
+
+    def _mismatch_message(self, attempts):
+        return f"Invalid OTP. {self.max_attempts - attempts} attempt(s) remaining."
+
+    def issue(self, identity, purpose, otp, ttl):
+        raise NotImplementedError
+
+    def verify(self, identity, purpose, otp):
+        raise NotImplementedError
+
+    def discard(self, identity, purpose):
+        raise NotImplementedError
+
+    def sweep(self):
+        """Drop expired entries. Returns how many were removed."""
+        return 0
+
+    def close(self):
+        pass
+
+    def start_sweeper(self, interval=30):
+        """Sweep every ``interval`` seconds on a daemon thread (restarted in forked workers)."""
+        if self._sweeper is not None:
+            return
+        if self._sweep_interval is None:
+            os.register_at_fork(after_in_child=self._restart_sweeper)
+        self._sweep_interval = interval
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    removed = self.sweep()
+                    if removed:
+                        logger.debug(f"OTP sweep removed {removed} expired code(s)")
+                except Exception as e:
+                    logger.error(f"OTP sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="otp-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _restart_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper = None
+            self.start_sweeper(self._sweep_interval)
+
+
+# ------------------ IN-PROCESS BACKEND ------------------
+class MemoryOtpStore(OtpStore):
+    """Single-process store; expiry is tracked in a min-heap so a sweep costs O(log n) per expired code."""
+
+    def __init__(self, secret, max_attempts=3):
+        super().__init__(secret, max_attempts)
+        self._entries = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def issue(self, identity, purpose, otp, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._entries[(identity, purpose)] = [self._digest(identity, purpose, otp), expires_at, 0]
+            heapq.heappush(self._heap, (expires_at, identity, purpose))
+            self._sweep_locked(time.time())
+
+    def verify(self, identity, purpose, otp):
+        key = (identity, purpose)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, MSG_MISSING, True
+            otp_hash, expires_at, attempts = entry
+            if time.time() > expires_at:
+                del self._entries[key]
+                return False, MSG_EXPIRED, True
+            if attempts >= self.max_attempts:
+                del self._entries[key]
+                return False, MSG_EXHAUSTED, True
+            if not self._check(identity, purpose, otp, otp_hash):
+                entry[2] = attempts + 1
+                return False, self._mismatch_message(entry[2]), False
+            return True, MSG_VERIFIED, False
+
+    def discard(self, identity, purpose):
+        with self._lock:
+            self._entries.pop((identity, purpose), None)
+
+    def _sweep_locked(self, now):
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, identity, purpose = heapq.heappop(self._heap)
+            entry = self._entries.get((identity, purpose))
+            # A re-issued code leaves its old heap slot behind; only drop the live one
+            if entry is not None and entry[1] == expires_at:
+                del self._entries[(identity, purpose)]
+                removed += 1
+        return removed
+
+    def sweep(self):
+        with self._lock:
+            return self._sweep_locked(time.time())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ------------------ SQLITE BACKEND ------------------
+class SqliteOtpStore(OtpStore):
+    """Cross-process store; attempts are updated inside BEGIN IMMEDIATE and expiry uses an index."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS otps (
+            identity   TEXT NOT NULL,
+            purpose    TEXT NOT NULL,
+            otp_hash   TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            attempts   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (identity, purpose)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS otps_expires_at ON otps (expires_at);
+    """
+
+    def __init__(self, path, secret, max_attempts=3, timeout=5.0):
+        super().__init__(secret, max_attempts)
+        self.path = path
+        self.timeout = timeout
+        self._connections = SqliteConnections(path, timeout)
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        return self._connections.get()
+
+    def issue(self, identity, purpose, otp, ttl):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO otps (identity, purpose, otp_hash, expires_at, attempts) "
+            "VALUES (?, ?, ?, ?, 0)",
+            (identity, purpose, self._digest(identity, purpose, otp), time.time() + ttl)
+        )
+
+    def verify(self, identity, purpose, otp):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = self._verify_locked(conn, identity, purpose, otp)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _verify_locked(self, conn, identity, purpose, otp):
+        row = conn.execute(
+            "SELECT otp_hash, expires_at, attempts FROM otps WHERE identity = ? AND purpose = ?",
+            (identity, purpose)
+        ).fetchone()
+        if row is None:
+            return False, MSG_MISSING, True
+        otp_hash, expires_at, attempts = row
+        if time.time() > expires_at or attempts >= self.max_attempts:
+            conn.execute("DELETE FROM otps WHERE identity = ? AND purpose = ?", (identity, purpose))
+            return False, MSG_EXPIRED if time.time() > expires_at else MSG_EXHAUSTED, True
+        if not self._check(identity, purpose, otp, otp_hash):
+            conn.execute("UPDATE otps SET attempts = attempts + 1 WHERE identity = ? AND purpose = ?",
+                         (identity, purpose))
+            return False, self._mismatch_message(attempts + 1), False
+        return True, MSG_VERIFIED, False
+
+    def discard(self, identity, purpose):
+        self._conn().execute("DELETE FROM otps WHERE identity = ? AND purpose = ?", (identity, purpose))
+
+    def sweep(self):
+        return self._conn().execute("DELETE FROM otps WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        self._connections.close()
+
+
+# ------------------ REDIS BACKEND ------------------
+class RedisOtpStore(OtpStore):
+    """One Redis hash per code; Redis TTLs do the expiry sweep.
+
+    ``verify`` reads, checks and counts the attempt in one WATCH/MULTI
+    transaction. Concurrent guesses from several workers conflict and are
+    retried against the updated counter, so no more than ``max_attempts``
+    of them are ever checked.
+    """
+
+    GRACE_SECONDS = 300
+
+    def __init__(self, client, secret, max_attempts=3, prefix='cardwala:otp:'):
+        super().__init__(secret, max_attempts)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, identity, purpose):
+        return f"{self.prefix}{purpose}:{identity}"
+
+    def issue(self, identity, purpose, otp, ttl):
+        key = self._key(identity, purpose)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={'hash': self._digest(identity, purpose, otp),
+                                'expires_at': time.time() + ttl, 'attempts': 0})
+        # Keep the entry a little past expiry so the user is told it expired
+        pipe.expire(key, int(ttl) + self.GRACE_SECONDS)
+        pipe.execute()
+
+    def verify(self, identity, purpose, otp):
+        key = self._key(identity, purpose)
+
+        def attempt(pipe):
+            entry = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                     for k, v in pipe.hgetall(key).items()}
+            if 'hash' not in entry:
+                return False, MSG_MISSING, True
+            attempts = int(entry['attempts'])
+            if time.time() > float(entry['expires_at']) or attempts >= self.max_attempts:
+                pipe.multi()
+                pipe.delete(key)
+                return False, MSG_EXPIRED if time.time() > float(entry['expires_at']) else MSG_EXHAUSTED, True
+            if not self._check(identity, purpose, otp, entry['hash']):
+                pipe.multi()
+                pipe.hincrby(key, 'attempts', 1)
+                return False, self._mismatch_message(attempts + 1), False
+            return True, MSG_VERIFIED, False
+
+        # Retried by redis-py whenever another worker touched the key between the read and the write
+        return self.client.transaction(attempt, key, value_from_callable=True)
+
+    def discard(self, identity, purpose):
+        self.client.delete(self._key(identity, purpose))
+
+
+def create_otp_store(url, secret, max_attempts=3):
+    """Build a store from ``memory://``, ``sqlite:///path.db`` or a redis URL."""
+    if url.startswith('memory://'):
+        return MemoryOtpStore(secret, max_attempts)
+    if url.startswith('sqlite:///'):
+        return SqliteOtpStore(url[len('sqlite:///'):], secret, max_attempts)
+    if url.startswith(('redis://', 'rediss://', 'unix://', 'fakeredis://')):
+        from shared_state import redis_client_from_url
+        return RedisOtpStore(redis_client_from_url(url), secret, max_attempts)
+    raise ValueError(f"Unsupported OTP store URL: {url}")
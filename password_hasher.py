@@ -0,0 +1,167 @@
+import os
+import time
+import socket
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from importlib.metadata import version as package_version
+
+from werkzeug import security
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('pbkdf2', 'scrypt')
+# Calibration never goes below werkzeug's own defaults, however slow the machine
+PBKDF2_MIN_ITERATIONS = getattr(security, 'DEFAULT_PBKDF2_ITERATIONS', 1000000)
+PBKDF2_STEP = 10000
+SCRYPT_MIN_N = 2 ** 15
+# Calibration stops here whatever the target: 64 MiB per hash, times every hash running at once
+SCRYPT_MAX_N = 2 ** 16
+CALIBRATION_PASSWORD = 'calibration-Passw0rd!'
+CALIBRATION_TTL = 24 * 3600
+
+
+# Module-level so the pool's worker processes can unpickle them
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(hashed, password):
+    return check_password_hash(hashed, password)
+
+
+def _time_method(method):
+    started = time.perf_counter()
+    generate_password_hash(CALIBRATION_PASSWORD, method=method)
+    return time.perf_counter() - started
+
+
+class PasswordHasher:
+    """Password hashing with a calibrated work factor, run off the request thread.
+
+    ``calibrate`` picks the PBKDF2 iteration count (or scrypt N) that takes
+    about ``target_ms`` on this machine. The result is stored in ``state``
+    when given, keyed by host and werkzeug version and kept for
+    ``CALIBRATION_TTL`` seconds, so the workers on one machine agree on one
+    setting and a hardware or library change is picked up. The result is
+    never below werkzeug's defaults. ``needs_rehash`` tells the login path to
+    upgrade a hash made with another method or a lower work factor.
+
+    With ``workers`` > 0 hashing runs in a process pool (spawned, so it is
+    safe to create from a threaded or forked web worker); at most
+    ``max_pending`` calls wait on it at once and the rest block, so a
+    login storm queues here instead of piling onto the web threads.
+    """
+
+    def __init__(self, method='scrypt', target_ms=250, work_factor=None, workers=0,
+                 max_pending=None, state=None, timeout=30.0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown password hash method: {method}")
+        self.method = method
+        self.target_ms = target_ms
+        self.work_factor = work_factor
+        self.workers = workers
+        self.state = state
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending or max(workers, 1) * 4)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    # ------------------ PARAMETERS ------------------
+    def method_string(self, work_factor=None):
+        work_factor = work_factor or self.work_factor
+        if self.method == 'scrypt':
+            return f"scrypt:{work_factor}:8:1"
+        return f"pbkdf2:sha256:{work_factor}"
+
+    def _measure(self):
+        target = self.target_ms / 1000.0
+        if self.method == 'scrypt':
+            n = SCRYPT_MIN_N
+            # scrypt time doubles with N; stop at the last power of two under the target
+            while n < SCRYPT_MAX_N and _time_method(self.method_string(n * 2)) <= target:
+                n *= 2
+            return n
+        probe = PBKDF2_MIN_ITERATIONS
+        elapsed = min(_time_method(self.method_string(probe)) for _ in range(3))
+        iterations = int(probe * target / elapsed)
+        # Coarse steps so two workers calibrating side by side land on the same value
+        return max(PBKDF2_MIN_ITERATIONS, iterations // PBKDF2_STEP * PBKDF2_STEP)
+
+    def calibration_key(self):
+        return (f"password_hash:{self.method}:{self.target_ms}:{socket.gethostname()}:"
+                f"{package_version('werkzeug')}")
+
+    def calibrate(self):
+        """Pick the work factor for ``target_ms`` (unless one was configured). Returns it."""
+        if self.work_factor:
+            floor = SCRYPT_MIN_N if self.method == 'scrypt' else PBKDF2_MIN_ITERATIONS
+            if self.work_factor < floor:
+                logger.warning(f"⚠️ PASSWORD_HASH_WORK_FACTOR {self.work_factor} is below the "
+                               f"werkzeug default ({floor}) for {self.method}")
+            return self.work_factor
+        key = self.calibration_key()
+        stored = self.state.get(key) if self.state is not None else None
+        if stored:
+            self.work_factor = int(stored)
+        else:
+            started = time.perf_counter()
+            self.work_factor = self._measure()
+            if self.state is not None:
+                self.state.set(key, str(self.work_factor), ttl=CALIBRATION_TTL)
+            logger.info(f"🔐 Password hashing calibrated to {self.method_string()} "
+                        f"in {time.perf_counter() - started:.1f}s (target {self.target_ms}ms)")
+        return self.work_factor
+
+    def needs_rehash(self, hashed):
+        """True for hashes made with another method or a lower work factor than ours.
+
+        Only upgrades: a hash stronger than the current setting (e.g. made on a
+        faster host) is left alone, so hosts with different calibrations don't
+        keep rewriting each other's hashes.
+        """
+        if not self.work_factor:
+            return False
+        parts = hashed.split('$', 1)[0].split(':')
+        try:
+            if parts[0] != self.method:
+                return True
+            factor = int(parts[1]) if self.method == 'scrypt' else int(parts[2])
+        except (IndexError, ValueError):
+            return True
+        return factor < self.work_factor
+
+    # ------------------ HASHING ------------------
+    def _pool(self):
+        # Never reuse a pool inherited across fork; its worker pipes belong to the parent
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._slots:
+            return self._pool().submit(fn, *args).result(timeout=self.timeout)
+
+    def hash(self, password):
+        if not self.work_factor:
+            self.calibrate()
+        return self._run(_hash, password, self.method_string())
+
+    def verify(self, hashed, password):
+        return self._run(_verify, hashed, password)
+
+    def close(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._executor_pid = None
@@ -0,0 +1,35 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowRateLimiter:
+    """Sliding-window counter over a SharedState backend.
+
+    Each key keeps two fixed-window counters (current and previous). The
+    request count for the trailing window is estimated as
+    ``previous * overlap + current``, so a check costs one ``incr`` and one
+    ``get`` regardless of how many hits the key has seen. Counters expire
+    after two windows, so idle keys are reclaimed by the backend's TTLs.
+    """
+
+    def __init__(self, state, prefix='rate:'):
+        self.state = state
+        self.prefix = prefix
+
+    def hit(self, key, max_attempts, window):
+        """Record one attempt. Returns ``(allowed, retry_after_seconds)``."""
+        now = time.time()
+        bucket = int(now // window)
+        elapsed = now - bucket * window
+
+        current = self.state.incr(f"{self.prefix}{key}:{bucket}", ttl=window * 2)
+        previous = int(self.state.get(f"{self.prefix}{key}:{bucket - 1}") or 0)
+        estimated = previous * (1 - elapsed / window) + current
+
+        if estimated > max_attempts:
+            retry_after = int(window - elapsed) + 1
+            logger.debug(f"Rate limit hit for {key}: ~{estimated:.1f}/{max_attempts}")
+            return False, retry_after
+        return True, 0
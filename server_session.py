@@ -0,0 +1,117 @@
+import logging
+from datetime import timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+import tokengenerator
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session whose data lives in a SharedState backend; the cookie only holds its id."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh id (call on login to prevent session fixation)."""
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = tokengenerator.token_urlsafe(32)
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface over a SharedState (memory, SQLite or Redis).
+
+    Entries carry a TTL (the permanent session lifetime, or ``idle_ttl`` for
+    browser-session cookies), so abandoned sessions are evicted lazily by
+    the backend. Unmodified sessions are never written back.
+    """
+
+    serializer = TaggedJSONSerializer()
+    salt = 'cardwala-session-id'
+
+    def __init__(self, state, prefix='session:', idle_ttl=timedelta(hours=24)):
+        self.state = state
+        self.prefix = prefix
+        self.idle_ttl = idle_ttl
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _new_session(self):
+        return ServerSideSession(sid=tokengenerator.token_urlsafe(32), new=True)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self._new_session()
+
+        try:
+            sid = self._signer(app).unsign(cookie).decode('utf-8')
+        except BadSignature:
+            return self._new_session()
+
+        try:
+            raw = self.state.get(self.prefix + sid)
+        except Exception as e:
+            logger.error(f"Session store read failed: {e}")
+            raw = None
+        if raw is None:
+            return self._new_session()
+        return ServerSideSession(self.serializer.loads(raw), sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.previous_sid:
+            self.state.delete(self.prefix + session.previous_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self.state.delete(self.prefix + session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add("Cookie")
+            return
+
+        if not session.modified:
+            return
+
+        lifetime = app.permanent_session_lifetime if session.permanent else self.idle_ttl
+        self.state.set(self.prefix + session.sid, self.serializer.dumps(dict(session)),
+                       ttl=int(lifetime.total_seconds()))
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add("Cookie")
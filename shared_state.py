@@ -0,0 +1,304 @@
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from sqlite_util import SqliteConnections
+
+logger = logging.getLogger(__name__)
+
+# Only the rate limiter's counters count towards ``max_keys``: one client can mint
+# them at will, while sessions, OTPs and captchas must live until they expire
+CAPPED_PREFIX = 'rate:'
+
+
+class SharedState:
+    """Key/value state with TTLs and atomic counters, shared by all workers.
+
+    Values are strings. ``ttl`` is in seconds; ``incr`` only applies the TTL
+    when it creates the key, like Redis ``INCR`` followed by ``EXPIRE NX``.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def pop(self, key):
+        """Delete ``key`` and return its value (None when missing or expired), atomically:
+        of several concurrent callers only one gets the value."""
+        raise NotImplementedError
+
+    def incr(self, key, amount=1, ttl=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# ------------------ IN-PROCESS BACKEND ------------------
+class MemorySharedState(SharedState):
+    """Single-process backend. Only correct with one worker; use for dev and tests.
+
+    Memory is bounded: keys past their TTL are dropped as they reach the
+    least-recently-used end, and once ``max_keys`` keys under
+    ``capped_prefix`` (rate-limit counters) are tracked, the LRU one of those
+    is evicted. Other keys are never evicted, only expired, so a flood of
+    rate-limit keys can't log anyone out.
+    """
+
+    SWEEP_BATCH = 8
+
+    def __init__(self, max_keys=100000, capped_prefix=CAPPED_PREFIX):
+        self.max_keys = max_keys
+        self.capped_prefix = capped_prefix
+        self._capped = OrderedDict()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _table(self, key):
+        return self._capped if key.startswith(self.capped_prefix) else self._data
+
+    def _live(self, key, now):
+        table = self._table(key)
+        item = table.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= now:
+            del table[key]
+            return None
+        table.move_to_end(key)
+        return value
+
+    def _store(self, key, value, expires_at, now):
+        table = self._table(key)
+        table[key] = (value, expires_at)
+        table.move_to_end(key)
+
+        # Reclaim a few idle entries from the LRU end on every write
+        for _ in range(self.SWEEP_BATCH):
+            oldest_key, (_, oldest_expiry) = next(iter(table.items()))
+            if oldest_key == key or oldest_expiry is None or oldest_expiry > now:
+                break
+            del table[oldest_key]
+
+        while len(self._capped) > self.max_keys:
+            self._capped.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data) + len(self._capped)
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key, time.time())
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now + ttl if ttl else None, now)
+
+    def delete(self, key):
+        with self._lock:
+            self._table(key).pop(key, None)
+
+    def pop(self, key):
+        with self._lock:
+            value = self._live(key, time.time())
+            if value is not None:
+                del self._table(key)[key]
+            return value
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._lock:
+            value = self._live(key, now)
+            if value is None:
+                expires_at = now + ttl if ttl else None
+                count = amount
+            else:
+                expires_at = self._table(key)[key][1]
+                count = int(value) + amount
+            self._store(key, str(count), expires_at, now)
+            return count
+
+
+# ------------------ SQLITE BACKEND ------------------
+class SqliteSharedState(SharedState):
+    """Cross-process backend for workers on one host, backed by a SQLite (WAL) file.
+
+    Every ``purge_interval`` seconds a write deletes expired rows and, past
+    ``max_keys`` rate-limit counters, the ones closest to expiry.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS kv (
+            key        TEXT PRIMARY KEY,
+            value      TEXT NOT NULL,
+            expires_at REAL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at);
+    """
+
+    def __init__(self, path, timeout=5.0, purge_interval=60, max_keys=100000, capped_prefix=CAPPED_PREFIX):
+        self.path = path
+        self.timeout = timeout
+        self.purge_interval = purge_interval
+        self.max_keys = max_keys
+        # Prefix match as a primary-key range: ':' + 1 is ';'
+        self._capped_range = (capped_prefix, capped_prefix[:-1] + chr(ord(capped_prefix[-1]) + 1))
+        self._next_purge = 0
+        self._connections = SqliteConnections(path, timeout)
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        return self._connections.get()
+
+    def _maybe_purge(self, conn, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        if not self.max_keys:
+            return
+        low, high = self._capped_range
+        capped = conn.execute("SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ?", (low, high)).fetchone()[0]
+        if capped > self.max_keys:
+            conn.execute(
+                "DELETE FROM kv WHERE key IN (SELECT key FROM kv WHERE key >= ? AND key < ? "
+                "ORDER BY expires_at LIMIT ?)", (low, high, capped - self.max_keys))
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, now + ttl if ttl else None)
+        )
+        self._maybe_purge(conn, now)
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def pop(self, key):
+        now = time.time()
+        conn = self._conn()
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            row = conn.execute("DELETE FROM kv WHERE key = ? RETURNING value, expires_at", (key,)).fetchone()
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+                conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return row[0]
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                count, expires_at = amount, (now + ttl if ttl else None)
+            else:
+                count, expires_at = int(row[0]) + amount, row[1]
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, str(count), expires_at)
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._maybe_purge(conn, now)
+        return count
+
+    def close(self):
+        self._connections.close()
+
+
+# ------------------ REDIS BACKEND ------------------
+class RedisSharedState(SharedState):
+    """Adapter over any redis-py compatible client (redis.Redis, fakeredis.FakeRedis)."""
+
+    def __init__(self, client, prefix='cardwala:'):
+        self.client = client
+        self.prefix = prefix
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        return value
+
+    def get(self, key):
+        return self._decode(self.client.get(self.prefix + key))
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def pop(self, key):
+        # GETDEL needs Redis 6.2+
+        return self._decode(self.client.getdel(self.prefix + key))
+
+    def incr(self, key, amount=1, ttl=None):
+        key = self.prefix + key
+        if not ttl:
+            return int(self.client.incrby(key, amount))
+        # One MULTI: the key is created with its TTL, so a crash can't leave a counter that never expires
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(key, 0, ex=int(ttl), nx=True)
+        pipe.incrby(key, amount)
+        return int(pipe.execute()[-1])
+
+    def close(self):
+        self.client.close()
+
+
+def redis_client_from_url(url):
+    if url.startswith('fakeredis://'):
+        import fakeredis
+        return fakeredis.FakeRedis()
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("The redis package is required for redis:// shared state (pip install redis)")
+    return redis.Redis.from_url(url)
+
+
+def create_shared_state(url, max_keys=100000):
+    """Build a backend from ``memory://``, ``sqlite:///path.db``, ``redis://...`` or ``fakeredis://``.
+
+    ``max_keys`` caps rate-limit counters only; Redis relies on TTLs and its own maxmemory policy.
+    """
+    if url.startswith('memory://'):
+        return MemorySharedState(max_keys=max_keys)
+    if url.startswith('sqlite:///'):
+        return SqliteSharedState(url[len('sqlite:///'):], max_keys=max_keys)
+    if url.startswith(('redis://', 'rediss://', 'unix://', 'fakeredis://')):
+        return RedisSharedState(redis_client_from_url(url))
+    raise ValueError(f"Unsupported shared state URL: {url}")
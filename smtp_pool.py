@@ -0,0 +1,201 @@
+import time
+import smtplib
+import logging
+import threading
+from collections import deque
+
+from flask_mail import sanitize_address, sanitize_addresses
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP sessions open between sends.
+
+    Idle connections are reused LIFO. One idle for longer than
+    ``health_check_after`` seconds is probed with NOOP before use, and one
+    idle past ``max_idle`` is closed instead of reused. A server-side
+    disconnect mid-send is retried once on a fresh connection.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, use_ssl=False,
+                 timeout=30, max_size=4, health_check_after=30, max_idle=240, debug=False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_size = max_size
+        self.health_check_after = health_check_after
+        self.max_idle = max_idle
+        self.debug = debug
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._stats = {
+            'connections_created': 0,
+            'connections_reused': 0,
+            'reconnects': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'sessions': 0,
+            'messages_sent': 0,
+            'send_errors': 0,
+        }
+
+    # ------------------ CONNECTIONS ------------------
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _connect(self):
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        conn.set_debuglevel(int(self.debug))
+        if self.use_tls:
+            conn.starttls()
+        if self.username and self.password:
+            conn.login(self.username, self.password)
+        self._count('connections_created')
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _connection_lost(error):
+        # SMTPException subclasses OSError; a refused recipient or rejected DATA is an answer
+        # from a healthy session (smtplib has already sent RSET), so only a dropped link or a
+        # socket error closes the connection
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    def _healthy(self, conn):
+        self._count('health_checks')
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    return self._connect()
+
+                conn, last_used = item
+                idle_for = time.time() - last_used
+                if idle_for > self.max_idle:
+                    self._discard(conn)
+                    continue
+                if idle_for > self.health_check_after and not self._healthy(conn):
+                    self._count('health_check_failures')
+                    self._discard(conn)
+                    continue
+                self._count('connections_reused')
+                return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable=True):
+        if reusable:
+            with self._lock:
+                self._idle.append((conn, time.time()))
+        else:
+            self._discard(conn)
+        self._slots.release()
+
+    # ------------------ SENDING ------------------
+    @staticmethod
+    def _sendmail(conn, message):
+        if message.date is None:
+            message.date = time.time()
+        conn.sendmail(
+            sanitize_address(message.sender),
+            list(sanitize_addresses(message.send_to)),
+            message.as_bytes(),
+            message.mail_options,
+            message.rcpt_options,
+        )
+
+    def send(self, message):
+        error = self.send_many([message])[0]
+        if error is not None:
+            raise error
+
+    def send_many(self, messages):
+        """Send ``messages`` over one session. Returns one error (or None) per message.
+
+        Raises only when no session can be opened, before anything is sent.
+        After that every failure is reported per message, so a caller retries
+        just the messages that failed and never resends one the server took.
+        """
+        conn = self._acquire()
+        self._count('sessions')
+        errors = []
+        for index, message in enumerate(messages):
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception as e:
+                    # The rest of the batch can't go out; none of it was sent
+                    unsent = len(messages) - index
+                    self._count('send_errors', unsent)
+                    errors.extend([e] * unsent)
+                    break
+            try:
+                try:
+                    self._sendmail(conn, message)
+                except smtplib.SMTPServerDisconnected:
+                    logger.info("SMTP server dropped the connection, reconnecting")
+                    self._count('reconnects')
+                    self._discard(conn)
+                    conn = None
+                    conn = self._connect()
+                    self._sendmail(conn, message)
+            except Exception as e:
+                self._count('send_errors')
+                errors.append(e)
+                if conn is not None and self._connection_lost(e):
+                    self._discard(conn)
+                    conn = None
+                continue
+            self._count('messages_sent')
+            errors.append(None)
+
+        if conn is None:
+            self._slots.release()
+        else:
+            self._release(conn)
+        return errors
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle_connections'] = len(self._idle)
+        opened = stats['connections_created'] + stats['connections_reused']
+        stats['reuse_ratio'] = round(stats['connections_reused'] / opened, 3) if opened else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_state import MemorySharedState, SqliteSharedState, RedisSharedState
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip('fakeredis')
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def shared_state(request, tmp_path):
+    if request.param == 'memory':
+        state = MemorySharedState()
+    elif request.param == 'sqlite':
+        state = SqliteSharedState(str(tmp_path / 'state.db'))
+    else:
+        state = RedisSharedState(request.getfixturevalue('redis_client'))
+    yield state
+    state.close()
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """create_app with every file and store under tmp_path; keyword arguments override the config"""
+    monkeypatch.setenv('SECRET_KEY', 'test-secret')
+    apps = []
+
+    def factory(env='testing', **overrides):
+        from app import create_app
+        config = {
+            'APP_ENV': env,
+            'LOG_FILE': None,
+            'SHARED_STATE_URL': 'memory://', 'SESSION_STORE_URL': 'memory://', 'OTP_STORE_URL': 'memory://',
+            'USERS_DB': str(tmp_path / 'users.db'), 'USERS_FILE': str(tmp_path / 'users.json'),
+            'USER_WRITE_BEHIND': False,
+            'CARD_CACHE_DIR': str(tmp_path / 'card_cache'), 'CARD_JOB_DIR': str(tmp_path / 'card_jobs'),
+            'PROFILE_DIR': str(tmp_path / 'profiles'),
+            'SESSION_COOKIE_SECURE': False,
+            'MAIL_USERNAME': '', 'MAIL_SUPPRESS_SEND': True,
+            # Pinned low so tests skip calibration; production never goes below werkzeug's defaults
+            'PASSWORD_HASH_WORK_FACTOR': 2 ** 14, 'PASSWORD_HASH_WORKERS': 0,
+            'CAPTCHA_POOL_SIZE': 0,
+            **overrides,
+        }
+        app = create_app(config)
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        app.extensions['cardwala'].close()
+
+
+def solve_captcha(client, app, scope):
+    """Issue a captcha through the API with a known answer; returns the answer"""
+    captcha = app.extensions['cardwala'].captcha
+    captcha._render = lambda: ('ABCDE', b'png')
+    assert client.get(f'/api/v1/auth/captcha/{scope}').status_code == 200
+    return 'ABCDE'
@@ -0,0 +1,155 @@
+import re
+import concurrent.futures
+
+import pytest
+
+from conftest import solve_captcha
+
+
+def signup(client, app, identity='new@example.com'):
+    answer = solve_captcha(client, app, 'signup')
+    return client.post('/api/v1/auth/signup', json={'email_mobile': identity, 'captcha': answer})
+
+
+def test_signup_and_verify_create_an_account(make_app):
+    app = make_app()
+    client = app.test_client()
+    response = signup(client, app, 'New@Example.com')
+    body = response.get_json()
+    # Testing mode: no mail server, so the undelivered code comes back in the message
+    assert response.status_code == 200
+    assert body['code'] == 'otp_not_delivered'
+    otp = re.search(r'(\d{6})', body['message']).group(1)
+
+    response = client.post('/api/v1/auth/verify-otp', json={
+        'otp': otp, 'password': 'Str0ng!Passw0rd', 'confirm_password': 'Str0ng!Passw0rd'})
+    assert response.status_code == 200
+    assert response.get_json()['code'] == 'account_created'
+    assert client.get('/api/v1/auth/session').get_json()['user'] == 'new@example.com'
+    assert 'new@example.com' in app.extensions['cardwala'].users
+
+
+def test_errors_carry_a_code_and_status(make_app):
+    app = make_app()
+    client = app.test_client()
+    response = client.post('/api/v1/auth/signup', json={'email_mobile': 'a@example.com', 'captcha': 'nope'})
+    assert response.status_code == 400
+    assert response.get_json()['code'] == 'captcha_invalid'
+
+    response = client.post('/api/v1/auth/verify-otp', json={'otp': '123456'})
+    assert response.status_code == 401
+    assert response.get_json()['code'] == 'session_expired'
+
+    response = client.get('/api/v1/auth/nothing-here')
+    assert response.status_code == 404
+    assert response.get_json()['code'] == 'not_found'
+
+
+def test_wrong_otp_counts_down(make_app):
+    app = make_app()
+    client = app.test_client()
+    signup(client, app)
+    codes = [client.post('/api/v1/auth/verify-otp', json={'otp': '000000'}).get_json()['code']
+             for _ in range(4)]
+    assert codes == ['otp_invalid', 'otp_invalid', 'otp_invalid', 'otp_attempts_exceeded']
+
+
+def test_form_route_answers_json_when_asked(make_app):
+    app = make_app()
+    client = app.test_client()
+    response = client.post('/verify-otp', data={'otp': '1'}, headers={'Accept': 'application/json'})
+    assert response.status_code == 401
+    assert response.get_json()['code'] == 'session_expired'
+    response = client.post('/verify-otp', data={'otp': '1'})
+    assert response.status_code == 302
+
+
+def test_rate_limited_requests_get_429(make_app):
+    app = make_app()
+    client = app.test_client()
+    for _ in range(10):
+        client.post('/api/v1/auth/login', json={'email_mobile': 'a@example.com', 'captcha': 'x'})
+    response = client.post('/api/v1/auth/login', json={'email_mobile': 'a@example.com', 'captcha': 'x'})
+    assert response.status_code == 429
+    assert response.get_json()['code'] == 'rate_limited'
+
+
+@pytest.mark.parametrize('resend_path', ['/resend-otp', '/api/v1/auth/resend-otp'])
+def test_undelivered_otp_is_not_shown_in_production(make_app, resend_path):
+    app = make_app('production')
+    assert not app.debug and not app.testing
+    client = app.test_client()
+    response = signup(client, app)
+    assert response.status_code == 503
+    assert response.get_json()['code'] == 'otp_delivery_failed'
+    assert not re.search(r'\d{6}', response.get_data(as_text=True))
+
+    response = client.post(resend_path)
+    assert response.status_code == 503
+    assert response.get_json()['code'] == 'otp_delivery_failed'
+    assert not re.search(r'\d{6}', response.get_data(as_text=True))
+
+
+def test_undelivered_resend_shows_the_otp_when_testing(make_app):
+    app = make_app()
+    client = app.test_client()
+    signup(client, app)
+    body = client.post('/api/v1/auth/resend-otp').get_json()
+    assert body['code'] == 'otp_not_delivered'
+    otp = re.search(r'(\d{6})', body['message']).group(1)
+    assert client.post('/api/v1/auth/verify-otp', json={'otp': otp}).get_json()['code'] == 'password_required'
+
+
+def test_resend_without_a_pending_otp(make_app):
+    client = make_app().test_client()
+    response = client.post('/api/v1/auth/resend-otp')
+    assert response.status_code == 401
+    assert response.get_json()['code'] == 'session_expired'
+
+
+def test_cancel_and_logout(make_app):
+    app = make_app()
+    client = app.test_client()
+    signup(client, app)
+    assert client.post('/api/v1/auth/cancel-otp').get_json() == {'success': True, 'code': 'otp_cancelled'}
+    assert client.get('/api/v1/auth/session').get_json()['otp_pending'] is False
+    assert client.post('/api/v1/auth/logout').get_json()['code'] == 'logged_out'
+
+
+def time_out(*args):
+    raise concurrent.futures.TimeoutError()
+
+
+def test_busy_hasher_answers_503_and_the_otp_still_works(make_app, monkeypatch):
+    app = make_app()
+    client = app.test_client()
+    otp = re.search(r'(\d{6})', signup(client, app).get_json()['message']).group(1)
+    form = {'otp': otp, 'password': 'Str0ng!Passw0rd', 'confirm_password': 'Str0ng!Passw0rd'}
+
+    hasher = app.extensions['cardwala'].password_hasher
+    monkeypatch.setattr(hasher, 'hash', time_out)
+    response = client.post('/api/v1/auth/verify-otp', json=form)
+    assert response.status_code == 503
+    assert response.get_json()['code'] == 'busy'
+    assert response.headers['Retry-After'] == '5'
+
+    monkeypatch.undo()
+    assert client.post('/api/v1/auth/verify-otp', json=form).get_json()['code'] == 'account_created'
+
+
+def test_busy_hasher_on_password_login(make_app, monkeypatch):
+    app = make_app()
+    client = app.test_client()
+    otp = re.search(r'(\d{6})', signup(client, app).get_json()['message']).group(1)
+    client.post('/api/v1/auth/verify-otp', json={
+        'otp': otp, 'password': 'Str0ng!Passw0rd', 'confirm_password': 'Str0ng!Passw0rd'})
+    client.post('/api/v1/auth/logout')
+
+    monkeypatch.setattr(app.extensions['cardwala'].password_hasher, 'verify', time_out)
+    answer = solve_captcha(client, app, 'login')
+    response = client.post('/api/v1/auth/login', json={
+        'email_mobile': 'new@example.com', 'captcha': answer, 'login_type': 'password',
+        'password': 'Str0ng!Passw0rd'})
+    assert response.status_code == 503
+    assert response.get_json()['code'] == 'busy'
+    assert response.headers['Retry-After'] == '5'
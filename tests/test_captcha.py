@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+import captcha
+from captcha import CaptchaPool
+from shared_state import MemorySharedState
+
+from conftest import solve_captcha
+
+
+@pytest.fixture
+def pool():
+    pool = CaptchaPool(MemorySharedState(), 'secret', size=0)
+    pool._render = lambda: ('ABCDE', b'png')
+    return pool
+
+
+def test_answer_works_once(pool):
+    captcha_id, image, text = pool.issue('login')
+    assert (image, text) == (b'png', None)
+    assert pool.verify(captcha_id, 'login', ' abcde ')
+    assert not pool.verify(captcha_id, 'login', 'ABCDE')
+
+
+def test_wrong_answer_uses_the_captcha_up(pool):
+    captcha_id, _, _ = pool.issue('login')
+    assert not pool.verify(captcha_id, 'login', 'WRONG')
+    assert not pool.verify(captcha_id, 'login', 'ABCDE')
+
+
+def test_answer_is_bound_to_scope_and_id(pool):
+    login_id, _, _ = pool.issue('login')
+    signup_id, _, _ = pool.issue('signup')
+    assert login_id != signup_id
+    assert not pool.verify(login_id, 'signup', 'ABCDE')
+    assert not pool.verify(None, 'signup', 'ABCDE')
+    assert not pool.verify(signup_id, 'signup', '')
+    # Only a keyed hash is stored, never the answer
+    assert 'ABCDE' not in pool.state.get(f"captcha:{signup_id}")
+
+
+def test_racing_verifies_pass_once(pool):
+    captcha_id, _, _ = pool.issue('login')
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.verify(captcha_id, 'login', 'ABCDE')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+
+
+def test_empty_pool_renders_inline(pool):
+    pool.issue('login')
+    pool.issue('login')
+    assert pool.inline_renders == 2
+
+
+def test_render_captcha_makes_a_png():
+    pytest.importorskip('PIL')
+    assert captcha.render_captcha('ABCDE').startswith(b'\x89PNG')
+    code = captcha.random_code(8)
+    assert len(code) == 8 and set(code) <= set(captcha.ALPHABET)
+
+
+def test_refill_fills_the_pool():
+    pytest.importorskip('PIL')
+    pool = CaptchaPool(MemorySharedState(), 'secret', size=3)
+    pool._render = lambda: ('ABCDE', b'png')
+    pool.start()
+    for _ in range(100):
+        if pool.ready() == 3:
+            break
+        threading.Event().wait(0.01)
+    assert pool.ready() == 3
+    pool.issue('login')
+    assert pool.inline_renders == 0
+
+
+def test_captcha_route_keeps_the_answer_server_side(make_app):
+    pytest.importorskip('PIL')
+    app = make_app()
+    client = app.test_client()
+    response = client.get('/api/v1/auth/captcha/login')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'captcha_id' in response.get_json()
+    assert client.get('/api/v1/auth/captcha/other').status_code == 400
+
+    answer = solve_captcha(client, app, 'signup')
+    ok = client.post('/api/v1/auth/signup', json={'email_mobile': 'bad', 'captcha': answer})
+    assert ok.get_json()['code'] == 'invalid_identity'
+    # The captcha was used up by that attempt
+    again = client.post('/api/v1/auth/signup', json={'email_mobile': 'a@example.com', 'captcha': answer})
+    assert again.get_json()['code'] == 'captcha_invalid'
@@ -0,0 +1,88 @@
+import io
+import os
+import time
+import zipfile
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from card_jobs import BulkCardJobs, parse_guest_file
+
+
+def login(client, ceremony='Engagement'):
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['user'] = 'a@example.com'
+        session['selected_religion'] = 'Hinduism'
+        session['selected_ceremony'] = ceremony
+
+
+def test_parse_guest_file_reads_csv_and_jsonl():
+    records = parse_guest_file(b'\xef\xbb\xbfGuest,Date,Filename\nAnn,1 May,ann\nBob,,\n', 'guests.csv')
+    assert records == [{'names': 'Ann', 'date': '1 May', 'filename': 'ann'}, {'names': 'Bob'}]
+    assert parse_guest_file('{"names": "Cy"}\n\n{"guest": "Di"}\n', 'g.jsonl') == [{'names': 'Cy'}, {'names': 'Di'}]
+    with pytest.raises(ValueError):
+        parse_guest_file(b'guest\na\nb\nc\n', 'g.csv', max_records=2)
+    with pytest.raises(ValueError):
+        parse_guest_file(b'{"names": "x"}\nnot json\n', 'g.jsonl')
+
+
+def test_sweep_removes_only_expired_zips(tmp_path):
+    jobs = BulkCardJobs(str(tmp_path), None, output_dir=str(tmp_path), status_ttl=3600)
+    for name in ('old.zip', 'old.zip.part', 'new.zip', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    old = time.time() - 7200
+    for name in ('old.zip', 'old.zip.part', 'notes.txt'):
+        os.utime(tmp_path / name, (old, old))
+    assert jobs.sweep() == 2
+    assert sorted(os.listdir(tmp_path)) == ['new.zip', 'notes.txt']
+
+
+def test_bulk_job_renders_a_zip(make_app):
+    app = make_app(CARD_JOB_WORKERS=1)
+    client = app.test_client()
+    login(client)
+    guests = b'guest,filename\nAnn,ann\nBob,bob\n'
+    response = client.post('/bulk-cards', data={'guests': (io.BytesIO(guests), 'guests.csv'), 'size': 'preview'})
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    deadline = time.time() + 60
+    status = client.get(status_url).get_json()
+    while status['status'] not in ('done', 'failed') and time.time() < deadline:
+        time.sleep(0.1)
+        status = client.get(status_url).get_json()
+    assert (status['status'], status['done'], status['failed']) == ('done', 2, 0)
+
+    download = client.get(status['download_url'])
+    assert download.status_code == 200
+    assert sorted(zipfile.ZipFile(io.BytesIO(download.data)).namelist()) == ['ann.png', 'bob.png']
+
+    # Another user can't see the job
+    with client.session_transaction() as session:
+        session['user'] = 'someone@example.com'
+    assert client.get(status_url).status_code == 404
+    app.extensions['cardwala'].card_jobs.close()
+
+
+def test_oversized_guest_list_gets_413(make_app):
+    client = make_app(MAX_CONTENT_LENGTH=1024).test_client()
+    login(client)
+    response = client.post('/bulk-cards', data={'guests': (io.BytesIO(b'x' * 4096), 'guests.csv')})
+    assert response.status_code == 413
+    assert response.get_json()['code'] == 'too_large'
+
+
+def test_user_import_has_its_own_limit(make_app):
+    app = make_app(MAX_CONTENT_LENGTH=1024, USER_IMPORT_MAX_MB=1, ADMIN_TOKEN='admin-secret')
+    client = app.test_client()
+    body = b''.join(b'{"email": "user%d@example.com"}\n' % i for i in range(200))
+    assert len(body) > 1024
+    headers = {'Authorization': 'Bearer admin-secret'}
+    response = client.post('/admin/users/import', data={'users': (io.BytesIO(body), 'users.jsonl')}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == 200
+    response = client.post('/admin/users/import', data={'users': (io.BytesIO(b' ' * (2 * 1024 * 1024)), 'u.jsonl')},
+                           headers=headers)
+    assert response.status_code == 413
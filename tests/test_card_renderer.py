@@ -0,0 +1,107 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from PIL import Image
+
+import card_renderer
+from card_renderer import CardRenderer
+
+FIELDS = {'title': 'Engagement', 'names': 'Ann & Bob', 'date': '1 May'}
+
+
+@pytest.fixture
+def static_root(tmp_path):
+    root = tmp_path / 'static'
+    root.mkdir()
+    Image.new('RGB', (60, 80), (200, 180, 40)).save(root / 'bg.png')
+    return root
+
+
+def renderer(static_root, cache_dir, **kwargs):
+    return CardRenderer(str(static_root), cache_dir=str(cache_dir), **kwargs)
+
+
+def test_same_inputs_hit_the_cache(static_root, tmp_path):
+    cards = renderer(static_root, tmp_path / 'cache')
+    data, key = cards.render('bg.png', FIELDS)
+    assert data.startswith(b'\x89PNG')
+    assert cards.render('bg.png', FIELDS) == (data, key)
+    assert (cards.hits, cards.misses) == (1, 1)
+    assert cards.render('bg.png', {**FIELDS, 'names': 'Cy & Di'})[1] != key
+
+
+def test_disk_cache_is_shared_between_renderers(static_root, tmp_path):
+    data, key = renderer(static_root, tmp_path / 'cache').render('bg.png', FIELDS)
+    other = renderer(static_root, tmp_path / 'cache')
+    assert other.render('bg.png', FIELDS) == (data, key)
+    assert (other.hits, other.misses) == (1, 0)
+
+
+def test_replaced_background_gets_a_new_key(static_root, tmp_path):
+    cards = renderer(static_root, tmp_path / 'cache')
+    _, key = cards.render('bg.png', FIELDS)
+    Image.new('RGB', (61, 80), (10, 10, 10)).save(static_root / 'bg.png')
+    assert cards.render('bg.png', FIELDS)[1] != key
+
+
+def test_prune_removes_least_recently_used_first(static_root, tmp_path):
+    cache = tmp_path / 'cache'
+    cards = renderer(static_root, cache, disk_max_bytes=0)
+    keys = [cards.render('bg.png', {'title': f"card {i}"})[1] for i in range(4)]
+    paths = [cards._disk_path(key, 'png') for key in keys]
+    now = time.time()
+    for age, path in zip((400, 300, 200, 100), paths):
+        os.utime(path, (now - age, now - age))
+    # A fresh temp file belongs to a write in progress elsewhere
+    in_flight = paths[0] + '.123.tmp'
+    with open(in_flight, 'wb') as f:
+        f.write(b'x' * 10)
+
+    sizes = [os.path.getsize(p) for p in paths]
+    cards.disk_max_bytes = sum(sizes[1:]) + 10
+    assert cards.prune_disk() == 2
+    assert [os.path.exists(p) for p in paths] == [False, False, True, True]
+    assert os.path.exists(in_flight)
+
+
+def test_writes_past_the_cap_prune(static_root, tmp_path):
+    sizer = renderer(static_root, tmp_path / 'sizes', disk_max_bytes=0)
+    sizes = [len(sizer.render('bg.png', {'title': title})[0]) for title in ('first', 'second')]
+    cards = renderer(static_root, tmp_path / 'cache')
+    _, first = cards.render('bg.png', {'title': 'first'})
+    # One byte short of both cards: the second write goes over and the older one makes way
+    cards.disk_max_bytes = sum(sizes) - 1
+    old = time.time() - 100
+    os.utime(cards._disk_path(first, 'png'), (old, old))
+    _, second = cards.render('bg.png', {'title': 'second'})
+    assert not os.path.exists(cards._disk_path(first, 'png'))
+    assert os.path.exists(cards._disk_path(second, 'png'))
+
+
+def test_unbounded_cache_never_prunes(static_root, tmp_path):
+    cards = renderer(static_root, tmp_path / 'cache', disk_max_bytes=0)
+    cards.render('bg.png', FIELDS)
+    assert cards.prune_disk() == 0
+
+
+def test_card_route_serves_etags(make_app):
+    app = make_app()
+    client = app.test_client()
+    assert client.get('/card.png').status_code in (302, 401)
+
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['user'] = 'a@example.com'
+        session['selected_religion'] = 'Hinduism'
+        session['selected_ceremony'] = 'Engagement'
+    response = client.get('/card.png?names=Ann')
+    assert response.status_code == 200
+    assert response.mimetype == card_renderer.FORMATS['png']
+    etag = response.headers['ETag']
+    assert client.get('/card.png?names=Ann', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/card.gif').status_code == 404
+    assert client.get('/card.png?size=huge').status_code == 400
@@ -0,0 +1,63 @@
+import os
+import logging
+import logging.handlers
+
+import pytest
+
+import log_config
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    if log_config._active['listener'] is not None:
+        log_config._stop_listener()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def file_handlers(listener):
+    return [h for h in listener.handlers if isinstance(h, logging.FileHandler)]
+
+
+def test_external_rotation_uses_watched_handler(tmp_path, restore_logging):
+    listener = log_config.configure_logging('testing', str(tmp_path / 'app.log'), rotate_when='external')
+    (handler,) = file_handlers(listener)
+    assert type(handler) is logging.handlers.WatchedFileHandler
+
+
+def test_stop_rotation_keeps_writing_to_the_same_file(tmp_path, restore_logging):
+    log_file = tmp_path / 'app.log'
+    listener = log_config.configure_logging('testing', str(log_file), level='INFO', max_bytes=10)
+    log_config.stop_rotation()
+    (handler,) = file_handlers(listener)
+    assert type(handler) is logging.handlers.WatchedFileHandler
+
+    for i in range(5):
+        logging.getLogger('test').info('line %d', i)
+    log_config._stop_listener()
+    assert len(log_file.read_text().splitlines()) == 5
+    assert os.listdir(tmp_path) == ['app.log']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_worker_does_not_rotate(tmp_path, restore_logging):
+    log_file = tmp_path / 'app.log'
+    log_config.configure_logging('testing', str(log_file), level='INFO', max_bytes=10)
+    pid = os.fork()
+    if pid == 0:
+        listener = log_config._active['listener']
+        ok = all(type(h) is not logging.handlers.RotatingFileHandler for h in listener.handlers)
+        for i in range(5):
+            logging.getLogger('test').info('worker line %d', i)
+        listener.stop()
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert len(log_file.read_text().splitlines()) == 5
+    assert os.listdir(tmp_path) == ['app.log']
@@ -0,0 +1,153 @@
+import time
+import socket
+import smtplib
+
+import pytest
+from flask import Flask
+from flask_mail import Mail, Message
+
+from mail_queue import MailQueue, SENT, FAILED
+from smtp_pool import SMTPConnectionPool
+
+controller_module = pytest.importorskip('aiosmtpd.controller')
+
+
+class RecordingHandler:
+    """Keeps what it receives; ``fail_data`` makes the next DATA commands fail temporarily"""
+
+    def __init__(self):
+        self.messages = []
+        self.fail_data = 0
+        self.refuse = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return '550 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.fail_data:
+            self.fail_data -= 1
+            return '451 Try again later'
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content))
+        return '250 Message accepted'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    port = free_port()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    yield handler, '127.0.0.1', port
+    controller.stop()
+
+
+def in_app_context(fn):
+    # Message.as_bytes reads Flask-Mail's settings from the current app, as deliver_mail_batch provides
+    app = Flask(__name__)
+    Mail(app)
+
+    def run(*args):
+        with app.app_context():
+            return fn(*args)
+
+    return run
+
+
+@pytest.fixture
+def mail_queue(smtp_server):
+    _, host, port = smtp_server
+    pool = SMTPConnectionPool(host, port, timeout=5, max_size=2)
+    queue = MailQueue(in_app_context(pool.send), deliver_batch=in_app_context(pool.send_many), batch_size=10,
+                      workers=2, max_retries=2, backoff_base=0.05, backoff_max=0.2)
+    yield queue, pool
+    queue.stop()
+    pool.close()
+
+
+def message(to, subject='Your OTP'):
+    return Message(subject, sender='cardwala@localhost', recipients=[to], body='123456')
+
+
+def wait_for(queue, message_id, statuses, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(message_id)
+        if status and status['status'] in statuses:
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"mail {message_id} stuck at {queue.status(message_id)}")
+
+
+def test_messages_are_delivered(smtp_server, mail_queue):
+    handler, _, _ = smtp_server
+    queue, pool = mail_queue
+    ids = [queue.enqueue(message(f'user{i}@example.com')) for i in range(5)]
+    for message_id in ids:
+        assert wait_for(queue, message_id, {SENT})['attempts'] == 1
+    assert sorted(rcpt[0] for _, rcpt, _ in handler.messages) == [f'user{i}@example.com' for i in range(5)]
+    assert pool.stats()['messages_sent'] == 5
+
+
+def test_temporary_failure_is_retried(smtp_server, mail_queue):
+    handler, _, _ = smtp_server
+    queue, _ = mail_queue
+    handler.fail_data = 1
+    status = wait_for(queue, queue.enqueue(message('retry@example.com')), {SENT, FAILED})
+    assert status['status'] == SENT
+    assert status['attempts'] == 2
+    assert len(handler.messages) == 1
+
+
+def test_one_bad_message_does_not_resend_the_batch(smtp_server, mail_queue):
+    handler, _, _ = smtp_server
+    queue, _ = mail_queue
+    handler.refuse.add('nobody@example.com')
+    good = queue.enqueue(message('good@example.com'))
+    bad = queue.enqueue(message('nobody@example.com'))
+    assert wait_for(queue, good, {SENT})['attempts'] == 1
+    failed = wait_for(queue, bad, {FAILED})
+    assert 'SMTPRecipientsRefused' in failed['error']
+    assert [rcpt for _, rcpt, _ in handler.messages] == [['good@example.com']]
+
+
+def test_permanent_errors_go_to_dead_letters(smtp_server):
+    handler, host, port = smtp_server
+    handler.refuse.add('nobody@example.com')
+    pool = SMTPConnectionPool(host, port, timeout=5)
+    queue = MailQueue(in_app_context(pool.send), deliver_batch=in_app_context(pool.send_many), workers=1,
+                      max_retries=5, backoff_base=0.05, permanent_errors=(smtplib.SMTPRecipientsRefused,))
+    try:
+        status = wait_for(queue, queue.enqueue(message('nobody@example.com')), {FAILED})
+        assert status['attempts'] == 1
+        assert [entry['recipients'] for entry in queue.dead_letters] == [['nobody@example.com']]
+    finally:
+        queue.stop()
+        pool.close()
+
+
+def test_refused_recipient_keeps_the_session(smtp_server):
+    handler, host, port = smtp_server
+    handler.refuse.add('nobody@example.com')
+    pool = SMTPConnectionPool(host, port, timeout=5)
+    send_many = in_app_context(pool.send_many)
+    try:
+        errors = send_many([message('nobody@example.com'), message('good@example.com')])
+        assert isinstance(errors[0], smtplib.SMTPRecipientsRefused)
+        assert errors[1] is None
+        handler.fail_data = 1
+        assert isinstance(send_many([message('later@example.com')])[0], smtplib.SMTPDataError)
+        assert send_many([message('last@example.com')]) == [None]
+        stats = pool.stats()
+        assert stats['connections_created'] == 1
+        assert stats['connections_reused'] == 2
+    finally:
+        pool.close()
@@ -0,0 +1,16 @@
+def test_metrics_are_hidden_without_an_admin_token(make_app):
+    app = make_app(ADMIN_TOKEN='')
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_need_the_admin_token(make_app):
+    app = make_app(ADMIN_TOKEN='scrape-me')
+    client = app.test_client()
+    client.get('/api/v1/auth/session')
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert 'endpoint="api_session"' in response.get_data(as_text=True)
@@ -0,0 +1,65 @@
+import time
+import threading
+
+import pytest
+
+from otp_store import (MemoryOtpStore, SqliteOtpStore, RedisOtpStore,
+                       MSG_MISSING, MSG_EXPIRED, MSG_EXHAUSTED, MSG_VERIFIED)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def otp_store(request, tmp_path):
+    if request.param == 'memory':
+        store = MemoryOtpStore('secret', max_attempts=3)
+    elif request.param == 'sqlite':
+        store = SqliteOtpStore(str(tmp_path / 'otp.db'), 'secret', max_attempts=3)
+    else:
+        store = RedisOtpStore(request.getfixturevalue('redis_client'), 'secret', max_attempts=3)
+    yield store
+    store.close()
+
+
+def test_correct_code_verifies(otp_store):
+    otp_store.issue('a@example.com', 'login', '123456', ttl=60)
+    assert otp_store.verify('a@example.com', 'login', '123456') == (True, MSG_VERIFIED, False)
+
+
+def test_codes_are_scoped_by_purpose(otp_store):
+    otp_store.issue('a@example.com', 'signup', '123456', ttl=60)
+    assert otp_store.verify('a@example.com', 'login', '123456') == (False, MSG_MISSING, True)
+
+
+def test_attempts_run_out(otp_store):
+    otp_store.issue('a@example.com', 'login', '123456', ttl=60)
+    messages = [otp_store.verify('a@example.com', 'login', '000000')[1] for _ in range(3)]
+    assert messages == [f"Invalid OTP. {n} attempt(s) remaining." for n in (2, 1, 0)]
+    # Out of attempts: even the right code is refused and the OTP is gone
+    assert otp_store.verify('a@example.com', 'login', '123456') == (False, MSG_EXHAUSTED, True)
+    assert otp_store.verify('a@example.com', 'login', '123456') == (False, MSG_MISSING, True)
+
+
+def test_reissue_resets_attempts(otp_store):
+    otp_store.issue('a@example.com', 'login', '111111', ttl=60)
+    for _ in range(3):
+        otp_store.verify('a@example.com', 'login', '000000')
+    otp_store.issue('a@example.com', 'login', '222222', ttl=60)
+    assert otp_store.verify('a@example.com', 'login', '222222')[0] is True
+
+
+def test_expired_code_is_refused(otp_store):
+    otp_store.issue('a@example.com', 'login', '123456', ttl=1)
+    time.sleep(1.1)
+    assert otp_store.verify('a@example.com', 'login', '123456') == (False, MSG_EXPIRED, True)
+
+
+def test_concurrent_guesses_never_exceed_max_attempts(otp_store):
+    otp_store.issue('a@example.com', 'login', '123456', ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(
+        otp_store.verify('a@example.com', 'login', f"{i:06d}"))) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    checked = [message for _, message, _ in results if message.startswith('Invalid OTP')]
+    assert len(checked) == 3
@@ -0,0 +1,39 @@
+import time
+
+from rate_limiter import SlidingWindowRateLimiter
+
+
+def test_allows_up_to_the_limit(shared_state):
+    limiter = SlidingWindowRateLimiter(shared_state)
+    results = [limiter.hit('login_1.2.3.4', max_attempts=5, window=60) for _ in range(6)]
+    assert [allowed for allowed, _ in results] == [True] * 5 + [False]
+    retry_after = results[-1][1]
+    assert 0 < retry_after <= 61
+
+
+def test_keys_are_independent(shared_state):
+    limiter = SlidingWindowRateLimiter(shared_state)
+    for _ in range(3):
+        limiter.hit('login_a', max_attempts=3, window=60)
+    assert limiter.hit('login_a', max_attempts=3, window=60)[0] is False
+    assert limiter.hit('login_b', max_attempts=3, window=60)[0] is True
+
+
+def test_previous_window_still_counts(shared_state, monkeypatch):
+    limiter = SlidingWindowRateLimiter(shared_state)
+    now = [1000.0 * 60 + 59]  # last second of a window
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    for _ in range(5):
+        assert limiter.hit('k', max_attempts=5, window=60)[0]
+    # Just past the boundary the previous window's hits still weigh in fully
+    now[0] += 2
+    assert limiter.hit('k', max_attempts=5, window=60)[0] is False
+    # A full window later they are gone
+    now[0] += 60
+    assert limiter.hit('k', max_attempts=5, window=60)[0] is True
+
+
+def test_counters_use_the_capped_prefix(shared_state):
+    SlidingWindowRateLimiter(shared_state).hit('k', max_attempts=5, window=60)
+    bucket = int(time.time() // 60)
+    assert shared_state.get(f'rate:k:{bucket}') == '1'
@@ -0,0 +1,114 @@
+import pytest
+from flask import Flask, session
+
+from server_session import ServerSideSessionInterface
+
+
+@pytest.fixture
+def session_app(shared_state):
+    app = Flask(__name__)
+    app.secret_key = 'test-secret'
+    app.session_interface = ServerSideSessionInterface(shared_state)
+    writes = []
+    real_set = shared_state.set
+
+    def counting_set(key, value, ttl=None):
+        writes.append((key, ttl))
+        return real_set(key, value, ttl=ttl)
+
+    shared_state.set = counting_set
+    app.writes = writes
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('value', '')
+
+    @app.route('/login')
+    def login():
+        session.regenerate()
+        session.permanent = True
+        session['user'] = 'a@example.com'
+        return 'ok'
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+def session_id(app, client):
+    cookie = client.get_cookie('session')
+    return app.session_interface._signer(app).unsign(cookie.value).decode('utf-8')
+
+
+def test_data_stays_on_the_server(session_app):
+    client = session_app.test_client()
+    client.get('/set/secret-value')
+    assert 'secret-value' not in client.get_cookie('session').value
+    assert client.get('/get').get_data(as_text=True) == 'secret-value'
+
+
+def test_reads_are_not_written_back(session_app):
+    client = session_app.test_client()
+    client.get('/set/x')
+    writes = len(session_app.writes)
+    response = client.get('/get')
+    assert len(session_app.writes) == writes
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_empty_session_sets_no_cookie(session_app):
+    client = session_app.test_client()
+    client.get('/get')
+    assert client.get_cookie('session') is None
+    assert session_app.writes == []
+
+
+def test_regenerate_moves_the_data_and_drops_the_old_id(session_app):
+    client = session_app.test_client()
+    client.get('/set/x')
+    old_sid = session_id(session_app, client)
+    old_cookie = client.get_cookie('session').value
+
+    client.get('/login')
+    assert session_id(session_app, client) != old_sid
+    assert client.get('/get').get_data(as_text=True) == 'x'
+    assert session_app.session_interface.state.get('session:' + old_sid) is None
+
+    # A fixated (pre-login) cookie is worth nothing afterwards
+    attacker = session_app.test_client()
+    attacker.set_cookie('session', old_cookie)
+    assert attacker.get('/get').get_data(as_text=True) == ''
+
+
+def test_ttl_follows_permanent_flag(session_app):
+    client = session_app.test_client()
+    client.get('/set/x')
+    client.get('/login')
+    idle, permanent = [ttl for _, ttl in session_app.writes]
+    assert idle == 24 * 3600
+    assert permanent == int(session_app.permanent_session_lifetime.total_seconds())
+
+
+def test_tampered_cookie_gets_a_new_session(session_app):
+    client = session_app.test_client()
+    client.get('/set/x')
+    sid = session_id(session_app, client)
+    client.set_cookie('session', sid + '.forged')
+    assert client.get('/get').get_data(as_text=True) == ''
+
+
+def test_clear_deletes_the_entry_and_the_cookie(session_app):
+    client = session_app.test_client()
+    client.get('/set/x')
+    sid = session_id(session_app, client)
+    client.get('/clear')
+    assert session_app.session_interface.state.get('session:' + sid) is None
+    assert client.get_cookie('session') is None
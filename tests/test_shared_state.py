@@ -0,0 +1,83 @@
+import time
+import threading
+
+from shared_state import MemorySharedState, SqliteSharedState, RedisSharedState
+
+
+def test_get_set_delete(shared_state):
+    assert shared_state.get('missing') is None
+    shared_state.set('session:a', 'one')
+    assert shared_state.get('session:a') == 'one'
+    shared_state.delete('session:a')
+    assert shared_state.get('session:a') is None
+
+
+def test_values_expire(shared_state):
+    shared_state.set('otp:a', 'one', ttl=1)
+    assert shared_state.get('otp:a') == 'one'
+    time.sleep(1.1)
+    assert shared_state.get('otp:a') is None
+
+
+def test_incr_counts_and_keeps_first_ttl(shared_state):
+    assert shared_state.incr('rate:a', ttl=1) == 1
+    assert shared_state.incr('rate:a', ttl=60) == 2
+    assert shared_state.incr('rate:a', amount=3, ttl=60) == 5
+    time.sleep(1.1)
+    # The second incr must not have pushed the expiry out
+    assert shared_state.incr('rate:a', ttl=60) == 1
+
+
+def test_incr_is_atomic_across_threads(shared_state):
+    def hammer():
+        for _ in range(50):
+            shared_state.incr('rate:shared', ttl=60)
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert int(shared_state.get('rate:shared')) == 400
+
+
+def test_pop_hands_the_value_to_one_caller(shared_state):
+    shared_state.set('captcha:a', 'answer', ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(shared_state.pop('captcha:a'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count('answer') == 1
+    assert results.count(None) == 7
+    assert shared_state.get('captcha:a') is None
+
+
+def test_redis_incr_sets_ttl_with_the_key(redis_client):
+    state = RedisSharedState(redis_client, prefix='t:')
+    state.incr('rate:a', ttl=30)
+    assert 0 < redis_client.ttl('t:rate:a') <= 30
+    state.incr('rate:b')
+    assert redis_client.ttl('t:rate:b') == -1
+
+
+def test_memory_cap_only_evicts_rate_keys():
+    state = MemorySharedState(max_keys=10)
+    state.set('session:keep', 'me')
+    for i in range(100):
+        state.incr(f'rate:{i}', ttl=60)
+    assert state.get('session:keep') == 'me'
+    assert len(state) == 11
+    assert state.get('rate:99') == '1'
+
+
+def test_sqlite_cap_only_evicts_rate_keys(tmp_path):
+    state = SqliteSharedState(str(tmp_path / 'state.db'), purge_interval=0, max_keys=10)
+    state.set('session:keep', 'me')
+    for i in range(100):
+        state.incr(f'rate:{i:03d}', ttl=60 + i)
+    assert state.get('session:keep') == 'me'
+    assert state.get('rate:099') == '1'
+    assert state.get('rate:000') is None
+    state.close()
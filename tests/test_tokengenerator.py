@@ -0,0 +1,94 @@
+import os
+import time
+from collections import Counter
+
+import pytest
+
+import tokengenerator
+from tokengenerator import RandomPool
+
+
+def test_otp_and_codes_use_only_their_alphabet():
+    otp = tokengenerator.generate_otp(6)
+    assert len(otp) == 6 and otp.isdigit()
+    code = tokengenerator.random_code(500, 'AB')
+    assert len(code) == 500 and set(code) == {'A', 'B'}
+
+
+def test_tokens_are_unique_and_urlsafe():
+    tokens = {tokengenerator.token_urlsafe(16) for _ in range(1000)}
+    assert len(tokens) == 1000
+    assert all(len(t) == 22 and '=' not in t and '+' not in t and '/' not in t for t in tokens)
+    assert len(tokengenerator.token_bytes(40)) == 40
+
+
+def test_pool_refills_across_the_buffer_edge():
+    pool = RandomPool(buffer_size=16)
+    chunks = [pool.bytes(5) for _ in range(10)]
+    assert all(len(c) == 5 for c in chunks)
+    assert len(pool.bytes(64)) == 64
+
+
+@pytest.mark.parametrize('n', [1, 3, 10, 300])
+def test_randbelow_stays_in_range(n):
+    pool = RandomPool()
+    values = {pool.randbelow(n) for _ in range(3000)}
+    assert values <= set(range(n))
+    if n <= 10:
+        assert values == set(range(n))
+
+
+def test_randbelow_rejects_bad_bounds():
+    with pytest.raises(ValueError):
+        RandomPool().randbelow(0)
+
+
+def test_choices_is_not_biased():
+    # 256 % 10 != 0, so a plain modulo would make 0-5 about 4% more likely than 6-9
+    counts = Counter(RandomPool().choices(tokengenerator.DIGITS, 1000000))
+    low = sum(counts[d] for d in '012345') / 6
+    high = sum(counts[d] for d in '6789') / 4
+    assert abs(low / high - 1) < 0.02
+
+
+def test_choices_handles_large_alphabets():
+    alphabet = ''.join(chr(0x4e00 + i) for i in range(300))
+    assert set(RandomPool().choices(alphabet, 50)) <= set(alphabet)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_gets_different_bytes():
+    tokengenerator.token_bytes(1)
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_end, tokengenerator.token_bytes(32))
+        os._exit(0)
+    os.close(write_end)
+    child = os.read(read_end, 32)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    assert child != tokengenerator.token_bytes(32)
+
+
+def test_signed_token_round_trip():
+    token = tokengenerator.sign_token('secret', 'login', {'user': 'a@example.com'})
+    assert tokengenerator.verify_token('secret', 'login', token) == {'user': 'a@example.com'}
+
+
+def test_signed_token_rejects_other_purpose_secret_and_edits():
+    token = tokengenerator.sign_token('secret', 'login', {'user': 'a'})
+    assert tokengenerator.verify_token('secret', 'reset', token) is None
+    assert tokengenerator.verify_token('other', 'login', token) is None
+    body, signature = token.split('.')
+    forged = tokengenerator.sign_token('secret', 'login', {'user': 'b'}).split('.')[0]
+    assert tokengenerator.verify_token('secret', 'login', f"{forged}.{signature}") is None
+    for garbage in ('', 'abc', 'a.b.c', None, f"{body}.!!"):
+        assert tokengenerator.verify_token('secret', 'login', garbage) is None
+
+
+def test_signed_token_expires(monkeypatch):
+    token = tokengenerator.sign_token('secret', 'login', 'x', ttl=60)
+    later = time.time() + 61
+    monkeypatch.setattr(tokengenerator.time, 'time', lambda: later)
+    assert tokengenerator.verify_token('secret', 'login', token) is None
@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+import user_io
+from user_store import SqliteUserStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteUserStore(str(tmp_path / 'users.db'))
+    yield store
+    store.close()
+
+
+def test_to_user_normalizes_the_identity():
+    identity, record = user_io.to_user({'Email': ' Ann@Example.COM ', 'created_at': '2025-01-01', 'team': 'a'})
+    assert identity == 'ann@example.com'
+    assert record == {'team': 'a', 'created_at': 1735689600.0}
+
+
+def test_plaintext_passwords_are_rejected():
+    with pytest.raises(ValueError):
+        user_io.to_user({'email': 'a@b.com', 'password': 'plaintext'})
+    _, record = user_io.to_user({'email': 'a@b.com', 'password': 'scrypt:32768:8:1$salt$hash'})
+    assert record['password'].startswith('scrypt:')
+
+
+def test_extra_cannot_set_stored_fields():
+    _, record = user_io.to_user({'email': 'a@b.com', 'created_at': 5,
+                                 'extra': '{"password": "plaintext", "created_at": 1, "last_login": 2, "team": "x"}'})
+    assert 'password' not in record
+    assert 'last_login' not in record
+    assert record == {'team': 'x', 'created_at': 5.0}
+    _, record = user_io.to_user({'email': 'a@b.com', 'extra': {'password': 'plaintext'}})
+    assert 'password' not in record
+
+
+def test_import_skips_updates_and_rejects(store):
+    rows = [{'email': 'a@b.com', 'team': 'x'}, {'email': 'A@B.com'}, {'email': 'not-an-email'},
+            ValueError("Line 4 is not valid JSON")]
+    stats = user_io.import_users(store, rows, batch_size=2)
+    assert (stats['imported'], stats['skipped'], stats['rejected']) == (1, 1, 2)
+    assert [error['row'] for error in stats['errors']] == [3, 4]
+
+    stats = user_io.import_users(store, [{'email': 'a@b.com', 'team': 'y'}], update=True)
+    assert stats['updated'] == 1
+    assert store.get('a@b.com')['team'] == 'y'
+
+
+def test_csv_export_round_trips(store):
+    store.put('a@b.com', {'password': 'scrypt:x', 'created_at': 10.0, 'last_login': 20.0, 'team': 'x'})
+    exported = ''.join(user_io.export_users(store, 'csv'))
+    assert 'scrypt' not in exported
+    rows = list(user_io.read_records(io.StringIO(exported), 'csv'))
+    assert user_io.to_user(rows[0]) == ('a@b.com', {'team': 'x', 'created_at': 10.0, 'last_login': 20.0})
+    lines = list(user_io.export_users(store, 'jsonl', domain='b.com'))
+    assert json.loads(lines[0])['identity'] == 'a@b.com'
+
+
+# ------------------ ADMIN ROUTES ------------------
+AUTH = {'Authorization': 'Bearer admin-secret'}
+
+
+def test_admin_routes_need_the_token(make_app):
+    client = make_app().test_client()
+    assert client.get('/admin/users').status_code == 404
+    client = make_app(ADMIN_TOKEN='admin-secret').test_client()
+    assert client.get('/admin/users', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/admin/users', headers=AUTH).get_json() == {'users': [], 'next': None}
+
+
+def test_admin_import_and_query(make_app):
+    app = make_app(ADMIN_TOKEN='admin-secret')
+    client = app.test_client()
+    body = b'{"email": "a@b.com"}\n{"email": "c@d.com", "extra": {"password": "plaintext"}}\n'
+    response = client.post('/admin/users/import', data={'users': (io.BytesIO(body), 'users.jsonl')}, headers=AUTH)
+    assert response.get_json()['imported'] == 2
+    assert 'password' not in app.extensions['cardwala'].users.get('c@d.com')
+    users = client.get('/admin/users?domain=b.com', headers=AUTH).get_json()['users']
+    assert [user['identity'] for user in users] == ['a@b.com']
+
+
+@pytest.mark.parametrize('body, code', [
+    (b'email\n\xff\xfe@x.com\n', 'invalid_encoding'),
+    (b'email,team\na@b.com,"' + b'x' * 200000 + b'"\n', 'invalid_csv'),
+], ids=['not-utf8', 'field-too-large'])
+def test_admin_import_rejects_unreadable_csv(make_app, body, code):
+    client = make_app(ADMIN_TOKEN='admin-secret').test_client()
+    response = client.post('/admin/users/import', data={'users': (io.BytesIO(body), 'users.csv')}, headers=AUTH)
+    assert response.status_code == 400
+    assert response.get_json()['code'] == code
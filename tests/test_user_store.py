@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from user_store import SqliteUserStore, JsonUserStore, RedisUserStore, WriteBehindUserStore, canonicalize_identities
+from validation import canonical_identity
+
+
+@pytest.fixture(params=['json', 'sqlite', 'redis'])
+def user_store(request, tmp_path):
+    if request.param == 'json':
+        store = JsonUserStore(str(tmp_path / 'users.json'))
+    elif request.param == 'sqlite':
+        store = SqliteUserStore(str(tmp_path / 'users.db'))
+    else:
+        store = RedisUserStore(request.getfixturevalue('redis_client'))
+    yield store
+    store.close()
+
+
+def test_touch_many_only_raises_last_login(user_store):
+    user_store.put('a@example.com', {'password': 'old', 'last_login': 100})
+    user_store.touch_many([('a@example.com', 50), ('missing@example.com', 200)])
+    assert user_store.get('a@example.com')['last_login'] == 100
+    user_store.touch_many([('a@example.com', 300)])
+    assert user_store.get('a@example.com') == {'password': 'old', 'last_login': 300}
+    assert 'missing@example.com' not in user_store
+
+
+def test_write_behind_defers_until_flush(user_store):
+    store = WriteBehindUserStore(user_store, flush_interval_ms=60000, max_batch=100)
+    user_store.put('a@example.com', {'password': 'x', 'last_login': None})
+    store.touch_deferred('a@example.com', 500)
+    # Reads through the wrapper see the pending login before it is written
+    assert user_store.get('a@example.com').get('last_login') is None
+    assert store.get('a@example.com')['last_login'] == 500
+    assert store.flush() == 1
+    assert user_store.get('a@example.com')['last_login'] == 500
+    assert store.flush() == 0
+    store.close()
+
+
+def test_write_behind_keeps_the_latest_login(user_store):
+    store = WriteBehindUserStore(user_store, flush_interval_ms=60000, max_batch=100)
+    user_store.put('a@example.com', {'password': 'x'})
+    store.touch_deferred('a@example.com', 700)
+    store.touch_deferred('a@example.com', 600)
+    store.flush()
+    assert user_store.get('a@example.com')['last_login'] == 700
+    store.close()
+
+
+def test_flush_does_not_undo_other_writes(user_store):
+    store = WriteBehindUserStore(user_store, flush_interval_ms=60000, max_batch=100)
+    user_store.put('a@example.com', {'password': 'old'})
+    store.touch_deferred('a@example.com', 500)
+    # Another worker changes the password before this one flushes
+    user_store.put('a@example.com', {'password': 'new'})
+    store.flush()
+    assert user_store.get('a@example.com') == {'password': 'new', 'last_login': 500}
+    store.close()
+
+
+def test_full_batch_flushes_in_the_background(user_store):
+    store = WriteBehindUserStore(user_store, flush_interval_ms=60000, max_batch=2)
+    for name in ('a', 'b'):
+        user_store.put(f'{name}@example.com', {'password': 'x'})
+        store.touch_deferred(f'{name}@example.com', 900)
+    deadline = time.time() + 5
+    while user_store.get('b@example.com').get('last_login') != 900 and time.time() < deadline:
+        time.sleep(0.01)
+    assert user_store.get('a@example.com')['last_login'] == 900
+    assert user_store.get('b@example.com')['last_login'] == 900
+    store.close()
+
+
+def test_close_flushes_pending(user_store):
+    store = WriteBehindUserStore(user_store, flush_interval_ms=60000, max_batch=100)
+    user_store.put('a@example.com', {'password': 'x'})
+    store.touch_deferred('a@example.com', 800)
+    store.close()
+    assert user_store.get('a@example.com')['last_login'] == 800
+
+
+def test_canonicalize_renames_once_and_keeps_clashes(user_store):
+    user_store.put('Ann@Example.com', {'password': 'a'})
+    user_store.put('98765 43210', {'password': 'p'})
+    user_store.put('bob@example.com', {'password': 'b1'})
+    user_store.put('BOB@example.com', {'password': 'b2'})
+    user_store.put('not an identity', {'password': 'x'})
+
+    assert canonicalize_identities(user_store, canonical_identity) == 2
+    assert user_store.get('ann@example.com') == {'password': 'a'}
+    assert user_store.get('+919876543210') == {'password': 'p'}
+    assert 'Ann@Example.com' not in user_store
+    # The canonical key was taken, so the other spelling stays put rather than overwrite it
+    assert user_store.get('bob@example.com') == {'password': 'b1'}
+    assert user_store.get('BOB@example.com') == {'password': 'b2'}
+    assert 'not an identity' in user_store
+    assert canonicalize_identities(user_store, canonical_identity) == 0
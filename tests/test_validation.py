@@ -0,0 +1,76 @@
+import pytest
+
+from validation import (normalize_email, normalize_phone, validate_user_input, validate_password,
+                        canonical_identity, bulk_validate, iter_validated, MSG_INVALID_EMAIL, MSG_INVALID_PHONE)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (' Ann.Lee+cards@Example.COM ', 'ann.lee+cards@example.com'),
+    ('a@b.co', 'a@b.co'),
+    ('no-at-sign.com', None),
+    ('a@b', None),
+    ('a@b.c', None),
+    ('a b@example.com', None),
+])
+def test_normalize_email(value, expected):
+    assert normalize_email(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('98765 43210', '+919876543210'),
+    ('09876543210', '+919876543210'),
+    ('+91 (987) 654-3210', '+919876543210'),
+    ('0044 20 7946 0958', '+442079460958'),
+    ('919876543210', '+919876543210'),
+    ('12345', None),
+    ('+0123456789', None),
+    ('98765abcde', None),
+])
+def test_normalize_phone(value, expected):
+    assert normalize_phone(value) == expected
+
+
+def test_country_code_applies_to_national_numbers_only():
+    assert normalize_phone('2025550123', country_code='1') == '+12025550123'
+    assert normalize_phone('+919876543210', country_code='1') == '+919876543210'
+
+
+def test_validate_user_input():
+    assert validate_user_input('A@Example.com') == ('email', 'a@example.com')
+    assert validate_user_input('9876543210') == ('phone', '+919876543210')
+    assert validate_user_input('a@example') == (None, MSG_INVALID_EMAIL)
+    assert validate_user_input('123') == (None, MSG_INVALID_PHONE)
+    assert canonical_identity('98765-43210') == '+919876543210'
+    assert canonical_identity('nonsense') is None
+
+
+@pytest.mark.parametrize('password, message', [
+    ('Sh0rt!', 'at least 8 characters'),
+    ('lower0nly!', 'uppercase'),
+    ('UPPER0NLY!', 'lowercase'),
+    ('NoDigits!!', 'digit'),
+    ('NoSpecial1', 'special'),
+])
+def test_weak_passwords_name_the_missing_rule(password, message):
+    ok, msg = validate_password(password)
+    assert not ok and message in msg
+
+
+@pytest.mark.parametrize('password', ['Str0ng!Pass', 'Under_sc0reX'])
+def test_strong_passwords(password):
+    assert validate_password(password) == (True, "Valid password")
+
+
+def test_bulk_validate_dedupes_canonical_identities():
+    values = ['A@example.com', 'a@example.com ', '9876543210', '+91 98765 43210', 'bad', 'b@example.com']
+    valid, rejected, duplicates = bulk_validate(values)
+    assert list(valid.items()) == [('a@example.com', 'email'), ('+919876543210', 'phone'),
+                                   ('b@example.com', 'email')]
+    assert rejected == [(4, 'bad', MSG_INVALID_PHONE)]
+    assert duplicates == 2
+
+
+def test_iter_validated_streams():
+    results = iter_validated(iter(['a@example.com', 'x']))
+    assert next(results) == (0, 'email', 'a@example.com')
+    assert next(results) == (1, None, MSG_INVALID_PHONE)
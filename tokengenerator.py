@@ -0,0 +1,125 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import threading
+
+DIGITS = '0123456789'
+BUFFER_SIZE = 4096
+
+
+# ------------------ RANDOM POOL ------------------
+class RandomPool:
+    """Random bytes read from ``os.urandom`` in blocks and handed out a few at a time.
+
+    One syscall feeds hundreds of OTPs. ``randbelow`` uses rejection
+    sampling, not ``%``, so every value is equally likely. The buffer is
+    dropped in a forked child; otherwise parent and child would hand out
+    the same bytes.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._buffer = b''
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self._buffer = b''
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def bytes(self, n):
+        with self._lock:
+            if self._pos + n > len(self._buffer):
+                self._buffer = self._buffer[self._pos:] + os.urandom(max(self.buffer_size, n))
+                self._pos = 0
+            chunk = self._buffer[self._pos:self._pos + n]
+            self._pos += n
+        return chunk
+
+    def randbelow(self, n):
+        """Uniform int in ``[0, n)``"""
+        if n <= 0:
+            raise ValueError("n must be positive")
+        width = max(1, (n - 1).bit_length() + 7 >> 3)
+        span = 1 << (8 * width)
+        # Values at or above the last whole multiple of n would favour the low results
+        limit = span - span % n
+        while True:
+            value = int.from_bytes(self.bytes(width), 'big')
+            if value < limit:
+                return value % n
+
+    def choices(self, alphabet, length):
+        if len(alphabet) > 256:
+            return ''.join(alphabet[self.randbelow(len(alphabet))] for _ in range(length))
+        # Single-byte alphabets: one buffer slice per batch instead of one call per character
+        limit = 256 - 256 % len(alphabet)
+        out = []
+        while len(out) < length:
+            out.extend(alphabet[b % len(alphabet)] for b in self.bytes(length - len(out)) if b < limit)
+        return ''.join(out)
+
+
+_pool = RandomPool()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_pool.reset)
+
+
+# ------------------ CODES AND TOKENS ------------------
+def generate_otp(length=6):
+    return _pool.choices(DIGITS, length)
+
+
+def random_code(length, alphabet):
+    return _pool.choices(alphabet, length)
+
+
+def token_bytes(nbytes=32):
+    return _pool.bytes(nbytes)
+
+
+def token_urlsafe(nbytes=32):
+    return base64.urlsafe_b64encode(_pool.bytes(nbytes)).rstrip(b'=').decode('ascii')
+
+
+# ------------------ SIGNED TOKENS ------------------
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(secret, purpose, body):
+    secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+    return hmac.new(secret, f"{purpose}.{body}".encode('ascii'), hashlib.sha256).digest()
+
+
+def sign_token(secret, purpose, data, ttl=900):
+    """Stateless token carrying ``data`` (JSON-serialisable) until ``ttl`` seconds from now.
+
+    The signature covers ``purpose``, so a token minted for one use (say a
+    login magic link) is rejected for any other.
+    """
+    payload = {'d': data, 'exp': int(time.time()) + ttl, 'n': token_urlsafe(8)}
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return f"{body}.{_b64encode(_signature(secret, purpose, body))}"
+
+
+def verify_token(secret, purpose, token):
+    """``data`` from a token made by ``sign_token``, or None when it is forged, altered or expired."""
+    try:
+        body, signature = token.split('.')
+        if not hmac.compare_digest(_b64decode(signature), _signature(secret, purpose, body)):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if payload.get('exp', 0) < time.time():
+        return None
+    return payload.get('d')
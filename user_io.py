@@ -0,0 +1,274 @@
+"""Bulk import and export of users, as JSONL or CSV.
+
+Everything streams: records are read, normalized and committed in batches
+of ``batch_size``, and exports are written row by row, so memory stays
+flat however long the list is.
+
+    python user_io.py import partners.csv
+    python user_io.py export --format csv --domain example.com > users.csv
+    python user_io.py query --inactive-since 2025-01-01 --limit 20
+"""
+import io
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timezone
+from functools import partial
+from itertools import islice
+
+from config import get_config
+from validation import validate_user_input, canonical_identity, DEFAULT_COUNTRY_CODE
+from user_store import USER_FIELDS, open_user_store, query_sort_field, query_cursor
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+IDENTITY_COLUMNS = ('identity', 'email_mobile', 'email', 'phone', 'mobile')
+EXPORT_COLUMNS = ('identity', 'created_at', 'last_login')
+# Only already-hashed passwords are imported; anything else would be stored in the clear
+PASSWORD_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+MAX_REPORTED_ERRORS = 100
+
+
+# ------------------ PARSING ------------------
+def detect_format(filename='', explicit=None):
+    fmt = (explicit or '').lower() or ('csv' if filename.lower().endswith('.csv') else 'jsonl')
+    if fmt == 'ndjson':
+        fmt = 'jsonl'
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    return fmt
+
+
+def parse_time(value):
+    """Epoch seconds from a number or an ISO 8601 date/time (UTC unless it says otherwise)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def read_records(stream, fmt):
+    """Yield one dict per JSONL line or CSV row of a text stream"""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+        return
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield ValueError(f"Line {number} is not valid JSON")
+
+
+def to_user(row, country_code=DEFAULT_COUNTRY_CODE, now=None):
+    """``(identity, record)`` for an import row; raises ValueError when it can't be used"""
+    if not isinstance(row, dict):
+        raise ValueError("Record is not an object")
+    row = {str(k).strip().lower(): v for k, v in row.items() if k}
+    raw = next((row[c] for c in IDENTITY_COLUMNS if row.get(c)), None)
+    if not raw:
+        raise ValueError("Missing identity (email or phone)")
+    kind, identity = validate_user_input(str(raw), country_code)
+    if not kind:
+        raise ValueError(f"{identity}: {raw!r}")
+
+    record = {}
+    extra = row.pop('extra', None)
+    if isinstance(extra, str) and extra.strip():
+        # The ``extra`` column of a CSV export
+        try:
+            extra = json.loads(extra)
+        except json.JSONDecodeError:
+            raise ValueError("Column 'extra' is not valid JSON")
+    if isinstance(extra, dict):
+        # Stored fields only come from their own columns, so a password in 'extra' can't skip the hash check
+        record.update((k, v) for k, v in extra.items() if k not in USER_FIELDS)
+    record.update((k, v) for k, v in row.items()
+                  if k not in IDENTITY_COLUMNS and k not in USER_FIELDS and v not in (None, ''))
+    record['created_at'] = parse_time(row.get('created_at')) or now or time.time()
+    last_login = parse_time(row.get('last_login'))
+    if last_login is not None:
+        record['last_login'] = last_login
+    password = row.get('password')
+    if password:
+        if not str(password).startswith(PASSWORD_HASH_PREFIXES):
+            raise ValueError("Password must already be hashed (scrypt:/pbkdf2:)")
+        record['password'] = password
+    return identity, record
+
+
+# ------------------ IMPORT ------------------
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_users(store, rows, country_code=DEFAULT_COUNTRY_CODE, batch_size=1000, update=False):
+    """Add users from ``rows`` (an iterable of dicts) in batches of ``batch_size``.
+
+    Existing users are skipped, or with ``update`` merged with the new
+    fields. Returns counts plus the first rejected rows.
+    """
+    stats = {'imported': 0, 'updated': 0, 'skipped': 0, 'rejected': 0, 'errors': []}
+    now = time.time()
+    for chunk in batches(enumerate(rows, 1), batch_size):
+        batch = {}
+        for number, row in chunk:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                identity, record = to_user(row, country_code, now)
+            except ValueError as e:
+                stats['rejected'] += 1
+                if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                    stats['errors'].append({'row': number, 'error': str(e)})
+                continue
+            if identity in batch:
+                stats['skipped'] += 1
+            else:
+                batch[identity] = record
+
+        existing = store.existing(batch) if batch else set()
+        writes = []
+        for identity, record in batch.items():
+            if identity not in existing:
+                writes.append((identity, record))
+                stats['imported'] += 1
+            elif update:
+                current = store.get(identity) or {}
+                record['created_at'] = current.get('created_at', record['created_at'])
+                writes.append((identity, {**current, **record}))
+                stats['updated'] += 1
+            else:
+                stats['skipped'] += 1
+        if writes:
+            store.put_many(writes)
+
+    logger.info(f"📥 User import: {stats['imported']} new, {stats['updated']} updated, "
+                f"{stats['skipped']} skipped, {stats['rejected']} rejected")
+    return stats
+
+
+# ------------------ EXPORT ------------------
+def export_row(identity, record, include_passwords=False):
+    row = {'identity': identity}
+    row.update((k, v) for k, v in record.items() if include_passwords or k != 'password')
+    return row
+
+
+def export_users(store, fmt='jsonl', include_passwords=False, **filters):
+    """Yield the export as text chunks, one per user (after a header line for CSV).
+
+    ``filters`` are passed to ``store.query``; without any, every user is exported.
+    """
+    rows = store.query(**filters) if any(v is not None for v in filters.values()) else store.items()
+    if fmt == 'jsonl':
+        for identity, record in rows:
+            yield json.dumps(export_row(identity, record, include_passwords)) + '\n'
+        return
+
+    # Extra fields differ per user, so CSV carries the fixed columns and the rest as JSON
+    columns = EXPORT_COLUMNS + (('password',) if include_passwords else ()) + ('extra',)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for identity, record in rows:
+        extra = {k: v for k, v in record.items() if k not in USER_FIELDS}
+        writer.writerow([identity, record.get('created_at', ''), record.get('last_login', '')]
+                        + ([record.get('password', '')] if include_passwords else [])
+                        + [json.dumps(extra) if extra else ''])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def query_page(store, limit=100, after=None, **filters):
+    """One page of ``store.query`` results plus the cursor of the next page (None on the last)"""
+    rows = list(store.query(after=after, limit=limit, **filters))
+    field = query_sort_field(filters.get('created_from'), filters.get('created_to'), filters.get('inactive_since'))
+    cursor = query_cursor(field, *rows[-1]) if len(rows) == limit else None
+    return rows, cursor
+
+
+# ------------------ CLI ------------------
+def _add_filters(parser):
+    parser.add_argument('--created-from', type=parse_time, help="epoch or ISO date")
+    parser.add_argument('--created-to', type=parse_time, help="epoch or ISO date (exclusive)")
+    parser.add_argument('--inactive-since', type=parse_time, help="no login since (epoch or ISO date)")
+    parser.add_argument('--domain', help="email domain, e.g. example.com")
+
+
+def _filters(args):
+    return {'created_from': args.created_from, 'created_to': args.created_to,
+            'inactive_since': args.inactive_since,
+            'domain': args.domain.lower() if args.domain else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_cmd = commands.add_parser('import', help="add users from a JSONL or CSV file ('-' for stdin)")
+    import_cmd.add_argument('file')
+    import_cmd.add_argument('--format', choices=sorted(FORMATS))
+    import_cmd.add_argument('--update', action='store_true', help="merge into existing users instead of skipping")
+    import_cmd.add_argument('--batch-size', type=int, default=1000)
+
+    export_cmd = commands.add_parser('export', help="write users to stdout")
+    export_cmd.add_argument('--format', choices=sorted(FORMATS), default='jsonl')
+    export_cmd.add_argument('--include-passwords', action='store_true', help="include password hashes")
+    _add_filters(export_cmd)
+
+    query_cmd = commands.add_parser('query', help="list matching users")
+    query_cmd.add_argument('--limit', type=int, default=50)
+    _add_filters(query_cmd)
+
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    config = vars(get_config())
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+    store = open_user_store(config['USER_STORE_BACKEND'], config['USERS_DB'], config['USERS_FILE'],
+                            write_behind=False, redis_url=config['REDIS_URL'],
+                            canonical=partial(canonical_identity, country_code=config['PHONE_COUNTRY_CODE']))
+    try:
+        if args.command == 'import':
+            stream = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8-sig', newline='')
+            with stream:
+                stats = import_users(store, read_records(stream, detect_format(args.file, args.format)),
+                                     country_code=config['PHONE_COUNTRY_CODE'],
+                                     batch_size=args.batch_size, update=args.update)
+            print(json.dumps(stats, indent=2))
+        elif args.command == 'export':
+            for chunk in export_users(store, args.format, args.include_passwords, **_filters(args)):
+                sys.stdout.write(chunk)
+        else:
+            rows, cursor = query_page(store, limit=args.limit, **_filters(args))
+            for identity, record in rows:
+                print(json.dumps(export_row(identity, record)))
+            if cursor:
+                print(f"... more (next page after {cursor[1]})", file=sys.stderr)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,699 @@
+import os
+import json
+import logging
+import threading
+
+from sqlite_util import SqliteConnections
+
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = ('password', 'created_at', 'last_login')
+
+
+# ------------------ QUERIES ------------------
+def query_sort_field(created_from=None, created_to=None, inactive_since=None):
+    """Column a query is ordered (and paged) by: the one its index range is on"""
+    if created_from is not None or created_to is not None:
+        return 'created_at'
+    if inactive_since is not None:
+        return 'last_login'
+    return None
+
+
+def email_domain(identity):
+    return identity.rpartition('@')[2] if '@' in identity else None
+
+
+def matches_query(identity, record, created_from=None, created_to=None, inactive_since=None, domain=None):
+    created_at = record.get('created_at')
+    if created_from is not None and (created_at is None or created_at < created_from):
+        return False
+    if created_to is not None and (created_at is None or created_at >= created_to):
+        return False
+    if inactive_since is not None:
+        last_login = record.get('last_login')
+        if last_login is not None and last_login >= inactive_since:
+            return False
+    if domain is not None and email_domain(identity) != domain:
+        return False
+    return True
+
+
+def query_cursor(field, identity, record):
+    """Keyset position of a result row; pass it back as ``after`` for the next page"""
+    return (record.get(field) if field else None, identity)
+
+
+def _sort_key(field, identity, record):
+    # NULLs first, like SQLite's ascending order
+    value = record.get(field) if field else None
+    return (value is not None, value or 0, identity)
+
+
+class UserStore:
+    """Base interface for user registry backends, keyed by email/phone."""
+
+    def get(self, identity, default=None):
+        raise NotImplementedError
+
+    def put(self, identity, record):
+        raise NotImplementedError
+
+    def put_many(self, items):
+        for identity, record in items:
+            self.put(identity, record)
+
+    def delete(self, identity):
+        raise NotImplementedError
+
+    def rename_many(self, renames):
+        """Move each ``(old, new, record)`` to its new identity"""
+        renames = list(renames)
+        self.put_many((new, record) for _, new, record in renames)
+        for old, _, _ in renames:
+            self.delete(old)
+
+    def touch_many(self, items):
+        """Raise ``last_login`` to the given time for each ``(identity, last_login)``; nothing else changes.
+
+        Never lowers it, and never writes the rest of the record, so a
+        password or profile change made meanwhile by another worker survives.
+        """
+        for identity, last_login in items:
+            record = self.get(identity)
+            if record is not None and last_login > (record.get('last_login') or 0):
+                record['last_login'] = last_login
+                self.put(identity, record)
+
+    def identities(self):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def items(self):
+        """Stream ``(identity, record)`` pairs"""
+        for identity in self.identities():
+            record = self.get(identity)
+            if record is not None:
+                yield identity, record
+
+    def existing(self, identities):
+        """The subset of ``identities`` already registered"""
+        return {identity for identity in identities if identity in self}
+
+    def query(self, created_from=None, created_to=None, inactive_since=None, domain=None,
+              after=None, limit=None):
+        """Users matching every given filter, as ``(identity, record)``.
+
+        ``created_from <= created_at < created_to``; ``inactive_since`` means
+        no login at or after that time (including never); ``domain`` is the
+        email domain. Rows come ordered by ``query_sort_field`` and then
+        identity, and ``after`` (a ``query_cursor``) resumes after a row.
+        This fallback scans every user; the SQLite backend uses indexes.
+        """
+        field = query_sort_field(created_from, created_to, inactive_since)
+        rows = [(identity, record) for identity, record in self.items()
+                if matches_query(identity, record, created_from, created_to, inactive_since, domain)]
+        rows.sort(key=lambda row: _sort_key(field, *row))
+        if after is not None:
+            start = _sort_key(field, after[1], {field: after[0]} if field else {})
+            rows = [row for row in rows if _sort_key(field, *row) > start]
+        return iter(rows[:limit] if limit else rows)
+
+    def get_meta(self, key, default=None):
+        # Backends without a metadata table (JSON) report nothing and store nothing
+        return default
+
+    def set_meta(self, key, value):
+        pass
+
+    def close(self):
+        pass
+
+    def __contains__(self, identity):
+        return self.get(identity) is not None
+
+    def __getitem__(self, identity):
+        record = self.get(identity)
+        if record is None:
+            raise KeyError(identity)
+        return record
+
+    def __iter__(self):
+        return iter(self.identities())
+
+    def __len__(self):
+        return self.count()
+
+
+# ------------------ JSON BACKEND ------------------
+class JsonUserStore(UserStore):
+    """Legacy backend: whole registry in one JSON file, rewritten on every put."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._users = self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Corrupted {self.path} file")
+        except Exception as e:
+            logger.error(f"Error loading users: {e}")
+        return {}
+
+    def _save(self):
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self._users, f, indent=2)
+        os.replace(temp_file, self.path)
+
+    def get(self, identity, default=None):
+        record = self._users.get(identity)
+        return dict(record) if record is not None else default
+
+    def put(self, identity, record):
+        self.put_many([(identity, record)])
+
+    def put_many(self, items):
+        with self._lock:
+            for identity, record in items:
+                self._users[identity] = dict(record)
+            self._save()
+
+    def delete(self, identity):
+        with self._lock:
+            if self._users.pop(identity, None) is not None:
+                self._save()
+
+    def rename_many(self, renames):
+        # One rewrite of the file for the whole batch
+        with self._lock:
+            for old, new, record in renames:
+                self._users.pop(old, None)
+                self._users[new] = dict(record)
+            self._save()
+
+    def touch_many(self, items):
+        with self._lock:
+            changed = False
+            for identity, last_login in items:
+                record = self._users.get(identity)
+                if record is not None and last_login > (record.get('last_login') or 0):
+                    record['last_login'] = last_login
+                    changed = True
+            if changed:
+                self._save()
+
+    def identities(self):
+        return list(self._users)
+
+    def items(self):
+        with self._lock:
+            snapshot = list(self._users.items())
+        for identity, record in snapshot:
+            yield identity, dict(record)
+
+    def count(self):
+        return len(self._users)
+
+
+# ------------------ SQLITE BACKEND ------------------
+class SqliteUserStore(UserStore):
+    """SQLite (WAL) backend doing single-row upserts keyed on the identity."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            identity   TEXT PRIMARY KEY,
+            password   TEXT,
+            created_at REAL,
+            last_login REAL,
+            extra      TEXT NOT NULL DEFAULT '{}'
+        ) WITHOUT ROWID;
+        -- Admin queries: sign-ups by date, inactive users, users by email domain
+        CREATE INDEX IF NOT EXISTS users_created_at ON users (created_at);
+        CREATE INDEX IF NOT EXISTS users_last_login ON users (last_login);
+        CREATE INDEX IF NOT EXISTS users_domain ON users (substr(identity, instr(identity, '@') + 1))
+            WHERE instr(identity, '@') > 0;
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._connections = SqliteConnections(path, timeout)
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        return self._connections.get()
+
+    @staticmethod
+    def _to_row(identity, record):
+        extra = {k: v for k, v in record.items() if k not in USER_FIELDS}
+        return (identity, record.get('password'), record.get('created_at'),
+                record.get('last_login'), json.dumps(extra))
+
+    @staticmethod
+    def _from_row(row):
+        password, created_at, last_login, extra = row
+        record = json.loads(extra) if extra else {}
+        if password is not None:
+            record['password'] = password
+        if created_at is not None:
+            record['created_at'] = created_at
+        if last_login is not None:
+            record['last_login'] = last_login
+        return record
+
+    def get(self, identity, default=None):
+        row = self._conn().execute(
+            "SELECT password, created_at, last_login, extra FROM users WHERE identity = ?",
+            (identity,)
+        ).fetchone()
+        return self._from_row(row) if row else default
+
+    def __contains__(self, identity):
+        return self._conn().execute(
+            "SELECT 1 FROM users WHERE identity = ?", (identity,)
+        ).fetchone() is not None
+
+    _UPSERT = """
+        INSERT INTO users (identity, password, created_at, last_login, extra)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(identity) DO UPDATE SET
+            password = excluded.password,
+            created_at = excluded.created_at,
+            last_login = excluded.last_login,
+            extra = excluded.extra
+    """
+
+    def put(self, identity, record):
+        self._conn().execute(self._UPSERT, self._to_row(identity, record))
+
+    def put_many(self, items):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(self._UPSERT, (self._to_row(i, r) for i, r in items))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def delete(self, identity):
+        self._conn().execute("DELETE FROM users WHERE identity = ?", (identity,))
+
+    def touch_many(self, items):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE users SET last_login = max(coalesce(last_login, 0), ?) WHERE identity = ?",
+                ((last_login, identity) for identity, last_login in items))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def identities(self):
+        return [row[0] for row in self._conn().execute("SELECT identity FROM users")]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def _select(self, sql, params=(), batch_size=1000):
+        cursor = self._conn().execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], self._from_row(row[1:])
+
+    def items(self, batch_size=1000):
+        return self._select("SELECT identity, password, created_at, last_login, extra FROM users "
+                            "ORDER BY identity", batch_size=batch_size)
+
+    def existing(self, identities):
+        identities = list(identities)
+        found = set()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(identities), 500):
+            chunk = identities[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(row[0] for row in self._conn().execute(
+                f"SELECT identity FROM users WHERE identity IN ({placeholders})", chunk))
+        return found
+
+    def query(self, created_from=None, created_to=None, inactive_since=None, domain=None,
+              after=None, limit=None):
+        field = query_sort_field(created_from, created_to, inactive_since)
+        where, params = [], []
+        if created_from is not None:
+            where.append("created_at >= ?")
+            params.append(created_from)
+        if created_to is not None:
+            where.append("created_at < ?")
+            params.append(created_to)
+        if inactive_since is not None:
+            where.append("(last_login IS NULL OR last_login < ?)")
+            params.append(inactive_since)
+        if domain is not None:
+            # Same expression (and partial-index condition) as users_domain
+            where.append("instr(identity, '@') > 0 AND substr(identity, instr(identity, '@') + 1) = ?")
+            params.append(domain)
+        if after is not None:
+            value, identity = after
+            if field is None:
+                where.append("identity > ?")
+                params.append(identity)
+            elif value is None:
+                where.append(f"(({field} IS NULL AND identity > ?) OR {field} IS NOT NULL)")
+                params.append(identity)
+            else:
+                where.append(f"({field}, identity) > (?, ?)")
+                params.extend((value, identity))
+
+        sql = "SELECT identity, password, created_at, last_login, extra FROM users"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {field}, identity" if field else " ORDER BY identity"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._select(sql, params)
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self._conn().execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def close(self):
+        self._connections.close()
+
+
+# ------------------ REDIS BACKEND ------------------
+class RedisUserStore(UserStore):
+    """Stores every user as one field of a Redis hash, so all workers share one registry."""
+
+    def __init__(self, client, key='cardwala:users'):
+        self.client = client
+        self.key = key
+
+    @staticmethod
+    def _decode(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def get(self, identity, default=None):
+        raw = self.client.hget(self.key, identity)
+        return json.loads(raw) if raw is not None else default
+
+    def __contains__(self, identity):
+        return bool(self.client.hexists(self.key, identity))
+
+    def put(self, identity, record):
+        self.client.hset(self.key, identity, json.dumps(record))
+
+    def put_many(self, items):
+        mapping = {identity: json.dumps(record) for identity, record in items}
+        if mapping:
+            self.client.hset(self.key, mapping=mapping)
+
+    def delete(self, identity):
+        self.client.hdel(self.key, identity)
+
+    def touch_many(self, items):
+        # Optimistic read-modify-write: WATCH makes the write fail (and retry) if the hash changed
+        for identity, last_login in items:
+            def update(pipe, identity=identity, last_login=last_login):
+                raw = pipe.hget(self.key, identity)
+                if raw is None:
+                    return
+                record = json.loads(raw)
+                if last_login > (record.get('last_login') or 0):
+                    record['last_login'] = last_login
+                    pipe.multi()
+                    pipe.hset(self.key, identity, json.dumps(record))
+            self.client.transaction(update, self.key)
+
+    def identities(self):
+        return [self._decode(k) for k in self.client.hkeys(self.key)]
+
+    def count(self):
+        return int(self.client.hlen(self.key))
+
+    def items(self):
+        for identity, raw in self.client.hscan_iter(self.key, count=1000):
+            yield self._decode(identity), json.loads(raw)
+
+    def get_meta(self, key, default=None):
+        value = self.client.hget(f"{self.key}:meta", key)
+        return self._decode(value) if value is not None else default
+
+    def set_meta(self, key, value):
+        self.client.hset(f"{self.key}:meta", key, value)
+
+
+# ------------------ WRITE-BEHIND ------------------
+class WriteBehindUserStore(UserStore):
+    """Wraps a store and batches last_login updates on a background thread.
+
+    ``touch_deferred`` keeps only ``identity -> last_login`` in memory and
+    flushes it with ``touch_many`` every ``flush_interval_ms`` or as soon as
+    ``max_batch`` users are dirty. The flush updates that one column, so it
+    can't undo a password or profile change written meanwhile by another
+    worker. Reads see pending logins; ``put`` writes through synchronously.
+    """
+
+    def __init__(self, store, flush_interval_ms=500, max_batch=100):
+        self.store = store
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        self._thread_pid = None
+
+    def _ensure_flusher(self):
+        # Started lazily, and again in a forked worker, which inherits no threads
+        if self._thread_pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._thread_pid == os.getpid():
+                return
+            if self._thread_pid is not None:
+                self._pending = {}
+                self._cond = threading.Condition()
+            self._thread = threading.Thread(target=self._run, name="user-write-behind", daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def get(self, identity, default=None):
+        record = self.store.get(identity)
+        if record is None:
+            return default
+        with self._cond:
+            last_login = self._pending.get(identity)
+        if last_login is not None and last_login > (record.get('last_login') or 0):
+            record['last_login'] = last_login
+        return record
+
+    def __contains__(self, identity):
+        return identity in self.store
+
+    def put(self, identity, record):
+        self.store.put(identity, record)
+
+    def put_many(self, items):
+        self.store.put_many(items)
+
+    def touch_many(self, items):
+        self.store.touch_many(items)
+
+    def touch_deferred(self, identity, last_login):
+        if self._closed:
+            self.store.touch_many([(identity, last_login)])
+            return
+        self._ensure_flusher()
+        with self._cond:
+            self._pending[identity] = max(last_login, self._pending.get(identity, 0))
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def delete(self, identity):
+        with self._cond:
+            self._pending.pop(identity, None)
+        self.store.delete(identity)
+
+    def identities(self):
+        self.flush()
+        return self.store.identities()
+
+    def count(self):
+        self.flush()
+        return self.store.count()
+
+    def items(self):
+        self.flush()
+        return self.store.items()
+
+    def existing(self, identities):
+        return self.store.existing(identities)
+
+    def query(self, **filters):
+        self.flush()
+        return self.store.query(**filters)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.store.touch_many(batch.items())
+            except Exception as e:
+                logger.error(f"Write-behind flush of {len(batch)} users failed: {e}")
+                with self._cond:
+                    for identity, last_login in batch.items():
+                        self._pending[identity] = max(last_login, self._pending.get(identity, 0))
+                return 0
+            logger.debug(f"Write-behind flushed {len(batch)} users")
+            return len(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Flush-on-shutdown hook: drains pending records and stops the flusher."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout=max(self.flush_interval * 4, 5.0))
+        self.flush()
+        self.store.close()
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+# ------------------ MIGRATION ------------------
+def migrate_json_users(json_path, store, batch_size=500):
+    """One-shot copy of a legacy users.json into ``store``. Returns the number of users copied."""
+    marker = f"migrated:{os.path.abspath(json_path)}"
+    if store.get_meta(marker):
+        return 0
+    if not os.path.exists(json_path):
+        return 0
+
+    try:
+        with open(json_path, 'r') as f:
+            legacy = json.load(f)
+    except json.JSONDecodeError:
+        logger.error(f"Corrupted {json_path}, skipping migration")
+        return 0
+
+    items = list(legacy.items())
+    for start in range(0, len(items), batch_size):
+        store.put_many(items[start:start + batch_size])
+    store.set_meta(marker, str(len(items)))
+    logger.info(f"Migrated {len(items)} users from {json_path}")
+    return len(items)
+
+
+def canonicalize_identities(store, canonical, batch_size=500):
+    """One-shot rename of stored identities to ``canonical(identity)``. Returns the number renamed.
+
+    Identities that don't normalize, or whose canonical key is already
+    taken by another user, are left as they are and logged. Backends
+    without ``set_meta`` (JSON) can't record that the migration ran, so it
+    rescans them on every start; once every identity is canonical that scan
+    renames nothing.
+    """
+    marker = "canonical_identities:v1"
+    if store.get_meta(marker):
+        return 0
+
+    renames = []
+    for identity in store.identities():
+        key = canonical(identity)
+        if key is None:
+            logger.warning(f"Stored identity {identity!r} is not a valid email or phone; left as is")
+        elif key != identity:
+            renames.append((identity, key))
+
+    renamed = 0
+    taken = set()
+    for start in range(0, len(renames), batch_size):
+        batch = []
+        for identity, key in renames[start:start + batch_size]:
+            if key in taken or key in store:
+                logger.warning(f"Not renaming {identity!r}: {key!r} already exists")
+                continue
+            taken.add(key)
+            batch.append((identity, key, store.get(identity)))
+        store.rename_many(batch)
+        renamed += len(batch)
+    store.set_meta(marker, str(renamed))
+    if renamed:
+        logger.info(f"Renamed {renamed} user(s) to canonical identities")
+    return renamed
+
+
+def open_user_store(backend, db_path, json_path, write_behind=True,
+                    flush_interval_ms=500, max_batch=100, redis_url=None, canonical=None):
+    if backend == 'json':
+        store = JsonUserStore(json_path)
+    elif backend == 'sqlite':
+        store = SqliteUserStore(db_path)
+        migrate_json_users(json_path, store)
+    elif backend == 'redis':
+        from shared_state import redis_client_from_url
+        store = RedisUserStore(redis_client_from_url(redis_url))
+        migrate_json_users(json_path, store)
+    else:
+        raise ValueError(f"Unknown user store backend: {backend}")
+
+    if canonical is not None:
+        canonicalize_identities(store, canonical)
+
+    if write_behind:
+        store = WriteBehindUserStore(store, flush_interval_ms=flush_interval_ms, max_batch=max_batch)
+    return store
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python user_store.py <users.json> <users.db>")
+        sys.exit(1)
+
+    count = migrate_json_users(sys.argv[1], SqliteUserStore(sys.argv[2]))
+    print(f"Migrated {count} users")
@@ -0,0 +1,120 @@
+import re
+
+# Compiled once at import; the auth routes call these on every request
+EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+E164_DIGITS_RE = re.compile(r'[1-9]\d{7,14}')
+PHONE_SEPARATORS = str.maketrans('', '', ' \t-().')
+
+DEFAULT_COUNTRY_CODE = '91'
+MIN_PASSWORD_LENGTH = 8
+
+MSG_INVALID_EMAIL = "Invalid email format"
+MSG_INVALID_PHONE = "Invalid phone number format"
+
+
+# ------------------ IDENTITIES ------------------
+def normalize_email(email):
+    """Canonical (lowercased) address, or None when it is not a valid email"""
+    email = email.strip().lower()
+    return email if EMAIL_RE.fullmatch(email) else None
+
+
+def normalize_phone(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """E.164 form (``+<country><number>``), or None when it is not a valid phone number.
+
+    ``+`` or ``00`` mark an international number; a bare 10-digit number
+    (optionally with a leading trunk ``0``) is national and gets
+    ``country_code``; 11-15 bare digits are taken to include the country code.
+    """
+    digits = phone.strip().translate(PHONE_SEPARATORS)
+    if digits.startswith('+'):
+        digits = digits[1:]
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = country_code + digits[1:]
+    elif len(digits) == 10:
+        digits = country_code + digits
+    return '+' + digits if E164_DIGITS_RE.fullmatch(digits) else None
+
+
+def validate_email(email):
+    return normalize_email(email) is not None
+
+
+def validate_phone(phone):
+    return normalize_phone(phone) is not None
+
+
+def validate_user_input(email_mobile, country_code=DEFAULT_COUNTRY_CODE):
+    """``('email' | 'phone', canonical identity)``, or ``(None, error message)``"""
+    if '@' in email_mobile:
+        email = normalize_email(email_mobile)
+        return ('email', email) if email else (None, MSG_INVALID_EMAIL)
+    phone = normalize_phone(email_mobile, country_code)
+    return ('phone', phone) if phone else (None, MSG_INVALID_PHONE)
+
+
+def canonical_identity(identity, country_code=DEFAULT_COUNTRY_CODE):
+    """Canonical key for a stored identity, or None when it can't be normalized"""
+    kind, result = validate_user_input(identity, country_code)
+    return result if kind else None
+
+
+# ------------------ PASSWORDS ------------------
+def validate_password(password):
+    """Complexity check in one pass over the password; same rules and messages as before."""
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return False, f"Password must be at least {MIN_PASSWORD_LENGTH} characters long"
+
+    upper = lower = digit = special = False
+    for char in password:
+        if 'A' <= char <= 'Z':
+            upper = True
+        elif 'a' <= char <= 'z':
+            lower = True
+        elif char.isdigit():
+            digit = True
+        elif char == '_' or not char.isalnum():
+            special = True
+        if upper and lower and digit and special:
+            return True, "Valid password"
+
+    if not upper:
+        return False, "Password must contain at least one uppercase letter"
+    if not lower:
+        return False, "Password must contain at least one lowercase letter"
+    if not digit:
+        return False, "Password must contain at least one digit"
+    return False, "Password must contain at least one special character"
+
+
+# ------------------ BULK ------------------
+def iter_validated(values, country_code=DEFAULT_COUNTRY_CODE):
+    """Yield ``(index, kind, canonical_or_error)`` per value; streams, so the list never has to fit in memory"""
+    for index, value in enumerate(values):
+        kind, result = validate_user_input(value, country_code)
+        yield index, kind, result
+
+
+def bulk_validate(values, country_code=DEFAULT_COUNTRY_CODE):
+    """Validate and dedupe a customer list.
+
+    Returns ``(valid, rejected, duplicates)``: ``valid`` maps each canonical
+    identity to its kind in first-seen order, ``rejected`` lists
+    ``(index, value, message)`` and ``duplicates`` counts values that
+    normalized to an identity already seen.
+    """
+    valid = {}
+    rejected = []
+    duplicates = 0
+    check = validate_user_input
+    for index, value in enumerate(values):
+        kind, result = check(value, country_code)
+        if kind is None:
+            rejected.append((index, value, result))
+        elif result in valid:
+            duplicates += 1
+        else:
+            valid[result] = kind
+    return valid, rejected, duplicates
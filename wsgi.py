@@ -0,0 +1,9 @@
+"""Production WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+APP_ENV defaults to production here, so a deploy that forgets it never runs in debug mode.
+"""
+import os
+
+from app import create_app
+
+app = application = create_app(os.environ.get('APP_ENV', 'production'))